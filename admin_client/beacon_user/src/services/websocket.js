@@ -278,6 +278,10 @@ export class PanicAlertsWebSocket {
 
   onLocationUpdate(callback) {
     this.ws.on(this.endpoint, 'location_update', callback);
+    // The server batches fixes into one frame per tick, newest per alert
+    this.ws.on(this.endpoint, 'location_batch', (data) => {
+      data.updates.forEach(callback);
+    });
   }
 
   onActiveAlerts(callback) {
@@ -0,0 +1,114 @@
+"""
+Short-lived per-process cache of the alert facts that WebSocket access checks
+need: the owner and the status.
+
+AlertConsumer, LocationConsumer, ChatConsumer and AlertStreamConsumer all
+decide access from these, so a phone opening its sockets for one alert costs
+one query, and none while the entry is fresh. Entries last
+ALERT_ACCESS_CACHE_SECONDS and are dropped when the alert is saved or deleted
+in this process; status changes broadcast to location groups refresh them in
+the processes holding those sockets.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import NamedTuple
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import PanicAlert
+
+
+class AlertAccess(NamedTuple):
+    owner_id: int
+    status: str
+
+    def allows(self, user):
+        """Staff can follow any alert, users only their own"""
+        return user.is_staff or self.owner_id == user.id
+
+
+class AlertAccessCache:
+    """Bounded LRU of AlertAccess by alert id with a fixed TTL"""
+
+    def __init__(self, ttl, max_entries):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, alert_id):
+        """Get the cached access facts for an alert, or None"""
+        alert_id = str(alert_id)
+        with self._lock:
+            entry = self._entries.get(alert_id)
+            if entry is None:
+                return None
+            access, expires_at = entry
+            if time.monotonic() >= expires_at:
+                del self._entries[alert_id]
+                return None
+            self._entries.move_to_end(alert_id)
+            return access
+
+    def set(self, alert_id, access):
+        with self._lock:
+            self._entries[str(alert_id)] = (access, time.monotonic() + self.ttl)
+            self._entries.move_to_end(str(alert_id))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def update_status(self, alert_id, status):
+        """Record a broadcast status change for a cached alert, keeping its expiry"""
+        with self._lock:
+            entry = self._entries.get(str(alert_id))
+            if entry is not None:
+                access, expires_at = entry
+                self._entries[str(alert_id)] = (access._replace(status=status), expires_at)
+
+    def invalidate(self, alert_id):
+        with self._lock:
+            self._entries.pop(str(alert_id), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+alert_access_cache = AlertAccessCache(settings.ALERT_ACCESS_CACHE_SECONDS, settings.ALERT_ACCESS_CACHE_MAX_ENTRIES)
+
+
+@receiver(post_save, sender=PanicAlert)
+@receiver(post_delete, sender=PanicAlert)
+def invalidate_alert_access(sender, instance, **kwargs):
+    alert_access_cache.invalidate(instance.pk)
+
+
+def load_alert_access(alert_id):
+    """Get an alert's access facts from the cache or the database, or None if there is no such alert"""
+    access = alert_access_cache.get(alert_id)
+    if access is not None:
+        return access
+
+    try:
+        row = PanicAlert.objects.filter(id=alert_id).values_list('user_id', 'status').first()
+    except ValidationError:
+        return None
+    if row is None:
+        return None
+
+    access = AlertAccess(*row)
+    alert_access_cache.set(alert_id, access)
+    return access
+
+
+async def get_alert_access(alert_id):
+    """Async load_alert_access that only hops to a database thread on a cache miss"""
+    access = alert_access_cache.get(alert_id)
+    if access is not None:
+        return access
+    return await database_sync_to_async(load_alert_access)(alert_id)
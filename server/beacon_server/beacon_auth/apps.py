@@ -3,4 +3,8 @@ from django.apps import AppConfig
 
 class BeaconAuthConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'beacon_auth'
\ No newline at end of file
+    name = 'beacon_auth'
+    
+    def ready(self):
+        # Connect the signal receivers that keep caches and sockets in step with the models
+        from . import access, authentication, events  # noqa: F401
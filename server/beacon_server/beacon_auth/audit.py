@@ -0,0 +1,118 @@
+"""
+Background writer for the UserActivity audit log.
+
+``log_activity`` queues a record once the current transaction commits and a
+per-process worker thread stores queued records with ``bulk_create``, at
+most AUDIT_LOG_BATCH_SIZE at a time and no later than
+AUDIT_LOG_FLUSH_SECONDS after the first one arrived. When the queue
+(AUDIT_LOG_QUEUE_SIZE) is full the record is written synchronously instead
+of being dropped, and whatever is queued at interpreter exit is flushed.
+Set AUDIT_LOG_ASYNC=False to write every record inside the request.
+"""
+import atexit
+import logging
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+
+from .models import UserActivity
+
+logger = logging.getLogger(__name__)
+
+# Queue marker asking the worker to store what it has and exit
+_STOP = object()
+
+
+class AuditLogWriter:
+    """Bounded in-process queue of UserActivity records drained by one worker thread"""
+
+    def __init__(self, max_queue, batch_size, flush_interval):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def write(self, activity):
+        """Queue an unsaved UserActivity, writing it now if the queue is full"""
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait(activity)
+        except queue.Full:
+            logger.warning("Audit log queue is full, writing activity synchronously")
+            self._store([activity])
+
+    def close(self, timeout=5):
+        """Store everything queued so far and stop the worker"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None and thread.is_alive():
+            self._queue.put(_STOP)
+            thread.join(timeout)
+
+    def _ensure_worker(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                # Started lazily so forked server workers each get their own thread
+                self._thread = threading.Thread(target=self._run, name='audit-log-writer', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            activity = self._queue.get()
+            if activity is _STOP:
+                break
+
+            batch = [activity]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    activity = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if activity is _STOP:
+                    stopping = True
+                    break
+                batch.append(activity)
+
+            self._store(batch)
+            close_old_connections()
+        connection.close()
+
+    def _store(self, batch):
+        try:
+            UserActivity.objects.bulk_create(batch)
+        except Exception as e:
+            logger.error(f"Error writing {len(batch)} audit log records: {e}")
+
+
+audit_log = AuditLogWriter(
+    max_queue=settings.AUDIT_LOG_QUEUE_SIZE,
+    batch_size=settings.AUDIT_LOG_BATCH_SIZE,
+    flush_interval=settings.AUDIT_LOG_FLUSH_SECONDS
+)
+atexit.register(audit_log.close)
+
+
+def log_activity(user, activity_type, description='', ip_address=None, user_agent=''):
+    """Record a UserActivity, in the background unless AUDIT_LOG_ASYNC is off"""
+    activity = UserActivity(
+        user_id=user.pk,
+        activity_type=activity_type,
+        description=description,
+        ip_address=ip_address,
+        user_agent=user_agent
+    )
+    if not settings.AUDIT_LOG_ASYNC:
+        activity.save()
+        return
+    transaction.on_commit(lambda: audit_log.write(activity))
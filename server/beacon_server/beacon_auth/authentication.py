@@ -0,0 +1,108 @@
+"""
+JWT authentication with a token -> user cache shared by all processes.
+
+Both the REST API (``CachedJWTAuthentication``) and the WebSocket
+``QueryStringJWTAuthMiddleware`` resolve users through ``token_user_cache``,
+which keeps them in Django's cache (shared when CACHES points at Redis, so
+entries survive a server restart) keyed by the token's ``jti``. An entry
+lives until the token expires or JWT_USER_CACHE_SECONDS pass, whichever
+comes first, and stops being used as soon as its user is saved (e.g.
+deactivated) or deleted: each entry records the user's version, which that
+bumps, and both are read together in one cache round trip.
+"""
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.settings import api_settings
+
+
+class TokenUserCache:
+    """Users by token id in Django's cache, valid while their user's version is unchanged"""
+
+    USER_KEY = 'token-user:{}'
+    VERSION_KEY = 'token-user-version:{}'
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+
+    def user_version(self, user_id):
+        """Shared version of a user, bumped by ``invalidate_user``"""
+        return cache.get(self.VERSION_KEY.format(user_id), 0)
+
+    def get(self, token_id, user_id):
+        """Get the cached user of a token id and its user id claim, or None"""
+        keys = self._keys(token_id, user_id)
+        return self._current_user(cache.get_many(keys), *keys)
+
+    async def aget(self, token_id, user_id):
+        """``get`` for async callers, without blocking the event loop on the cache"""
+        keys = self._keys(token_id, user_id)
+        return self._current_user(await cache.aget_many(keys), *keys)
+
+    def set(self, token_id, user, token_expires_at, version):
+        """
+        Cache a user for a token id until the token expires or the TTL passes.
+        ``version`` is the user's version read before loading the user.
+        """
+        timeout = min(token_expires_at - time.time(), self.ttl)
+        if timeout > 0:
+            cache.set(self.USER_KEY.format(token_id), (version, user), timeout)
+
+    def invalidate_user(self, user_id):
+        """Stop using every cached token of a user"""
+        key = self.VERSION_KEY.format(user_id)
+        cache.add(key, 0, timeout=None)
+        cache.incr(key)
+
+    def _keys(self, token_id, user_id):
+        return [self.USER_KEY.format(token_id), self.VERSION_KEY.format(user_id)]
+
+    def _current_user(self, values, user_key, version_key):
+        entry = values.get(user_key)
+        if entry is None:
+            return None
+        version, user = entry
+        return user if version == values.get(version_key, 0) else None
+
+
+token_user_cache = TokenUserCache(settings.JWT_USER_CACHE_SECONDS)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    token_user_cache.invalidate_user(instance.pk)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication that resolves users through token_user_cache"""
+
+    def get_cached_user(self, validated_token):
+        """The cached user for a validated token, or None without touching the database"""
+        token_id = validated_token.get(api_settings.JTI_CLAIM)
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        return token_user_cache.get(token_id, user_id) if token_id else None
+
+    async def aget_cached_user(self, validated_token):
+        """``get_cached_user`` for async callers"""
+        token_id = validated_token.get(api_settings.JTI_CLAIM)
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        return await token_user_cache.aget(token_id, user_id) if token_id else None
+
+    def get_user(self, validated_token):
+        user = self.get_cached_user(validated_token)
+        if user is not None:
+            return user
+
+        token_id = validated_token.get(api_settings.JTI_CLAIM)
+        # Read before loading the user, so a concurrent change is never cached as current
+        version = token_user_cache.user_version(validated_token.get(api_settings.USER_ID_CLAIM))
+        user = super().get_user(validated_token)
+        if token_id:
+            token_user_cache.set(token_id, user, validated_token['exp'], version)
+        return user
@@ -0,0 +1,191 @@
+"""
+Outbound channel-layer broadcasts from synchronous code.
+
+``broadcast_queue.put(group, message)`` queues a group send and returns at
+once, so request handlers never wait on the channel layer. A per-process
+event loop thread drains the queue BROADCAST_BATCH_SIZE messages at a time,
+sending to their groups concurrently (messages for one group keep their
+order) and giving each send BROADCAST_SEND_TIMEOUT seconds.
+
+Messages put with a ``key`` coalesce while they are still queued: a later
+message for the same group and key replaces the queued one, or is combined
+with it by ``merge``. Once BROADCAST_QUEUE_SIZE messages are queued the
+oldest message put as ``droppable`` (location fixes, dashboard stats) is
+dropped to make room. Other messages, such as alert lifecycle events, are
+never dropped and may take the queue past that size. Failed and timed-out
+sends are logged and counted, never raised; see ``stats()``.
+
+The in-memory channel layer only delivers on the loop its consumers run on,
+so with it (development) the queue is drained on the ASGI server's loop,
+found through ``async_to_sync``.
+"""
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from asgiref.sync import async_to_sync
+from channels.layers import InMemoryChannelLayer, get_channel_layer
+from django.conf import settings
+
+from .metrics import latency
+
+logger = logging.getLogger(__name__)
+
+
+async def _running_loop():
+    return asyncio.get_running_loop()
+
+
+def _server_loop():
+    """The ASGI server's event loop if this thread is running sync code for it, else None"""
+    try:
+        # Runs on the server's loop when called from a sync_to_async thread,
+        # otherwise on a temporary loop that is stopped again on return
+        loop = async_to_sync(_running_loop)()
+    except RuntimeError:
+        return None
+    return loop if loop.is_running() else None
+
+
+class _Broadcast:
+    __slots__ = ('group', 'message', 'metric', 'queued_at')
+
+    def __init__(self, group, message, metric, queued_at):
+        self.group = group
+        self.message = message
+        self.metric = metric
+        self.queued_at = queued_at
+
+
+class BroadcastQueue:
+    """Bounded, coalescing queue of group sends drained on an event loop"""
+
+    COUNTERS = ('enqueued', 'coalesced', 'dropped', 'sent', 'timed_out', 'failed')
+
+    def __init__(self, max_size, batch_size, send_timeout):
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.send_timeout = send_timeout
+        self._pending = OrderedDict()
+        # Keys of queued messages that may be dropped, oldest first
+        self._droppable = OrderedDict()
+        self._draining = False
+        self._loop = None
+        self._counts = dict.fromkeys(self.COUNTERS, 0)
+        self._lock = threading.Lock()
+
+    def put(self, group, message, key=None, merge=None, metric=None, droppable=False):
+        """
+        Queue ``group_send(group, message)``. A queued message with the same
+        group and ``key`` is replaced, or combined with ``merge(queued, message)``.
+        With ``metric``, the time until delivery is recorded under that name.
+        A ``droppable`` message may be dropped while the queue is full.
+        """
+        with self._lock:
+            self._counts['enqueued'] += 1
+            entry_key = (group, key) if key is not None else object()
+            queued = self._pending.get(entry_key)
+            if queued is not None:
+                queued.message = merge(queued.message, message) if merge else message
+                self._counts['coalesced'] += 1
+            else:
+                entry = _Broadcast(group, message, metric, time.monotonic())
+                if len(self._pending) >= self.max_size:
+                    if self._droppable:
+                        dropped = self._pending.pop(self._droppable.popitem(last=False)[0])
+                    elif droppable:
+                        dropped, entry = entry, None
+                    else:
+                        dropped = None
+                    if dropped is not None:
+                        self._counts['dropped'] += 1
+                        logger.warning(
+                            f"Broadcast queue is full, dropped {dropped.message.get('type')} for {dropped.group}"
+                        )
+                if entry is not None:
+                    self._pending[entry_key] = entry
+                    if droppable:
+                        self._droppable[entry_key] = None
+            start = not self._draining
+            self._draining = True
+        if start:
+            loop = self._delivery_loop()
+            loop.call_soon_threadsafe(loop.create_task, self._drain())
+
+    def call_later(self, delay, callback):
+        """Run ``callback()`` on the loop that delivers this process's broadcasts after ``delay`` seconds"""
+        loop = self._delivery_loop()
+        loop.call_soon_threadsafe(loop.call_later, delay, callback)
+
+    def stats(self):
+        """Messages currently queued and totals since the process started"""
+        with self._lock:
+            return {'queued': len(self._pending), **self._counts}
+
+    def _delivery_loop(self):
+        if isinstance(get_channel_layer(), InMemoryChannelLayer):
+            try:
+                # Called on the server's loop itself, e.g. from a consumer
+                return asyncio.get_running_loop()
+            except RuntimeError:
+                pass
+            loop = _server_loop()
+            if loop is not None:
+                return loop
+        with self._lock:
+            if self._loop is None:
+                # Started lazily so forked server workers each get their own thread
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name='broadcast-loop', daemon=True).start()
+            return self._loop
+
+    async def _drain(self):
+        try:
+            channel_layer = get_channel_layer()
+            while True:
+                with self._lock:
+                    if not self._pending:
+                        self._draining = False
+                        return
+                    batch = []
+                    for _ in range(min(self.batch_size, len(self._pending))):
+                        entry_key, entry = self._pending.popitem(last=False)
+                        self._droppable.pop(entry_key, None)
+                        batch.append(entry)
+                by_group = {}
+                for entry in batch:
+                    by_group.setdefault(entry.group, []).append(entry)
+                await asyncio.gather(*(self._send_group(channel_layer, entries) for entries in by_group.values()))
+        except Exception as e:
+            logger.error(f"Error draining broadcast queue: {e}")
+            with self._lock:
+                self._draining = False
+
+    async def _send_group(self, channel_layer, entries):
+        for entry in entries:
+            try:
+                await asyncio.wait_for(channel_layer.group_send(entry.group, entry.message), self.send_timeout)
+            except asyncio.TimeoutError:
+                self._count('timed_out')
+                logger.warning(f"Timed out broadcasting {entry.message.get('type')} to {entry.group}")
+                continue
+            except Exception as e:
+                self._count('failed')
+                logger.error(f"Error broadcasting {entry.message.get('type')} to {entry.group}: {e}")
+                continue
+            self._count('sent')
+            if entry.metric:
+                latency.record(entry.metric, time.monotonic() - entry.queued_at)
+
+    def _count(self, name):
+        with self._lock:
+            self._counts[name] += 1
+
+
+broadcast_queue = BroadcastQueue(
+    max_size=settings.BROADCAST_QUEUE_SIZE,
+    batch_size=settings.BROADCAST_BATCH_SIZE,
+    send_timeout=settings.BROADCAST_SEND_TIMEOUT
+)
@@ -1,26 +1,64 @@
+import asyncio
 import json
 import logging
+import time
+from collections import deque
 from datetime import datetime
 from typing import Any, Dict
+from urllib.parse import parse_qs
 
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
+from django.conf import settings
 from django.contrib.auth.models import AnonymousUser
-from django.core.exceptions import ObjectDoesNotExist
+from django.core.exceptions import ObjectDoesNotExist, ValidationError
 from django.utils import timezone
 
-from .models import PanicAlert, AlertLocation, User, UserProfile
+from .models import PanicAlert, AlertLocation
 from .serializers import (
-    PanicAlertListSerializer, AlertLocationSerializer, 
+    PanicAlertListSerializer, AlertLocationSerializer, AlertLocationCreateSerializer,
     UserSerializer, UserProfileSerializer
 )
+from .mapping import (
+    DELTA_GROUP, MAP_DELTA_SUBPROTOCOL, encode_map_frame, get_map_alerts, get_map_changes,
+    get_map_clusters, is_clustered, parse_map_area, parse_version, parse_zoom,
+    viewport_groups
+)
+from .protocol import (
+    BINARY_SUBPROTOCOL, FrameError, decode_location_update
+)
+from .access import alert_access_cache, get_alert_access
+from .broadcast import broadcast_queue
+from .events import alert_event_messages, encode_event, location_messages, send_messages
+from .livestats import DASHBOARD_GROUP, LiveStats
+from .stats import live_dashboard_stats
+from .tracking import (
+    LocationWriteBuffer, build_location, is_redundant_fix, store_locations, touch_alert
+)
 
 logger = logging.getLogger(__name__)
 
+# Shared write-behind buffer for LocationConsumer (used when LOCATION_WRITE_BEHIND is on)
+location_buffer = LocationWriteBuffer(
+    max_fixes=settings.LOCATION_WRITE_BEHIND_MAX_FIXES,
+    flush_interval=settings.LOCATION_WRITE_BEHIND_FLUSH_SECONDS
+)
+
+# Per-process dashboard snapshot kept current by published counter deltas
+dashboard_stats = LiveStats(live_dashboard_stats, settings.DASHBOARD_STATS_RESYNC_SECONDS)
+
+
+def tag_stream(text: str, stream: str) -> str:
+    """Prefix an encoded frame object with its stream name for AlertStreamConsumer"""
+    return f'{{"stream": "{stream}", {text[1:]}'
+
 
 class BaseWebSocketConsumer(AsyncWebsocketConsumer):
     """Base consumer with common WebSocket functionality"""
     
+    # Subprotocols this consumer can negotiate, in order of preference
+    subprotocols = []
+    
     async def connect(self):
         """Handle WebSocket connection"""
         # Check if user is authenticated
@@ -28,14 +66,27 @@ class BaseWebSocketConsumer(AsyncWebsocketConsumer):
             await self.close(code=4001)  # Unauthorized
             return
         
+        # Pick the first supported subprotocol the client offered
+        offered = self.scope.get('subprotocols', [])
+        self.subprotocol = next((p for p in self.subprotocols if p in offered), None)
+        
         # Accept the connection
-        await self.accept()
+        await self.accept(self.subprotocol)
         logger.info(f"WebSocket connected: {self.scope['user'].username}")
     
+    @property
+    def binary_frames(self):
+        """Whether the client negotiated binary location frames"""
+        return getattr(self, 'subprotocol', None) == BINARY_SUBPROTOCOL
+    
     async def disconnect(self, close_code):
         """Handle WebSocket disconnection"""
         logger.info(f"WebSocket disconnected: {close_code}")
     
+    async def forward_event(self, event):
+        """Send a group event's pre-encoded frame as is"""
+        await self.send(text_data=event['text'])
+    
     async def send_error(self, message: str, code: str = "error"):
         """Send error message to client"""
         await self.send(text_data=json.dumps({
@@ -60,6 +111,8 @@ class BaseWebSocketConsumer(AsyncWebsocketConsumer):
 class PanicAlertConsumer(BaseWebSocketConsumer):
     """Consumer for real-time panic alerts (Admin Dashboard)"""
     
+    subprotocols = [BINARY_SUBPROTOCOL]
+    
     async def connect(self):
         # Only allow staff users to connect
         if not self.scope["user"].is_staff:
@@ -109,7 +162,7 @@ class PanicAlertConsumer(BaseWebSocketConsumer):
     def get_active_alerts(self):
         """Get all active panic alerts"""
         alerts = PanicAlert.objects.filter(
-            status__in=['active', 'acknowledged', 'responding']
+            status__in=PanicAlert.ACTIVE_STATUSES
         ).select_related('user', 'assigned_operator').order_by('-created_at')
         return PanicAlertListSerializer(alerts, many=True).data
     
@@ -134,7 +187,7 @@ class PanicAlertConsumer(BaseWebSocketConsumer):
             alert = PanicAlert.objects.get(id=alert_id)
             if alert.status == 'active':
                 alert.acknowledge(self.scope["user"])
-                return PanicAlertListSerializer(alert).data
+                return alert_event_messages('acknowledged', alert, self.scope["user"].username)
         except ObjectDoesNotExist:
             return None
     
@@ -144,14 +197,10 @@ class PanicAlertConsumer(BaseWebSocketConsumer):
             await self.send_error("Alert ID is required")
             return
         
-        alert_data = await self.acknowledge_alert_db(alert_id)
-        if alert_data:
-            # Broadcast update to all admin clients
-            await self.channel_layer.group_send(self.group_name, {
-                'type': 'alert_acknowledged',
-                'alert': alert_data,
-                'operator': self.scope["user"].username
-            })
+        messages = await self.acknowledge_alert_db(alert_id)
+        if messages:
+            # Broadcast update to admin clients, alert watchers, the user and maps
+            await send_messages(self.channel_layer, messages)
             await self.send_success("Alert acknowledged successfully")
         else:
             await self.send_error("Alert not found or cannot be acknowledged")
@@ -163,7 +212,7 @@ class PanicAlertConsumer(BaseWebSocketConsumer):
             alert = PanicAlert.objects.get(id=alert_id)
             if alert.is_active:
                 alert.resolve(notes)
-                return PanicAlertListSerializer(alert).data
+                return alert_event_messages('resolved', alert, self.scope["user"].username)
         except ObjectDoesNotExist:
             return None
     
@@ -173,58 +222,56 @@ class PanicAlertConsumer(BaseWebSocketConsumer):
             await self.send_error("Alert ID is required")
             return
         
-        alert_data = await self.resolve_alert_db(alert_id, notes)
-        if alert_data:
-            # Broadcast update to all admin clients and user
-            await self.channel_layer.group_send(self.group_name, {
-                'type': 'alert_resolved',
-                'alert': alert_data,
-                'operator': self.scope["user"].username
-            })
+        messages = await self.resolve_alert_db(alert_id, notes)
+        if messages:
+            # Broadcast update to admin clients, alert watchers, the user and maps
+            await send_messages(self.channel_layer, messages)
             await self.send_success("Alert resolved successfully")
         else:
             await self.send_error("Alert not found or cannot be resolved")
     
     # Group message handlers
+    # Group events carry a frame encoded once by the sender (see encode_event)
     async def new_panic_alert(self, event):
         """Handle new panic alert broadcast"""
-        await self.send(text_data=json.dumps({
-            'type': 'new_alert',
-            'alert': event['alert'],
-            'timestamp': timezone.now().isoformat()
-        }))
+        await self.forward_event(event)
     
     async def alert_acknowledged(self, event):
         """Handle alert acknowledgment broadcast"""
-        await self.send(text_data=json.dumps({
-            'type': 'alert_acknowledged',
-            'alert': event['alert'],
-            'operator': event['operator'],
-            'timestamp': timezone.now().isoformat()
-        }))
+        await self.forward_event(event)
     
     async def alert_resolved(self, event):
         """Handle alert resolution broadcast"""
-        await self.send(text_data=json.dumps({
-            'type': 'alert_resolved',
-            'alert': event['alert'],
-            'operator': event['operator'],
-            'timestamp': timezone.now().isoformat()
-        }))
+        await self.forward_event(event)
+    
+    async def alert_canceled(self, event):
+        """Handle alert cancellation broadcast"""
+        await self.forward_event(event)
+    
+    async def alert_updated(self, event):
+        """Handle alert update broadcast"""
+        await self.forward_event(event)
     
     async def location_update(self, event):
-        """Handle location update broadcast"""
-        await self.send(text_data=json.dumps({
-            'type': 'location_update',
-            'alert_id': event['alert_id'],
-            'location': event['location'],
-            'timestamp': timezone.now().isoformat()
-        }))
+        """Handle location update broadcast (ADMIN_LOCATION_TICK_SECONDS is 0)"""
+        if self.binary_frames and event.get('frame'):
+            await self.send(bytes_data=event['frame'])
+            return
+        await self.forward_event(event)
+    
+    async def location_batch(self, event):
+        """Handle the fixes held by the sender since its last tick (see events.LocationTicker)"""
+        if self.binary_frames and event.get('frame'):
+            await self.send(bytes_data=event['frame'])
+            return
+        await self.forward_event(event)
 
 
 class AlertConsumer(BaseWebSocketConsumer):
     """Consumer for specific alert updates"""
     
+    subprotocols = [BINARY_SUBPROTOCOL]
+    
     async def connect(self):
         self.alert_id = self.scope['url_route']['kwargs']['alert_id']
         self.group_name = f'alert_{self.alert_id}'
@@ -245,15 +292,10 @@ class AlertConsumer(BaseWebSocketConsumer):
         await self.channel_layer.group_discard(self.group_name, self.channel_name)
         await super().disconnect(close_code)
     
-    @database_sync_to_async
-    def check_alert_access(self):
+    async def check_alert_access(self):
         """Check if user has access to this alert"""
-        try:
-            alert = PanicAlert.objects.get(id=self.alert_id)
-            user = self.scope["user"]
-            return user.is_staff or alert.user == user
-        except ObjectDoesNotExist:
-            return False
+        access = await get_alert_access(self.alert_id)
+        return access is not None and access.allows(self.scope["user"])
     
     @database_sync_to_async
     def get_alert_data(self):
@@ -261,8 +303,6 @@ class AlertConsumer(BaseWebSocketConsumer):
         try:
             alert = PanicAlert.objects.select_related(
                 'user', 'assigned_operator'
-            ).prefetch_related(
-                'location_history', 'media_files'
             ).get(id=self.alert_id)
             return PanicAlertListSerializer(alert).data
         except ObjectDoesNotExist:
@@ -303,19 +343,16 @@ class AlertConsumer(BaseWebSocketConsumer):
             alert = PanicAlert.objects.get(id=self.alert_id, user=self.scope["user"])
             if alert.is_active:
                 alert.cancel()
-                return PanicAlertListSerializer(alert).data
+                return alert_event_messages('cancelled', alert)
         except ObjectDoesNotExist:
             return None
     
     async def cancel_alert(self):
         """Cancel alert (user only)"""
-        alert_data = await self.cancel_alert_db()
-        if alert_data:
-            # Broadcast to admin console
-            await self.channel_layer.group_send('panic_alerts', {
-                'type': 'alert_canceled',
-                'alert': alert_data
-            })
+        messages = await self.cancel_alert_db()
+        if messages:
+            # Broadcast to admin consoles, alert watchers and maps
+            await send_messages(self.channel_layer, messages)
             await self.send_success("Alert canceled successfully")
         else:
             await self.send_error("Alert not found or cannot be canceled")
@@ -323,16 +360,21 @@ class AlertConsumer(BaseWebSocketConsumer):
     # Group message handlers
     async def alert_update(self, event):
         """Handle alert update broadcast"""
-        await self.send(text_data=json.dumps({
-            'type': 'alert_updated',
-            'alert': event['alert'],
-            'timestamp': timezone.now().isoformat()
-        }))
+        await self.forward_event(event)
+    
+    async def location_updated(self, event):
+        """Handle location update broadcast"""
+        if self.binary_frames and event.get('frame'):
+            await self.send(bytes_data=event['frame'])
+            return
+        await self.forward_event(event)
 
 
 class LocationConsumer(BaseWebSocketConsumer):
     """Consumer for real-time location tracking"""
     
+    subprotocols = [BINARY_SUBPROTOCOL]
+    
     async def connect(self):
         self.alert_id = self.scope['url_route']['kwargs']['alert_id']
         self.group_name = f'location_{self.alert_id}'
@@ -350,20 +392,22 @@ class LocationConsumer(BaseWebSocketConsumer):
         await self.send_last_location()
     
     async def disconnect(self, close_code):
+        if settings.LOCATION_WRITE_BEHIND and hasattr(self, 'alert_id'):
+            # Persist whatever is still buffered for this alert
+            await location_buffer.flush(self.alert_id)
         await self.channel_layer.group_discard(self.group_name, self.channel_name)
         await super().disconnect(close_code)
         
     @database_sync_to_async
     def get_last_location(self):
         """Get last known location for this alert"""
-        try:
-            alert = PanicAlert.objects.get(id=self.alert_id)
-            location = AlertLocation.objects.filter(alert=alert).order_by('-timestamp').first()
-            if location:
-                return AlertLocationSerializer(location).data
-            return None
-        except ObjectDoesNotExist:
-            return None
+        # The alert's existence was established by the access check
+        location = AlertLocation.objects.filter(alert_id=self.alert_id).order_by('-timestamp', '-id').first()
+        # Remembered as the baseline for the ingest filter
+        self.last_location = location
+        if location:
+            return AlertLocationSerializer(location).data
+        return None
             
     async def send_last_location(self):
         """Send last known location to client"""
@@ -375,22 +419,42 @@ class LocationConsumer(BaseWebSocketConsumer):
                 'timestamp': timezone.now().isoformat()
             }))
     
-    @database_sync_to_async
-    def check_location_access(self):
+    async def check_location_access(self):
         """Check if user has access to location data"""
-        try:
-            alert = PanicAlert.objects.get(id=self.alert_id)
-            user = self.scope["user"]
-            return user.is_staff or alert.user == user
-        except ObjectDoesNotExist:
+        access = await get_alert_access(self.alert_id)
+        if access is None:
             return False
+        
+        # Cache ownership and status for the lifetime of this connection;
+        # status changes arrive through the alert_status_changed group event
+        self.alert_owner_id = access.owner_id
+        self.alert_status = access.status
+        
+        return access.allows(self.scope["user"])
     
-    async def receive(self, text_data):
+    def can_update_location(self):
+        """Check cached alert state: only the owner of an active alert may send fixes"""
+        return (
+            self.alert_owner_id == self.scope["user"].id and
+            self.alert_status in PanicAlert.ACTIVE_STATUSES
+        )
+    
+    async def receive(self, text_data=None, bytes_data=None):
         """Handle location updates from mobile app"""
         if self.scope["user"].is_staff:
             await self.send_error("Unauthorized: Staff cannot send location updates")
             return
         
+        if bytes_data is not None:
+            # Packed binary fix (beacon.location.v1), not acknowledged individually
+            try:
+                location_data = decode_location_update(bytes_data)
+            except FrameError:
+                await self.send_error("Invalid location frame")
+                return
+            await self.handle_location_update(location_data, acknowledge=False)
+            return
+        
         try:
             data = json.loads(text_data)
             message_type = data.get('type')
@@ -403,69 +467,102 @@ class LocationConsumer(BaseWebSocketConsumer):
         except json.JSONDecodeError:
             await self.send_error("Invalid JSON message")
     
+    def build_location_update(self, location_data):
+        """Validate a location update and build it without touching the database, None if invalid"""
+        # Text updates have always defaulted a missing accuracy to 0
+        serializer = AlertLocationCreateSerializer(data={'accuracy': 0, **location_data})
+        if not serializer.is_valid():
+            return None
+        
+        location = build_location(None, serializer.validated_data)
+        location.alert_id = self.alert_id
+        return location
+    
     @database_sync_to_async
-    def save_location_update(self, location_data):
-        """Save location update to database"""
+    def save_location_update(self, location):
+        """Save location update to database, unless the alert is no longer active"""
         try:
-            alert = PanicAlert.objects.get(id=self.alert_id, user=self.scope["user"])
-            if not alert.is_active:
+            # Ownership was checked against the cached alert state; the write
+            # itself re-checks the status, so no read query is needed here
+            if not store_locations(PanicAlert(id=self.alert_id), [location], require_active=True):
+                self.alert_status = None
                 return None
-            
-            location = AlertLocation.objects.create(
-                alert=alert,
-                latitude=location_data['latitude'],
-                longitude=location_data['longitude'],
-                accuracy=location_data.get('accuracy', 0),
-                altitude=location_data.get('altitude'),
-                speed=location_data.get('speed'),
-                heading=location_data.get('heading'),
-                provider=location_data.get('provider', 'gps'),
-                battery_level=location_data.get('battery_level')
-            )
-            
-            # Update alert's main location
-            alert.latitude = location.latitude
-            alert.longitude = location.longitude
-            alert.location_accuracy = location.accuracy
-            alert.save(update_fields=['latitude', 'longitude', 'location_accuracy'])
-            
-            return AlertLocationSerializer(location).data
-        except (ObjectDoesNotExist, KeyError, ValueError):
+            return location
+        except (ObjectDoesNotExist, KeyError, ValueError, ValidationError):
             return None
     
-    async def handle_location_update(self, location_data):
+    async def handle_location_update(self, location_data, acknowledge=True):
         """Handle incoming location update"""
         if not location_data or 'latitude' not in location_data or 'longitude' not in location_data:
             await self.send_error("Invalid location data")
             return
         
-        location_record = await self.save_location_update(location_data)
-        if location_record:
-            # Broadcast to admin dashboard
-            await self.channel_layer.group_send('panic_alerts', {
-                'type': 'location_update',
-                'alert_id': self.alert_id,
-                'location': location_record
-            })
-            
-            # Broadcast to alert-specific group
-            await self.channel_layer.group_send(f'alert_{self.alert_id}', {
-                'type': 'location_updated',
-                'location': location_record
-            })
-            
-            await self.send_success("Location updated successfully")
+        if not self.can_update_location():
+            await self.send_error("Alert not found or not active")
+            return
+        
+        # Text and decoded binary fixes alike, so nothing unstorable is broadcast or buffered
+        location = self.build_location_update(location_data)
+        if location is None:
+            await self.send_error("Invalid location data")
+            return
+        
+        if self.is_repeated_fix(location):
+            # Neither stored nor broadcast, but the device is still alive
+            await self.refresh_last_seen()
+            if acknowledge:
+                await self.send_success("Location unchanged", {'suppressed': True})
+            return
+        
+        if not settings.LOCATION_WRITE_BEHIND:
+            location = await self.save_location_update(location)
+        
+        if location:
+            previous = getattr(self, 'last_location', None)
+            self.last_location = location
+            await self.broadcast_location(location, previous)
+            if settings.LOCATION_WRITE_BEHIND:
+                # Broadcast right away and let the buffer write the fix later
+                await location_buffer.add(self.alert_id, location)
+            if acknowledge:
+                await self.send_success("Location updated successfully")
+        elif not self.can_update_location():
+            await self.send_error("Alert not found or not active")
         else:
             await self.send_error("Failed to update location")
     
+    def is_repeated_fix(self, location):
+        """Check a fix against the last stored one when the ingest filter is on"""
+        if not settings.LOCATION_INGEST_FILTER:
+            return False
+        return is_redundant_fix(getattr(self, 'last_location', None), location)
+    
+    async def refresh_last_seen(self):
+        """Refresh the alert's last seen time, at most once per LOCATION_FILTER_LAST_SEEN_SECONDS"""
+        now = time.monotonic()
+        if now - getattr(self, 'last_seen_refreshed', 0) < settings.LOCATION_FILTER_LAST_SEEN_SECONDS:
+            return
+        self.last_seen_refreshed = now
+        await database_sync_to_async(touch_alert)(self.alert_id)
+    
+    async def broadcast_location(self, location, previous=None):
+        """Broadcast a location fix to admin dashboards, alert watchers and delta map streams"""
+        # Map changes take their revision from the shared cache and may need the alert record
+        messages = await database_sync_to_async(location_messages)(
+            self.alert_id, location, previous.coords if previous else None
+        )
+        await send_messages(self.channel_layer, messages)
+    
     # Group message handlers
     async def location_updated(self, event):
         """Handle location update broadcast"""
-        await self.send(text_data=json.dumps({
-            'type': 'location_updated',
-            'location': event['location'],
-            'timestamp': timezone.now().isoformat()
-        }))
+        await self.forward_event(event)
+    
+    async def alert_status_changed(self, event):
+        """Handle alert status change, refreshing the cached alert state"""
+        self.alert_status = event['status']
+        alert_access_cache.update_status(self.alert_id, event['status'])
+        await self.forward_event(event)
 
 
 class UserConsumer(BaseWebSocketConsumer):
@@ -490,12 +587,11 @@ class UserConsumer(BaseWebSocketConsumer):
     # Group message handlers
     async def alert_status_update(self, event):
         """Handle alert status update for user"""
-        await self.send(text_data=json.dumps({
-            'type': 'alert_status_update',
-            'alert': event['alert'],
-            'message': event.get('message', ''),
-            'timestamp': timezone.now().isoformat()
-        }))
+        await self.forward_event(event)
+    
+    async def user_notification(self, event):
+        """Handle notification sent to the user"""
+        await self.forward_event(event)
     
     async def operator_message(self, event):
         """Handle message from operator"""
@@ -516,7 +612,10 @@ class AdminDashboardConsumer(BaseWebSocketConsumer):
             await self.close(code=4003)
             return
         
-        self.group_name = 'admin_dashboard'
+        self.group_name = DASHBOARD_GROUP
+        self.stats_version = None
+        self.sent_stats = {}
+        self.stats_flush = None
         await self.channel_layer.group_add(self.group_name, self.channel_name)
         await super().connect()
         
@@ -524,31 +623,25 @@ class AdminDashboardConsumer(BaseWebSocketConsumer):
         await self.send_dashboard_stats()
     
     async def disconnect(self, close_code):
+        if getattr(self, 'stats_flush', None):
+            self.stats_flush.cancel()
         await self.channel_layer.group_discard(self.group_name, self.channel_name)
         await super().disconnect(close_code)
     
     @database_sync_to_async
     def get_dashboard_stats(self):
-        """Get dashboard statistics"""
-        from django.db.models import Count
-        from datetime import date
-        
-        today = timezone.now().date()
-        
-        return {
-            'total_alerts': PanicAlert.objects.count(),
-            'active_alerts': PanicAlert.objects.filter(
-                status__in=['active', 'acknowledged', 'responding']
-            ).count(),
-            'alerts_today': PanicAlert.objects.filter(created_at__date=today).count(),
-            'online_users': UserProfile.objects.filter(is_online=True).count(),
-            'total_users': User.objects.count(),
-        }
+        """Get dashboard statistics, from the process snapshot unless it is stale"""
+        return dashboard_stats.snapshot()
+    
+    @database_sync_to_async
+    def reload_dashboard_stats(self, counted_event):
+        dashboard_stats.load(counted_event)
     
     async def send_dashboard_stats(self):
         """Send dashboard statistics"""
         try:
-            stats = await self.get_dashboard_stats()
+            self.stats_version, stats = await self.get_dashboard_stats()
+            self.sent_stats = stats
             await self.send(text_data=json.dumps({
                 'type': 'dashboard_stats',
                 'stats': stats,
@@ -560,75 +653,160 @@ class AdminDashboardConsumer(BaseWebSocketConsumer):
     
     # Group message handlers
     async def stats_update(self, event):
-        """Handle dashboard stats update"""
-        await self.send(text_data=json.dumps({
-            'type': 'stats_updated',
-            'stats': event['stats'],
-            'timestamp': timezone.now().isoformat()
-        }))
+        """Handle dashboard stats update: a full pre-encoded frame or published counter deltas"""
+        if 'text' in event:
+            await self.forward_event(event)
+            return
+        
+        if dashboard_stats.stale:
+            await self.reload_dashboard_stats(event['event_id'])
+        dashboard_stats.apply(event['event_id'], event['deltas'])
+        self.schedule_stats_flush()
+    
+    def schedule_stats_flush(self):
+        """Send the changed figures after the debounce interval, coalescing the deltas in between"""
+        if self.stats_flush is None or self.stats_flush.done():
+            self.stats_flush = asyncio.ensure_future(self.flush_stats())
+    
+    async def flush_stats(self):
+        await asyncio.sleep(settings.DASHBOARD_STATS_DEBOUNCE_SECONDS)
+        text, self.stats_version, self.sent_stats = dashboard_stats.frame(self.stats_version, self.sent_stats)
+        if text:
+            await self.send(text_data=text)
 
 
 class MapAlertsConsumer(BaseWebSocketConsumer):
     """Consumer for real-time map alerts (Admin Dashboard Map)"""
     
+    # Snapshot-plus-delta stream, see mapping.py
+    subprotocols = [MAP_DELTA_SUBPROTOCOL]
+    
     async def connect(self):
         # Only allow staff users to connect
         if not self.scope["user"].is_staff:
             await self.close(code=4003)  # Forbidden
             return
         
-        # Join the map alerts group
-        self.group_name = 'map_alerts'
-        await self.channel_layer.group_add(self.group_name, self.channel_name)
-        
         await super().connect()
+        self.delta_stream = self.subprotocol == MAP_DELTA_SUBPROTOCOL
+        self.area = None
+        self.zoom = None
+        self.cluster_refresh = None
+        self.groups = set()
+        self.recent_events = deque(maxlen=64)
+        
+        # Optional area (bbox or lat/lng/radius) and zoom level from the query string
+        query = {key: values[0] for key, values in parse_qs(self.scope.get('query_string', b'').decode()).items()}
+        try:
+            self.update_view(query)
+        except ValueError as e:
+            await self.send_error(str(e))
+        
+        # Join the map group before reading the current state so no change is missed
+        await self.set_groups({DELTA_GROUP if self.delta_stream else 'map_alerts'})
         
-        # Send current map alerts
-        await self.send_map_alerts()
+        # Send current map alerts, or only what changed since the client's last version
+        await self.send_map_view(query.get('since'))
         
         # Log connection
         logger.info(f"Admin connected to map alerts: {self.scope['user'].username}")
     
     async def disconnect(self, close_code):
-        # Leave the map alerts group
-        if hasattr(self, 'group_name'):
-            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+        if getattr(self, 'cluster_refresh', None):
+            self.cluster_refresh.cancel()
+        
+        # Leave the map alert groups
+        for group in getattr(self, 'groups', ()):
+            await self.channel_layer.group_discard(group, self.channel_name)
         await super().disconnect(close_code)
     
-    @database_sync_to_async
-    def get_map_alerts(self):
-        """Get all active alerts with location data for map"""
-        alerts = PanicAlert.objects.filter(
-            status__in=['active', 'acknowledged', 'responding'],
-            latitude__isnull=False,
-            longitude__isnull=False
-        ).select_related('user', 'assigned_operator').order_by('-created_at')
+    async def set_groups(self, groups):
+        """Move to a new set of map groups, joining before leaving so no change is missed"""
+        for group in groups - self.groups:
+            await self.channel_layer.group_add(group, self.channel_name)
+        for group in self.groups - groups:
+            await self.channel_layer.group_discard(group, self.channel_name)
+        self.groups = groups
+    
+    async def subscribe_viewport(self, data):
+        """Receive only changes inside a viewport, via its cell groups"""
+        if not self.delta_stream:
+            await self.send_error(f"Viewport subscriptions require the {MAP_DELTA_SUBPROTOCOL} subprotocol")
+            return
         
-        alerts_data = []
-        for alert in alerts:
-            alert_data = {
-                'id': str(alert.id),
-                'user': alert.user.username,
-                'status': alert.status,
-                'alert_type': alert.alert_type,
-                'priority': alert.priority,
-                'latitude': float(alert.latitude),
-                'longitude': float(alert.longitude),
-                'accuracy': alert.location_accuracy,
-                'address': alert.address,
-                'created_at': alert.created_at.isoformat(),
-                'updated_at': alert.updated_at.isoformat(),
-                'assigned_operator': alert.assigned_operator.username if alert.assigned_operator else None,
-                'duration_seconds': (timezone.now() - alert.created_at).total_seconds()
-            }
-            alerts_data.append(alert_data)
-        
-        return alerts_data
+        if 'bbox' not in data and 'radius' not in data:
+            await self.send_error("A viewport bbox is required")
+            return
+        
+        try:
+            self.update_view(data)
+        except ValueError as e:
+            await self.send_error(str(e))
+            return
+        
+        # Viewports spanning too many cells keep the worldwide group
+        await self.set_groups(viewport_groups(self.area) or {DELTA_GROUP})
+        await self.send_map_view()
+    
+    async def unsubscribe_viewport(self):
+        """Go back to worldwide changes"""
+        self.area = None
+        await self.set_groups({DELTA_GROUP})
+        await self.send_map_view()
+    
+    def update_view(self, params):
+        """Update the map area and zoom level from any of those given in the parameters"""
+        area, zoom = self.area, self.zoom
+        if 'bbox' in params or 'radius' in params:
+            area = parse_map_area(params)
+        if 'zoom' in params:
+            zoom = parse_zoom(params)
+        self.area, self.zoom = area, zoom
+    
+    @property
+    def clustered(self):
+        return is_clustered(self.zoom)
+    
+    async def send_map_view(self, since=None):
+        """Send what the client should draw: clusters, a snapshot or delta, or the legacy list"""
+        if self.clustered:
+            await self.send_map_clusters()
+        elif self.delta_stream:
+            await self.resync(since)
+        else:
+            await self.send_map_alerts()
+    
+    async def send_map_clusters(self):
+        """Send grid clusters for the client's zoom level"""
+        try:
+            version = timezone.now()
+            clusters = await database_sync_to_async(get_map_clusters)(self.zoom, self.area)
+            if self.delta_stream:
+                await self.send(text_data=encode_map_frame('map_clusters', version, **clusters))
+            else:
+                await self.send(text_data=json.dumps({
+                    'type': 'map_clusters',
+                    **clusters,
+                    'timestamp': version.isoformat()
+                }))
+        except Exception as e:
+            logger.error(f"Error sending map clusters: {e}")
+            await self.send_error("Failed to fetch map clusters")
+    
+    def schedule_cluster_refresh(self):
+        """Resend clusters after the refresh interval, coalescing the updates in between"""
+        if self.cluster_refresh is None or self.cluster_refresh.done():
+            self.cluster_refresh = asyncio.ensure_future(self.refresh_clusters())
+    
+    async def refresh_clusters(self):
+        await asyncio.sleep(settings.MAP_CLUSTER_REFRESH_SECONDS)
+        if self.clustered:
+            await self.send_map_clusters()
     
     async def send_map_alerts(self):
         """Send map alerts to client"""
         try:
-            alerts_data = await self.get_map_alerts()
+            alerts_data = await database_sync_to_async(get_map_alerts)(self.area)
             await self.send(text_data=json.dumps({
                 'type': 'map_alerts',
                 'alerts': alerts_data,
@@ -639,14 +817,43 @@ class MapAlertsConsumer(BaseWebSocketConsumer):
             logger.error(f"Error sending map alerts: {e}")
             await self.send_error("Failed to fetch map alerts")
     
+    async def resync(self, since=None):
+        """Send the changes since a recent client version, or a full snapshot"""
+        try:
+            version = timezone.now()
+            since = parse_version(since)
+            if since:
+                changes = await database_sync_to_async(get_map_changes)(since, self.area)
+                await self.send(text_data=encode_map_frame('map_delta', version, changes=changes))
+            else:
+                alerts_data = await database_sync_to_async(get_map_alerts)(self.area)
+                await self.send(text_data=encode_map_frame('map_snapshot', version, alerts=alerts_data))
+        except Exception as e:
+            logger.error(f"Error resyncing map alerts: {e}")
+            await self.send_error("Failed to fetch map alerts")
+    
     async def receive(self, text_data):
         """Handle incoming WebSocket messages"""
         try:
             data = json.loads(text_data)
             message_type = data.get('type')
             
-            if message_type == 'get_map_alerts':
-                await self.send_map_alerts()
+            # A request may move the area or zoom level the client is looking at
+            if message_type in ('get_map_alerts', 'resync'):
+                try:
+                    self.update_view(data)
+                except ValueError as e:
+                    await self.send_error(str(e))
+                    return
+            
+            if message_type == 'subscribe_viewport':
+                await self.subscribe_viewport(data)
+            elif message_type == 'unsubscribe_viewport' and self.delta_stream:
+                await self.unsubscribe_viewport()
+            elif message_type == 'get_map_alerts' and not self.delta_stream:
+                await self.send_map_view()
+            elif message_type in ('resync', 'get_map_alerts') and self.delta_stream:
+                await self.send_map_view(data.get('since'))
             else:
                 await self.send_error(f"Unknown message type: {message_type}")
                 
@@ -659,11 +866,35 @@ class MapAlertsConsumer(BaseWebSocketConsumer):
     # Group message handlers
     async def map_alert_update(self, event):
         """Handle map alert update broadcast"""
-        await self.send(text_data=json.dumps({
-            'type': 'alert_update',
-            'alert': event['alert'],
-            'timestamp': event.get('timestamp', timezone.now().isoformat())
-        }))
+        if self.clustered:
+            self.schedule_cluster_refresh()
+            return
+        await self.forward_event(event)
+    
+    async def map_delta(self, event):
+        """Handle map delta broadcast"""
+        # A change between two cells of the viewport arrives once per cell
+        if len(self.groups) > 1:
+            if event['event_id'] in self.recent_events:
+                return
+            self.recent_events.append(event['event_id'])
+        
+        if self.clustered:
+            self.schedule_cluster_refresh()
+            return
+        await self.send(text_data=self.map_delta_text(event))
+    
+    def map_delta_text(self, event):
+        """A move between cells is an add or a removal for viewports holding only one of them"""
+        if DELTA_GROUP in self.groups or 'enter_group' not in event:
+            return event['text']
+        entered = event['enter_group'] in self.groups
+        left = event.get('leave_group') in self.groups
+        if entered and not left:
+            return event['enter_text']
+        if left and not entered:
+            return event['leave_text']
+        return event['text']
 
 
 class ChatConsumer(BaseWebSocketConsumer):
@@ -686,15 +917,10 @@ class ChatConsumer(BaseWebSocketConsumer):
         await self.channel_layer.group_discard(self.group_name, self.channel_name)
         await super().disconnect(close_code)
     
-    @database_sync_to_async
-    def check_chat_access(self):
+    async def check_chat_access(self):
         """Check if user has access to this chat"""
-        try:
-            alert = PanicAlert.objects.get(id=self.alert_id)
-            user = self.scope["user"]
-            return user.is_staff or alert.user == user
-        except ObjectDoesNotExist:
-            return False
+        access = await get_alert_access(self.alert_id)
+        return access is not None and access.allows(self.scope["user"])
     
     async def receive(self, text_data):
         """Handle chat messages"""
@@ -717,75 +943,152 @@ class ChatConsumer(BaseWebSocketConsumer):
             return
         
         # Broadcast message to chat group
-        await self.channel_layer.group_send(self.group_name, {
+        await self.channel_layer.group_send(f'chat_{self.alert_id}', {
             'type': 'chat_message_broadcast',
-            'message': message,
-            'sender': self.scope["user"].username,
-            'sender_id': self.scope["user"].id,
-            'is_staff': self.scope["user"].is_staff,
-            'timestamp': timezone.now().isoformat()
+            'text': encode_event(
+                'chat_message',
+                message=message,
+                sender=self.scope["user"].username,
+                sender_id=self.scope["user"].id,
+                is_staff=self.scope["user"].is_staff
+            )
         })
     
     # Group message handlers
     async def chat_message_broadcast(self, event):
         """Handle chat message broadcast"""
-        await self.send(text_data=json.dumps({
-            'type': 'chat_message',
-            'message': event['message'],
-            'sender': event['sender'],
-            'sender_id': event['sender_id'],
-            'is_staff': event['is_staff'],
-            'timestamp': event['timestamp']
-        }))
+        await self.forward_event(event)
+
+
+class AlertStreamConsumer(LocationConsumer, AlertConsumer, ChatConsumer):
+    """
+    One socket carrying an alert's status, location and chat streams.
+
+    Text frames get a ``stream`` field ("alert", "location" or "chat") and
+    client messages name the stream they are for, e.g.
+    ``{"stream": "chat", "type": "chat_message", "message": "..."}``. Binary
+    location frames (beacon.location.v1) belong to the location stream.
+    """
+
+    subprotocols = [BINARY_SUBPROTOCOL]
+
+    # Stream of the message being handled; tags outgoing text frames
+    stream = None
+
+    async def connect(self):
+        self.alert_id = self.scope['url_route']['kwargs']['alert_id']
+        self.group_names = [f'alert_{self.alert_id}', f'location_{self.alert_id}', f'chat_{self.alert_id}']
+
+        # The three streams share one access rule, so one check covers them
+        has_access = await self.check_location_access()
+        if not has_access:
+            await self.close(code=4003)
+            return
+
+        for group in self.group_names:
+            await self.channel_layer.group_add(group, self.channel_name)
+        await BaseWebSocketConsumer.connect(self)
+
+        await self.in_stream('alert', self.send_alert_status())
+        await self.in_stream('location', self.send_last_location())
+
+    async def disconnect(self, close_code):
+        if settings.LOCATION_WRITE_BEHIND and hasattr(self, 'alert_id'):
+            await location_buffer.flush(self.alert_id)
+        for group in getattr(self, 'group_names', ()):
+            await self.channel_layer.group_discard(group, self.channel_name)
+        await BaseWebSocketConsumer.disconnect(self, close_code)
 
+    async def in_stream(self, stream, handling):
+        """Await a handler coroutine with its text frames tagged for the given stream"""
+        self.stream = stream
+        try:
+            await handling
+        finally:
+            self.stream = None
+
+    async def send(self, text_data=None, bytes_data=None, close=False):
+        if text_data is not None and self.stream:
+            text_data = tag_stream(text_data, self.stream)
+        await super().send(text_data=text_data, bytes_data=bytes_data, close=close)
+
+    async def receive(self, text_data=None, bytes_data=None):
+        """Route a client message to the stream it names"""
+        if bytes_data is not None:
+            await self.in_stream('location', LocationConsumer.receive(self, bytes_data=bytes_data))
+            return
 
-# Utility functions for sending WebSocket messages from views
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
+        try:
+            stream = json.loads(text_data).get('stream')
+        except (json.JSONDecodeError, AttributeError):
+            await self.send_error("Invalid JSON message")
+            return
+
+        if stream == 'alert':
+            await self.in_stream(stream, AlertConsumer.receive(self, text_data))
+        elif stream == 'location':
+            await self.in_stream(stream, LocationConsumer.receive(self, text_data))
+        elif stream == 'chat':
+            await self.in_stream(stream, ChatConsumer.receive(self, text_data))
+        else:
+            await self.send_error(f"Unknown stream: {stream}")
+
+    # Group message handlers
+    async def alert_update(self, event):
+        await self.in_stream('alert', AlertConsumer.alert_update(self, event))
+
+    async def location_updated(self, event):
+        await self.in_stream('location', AlertConsumer.location_updated(self, event))
+
+    async def alert_status_changed(self, event):
+        await self.in_stream('location', LocationConsumer.alert_status_changed(self, event))
+
+    async def chat_message_broadcast(self, event):
+        await self.in_stream('chat', ChatConsumer.chat_message_broadcast(self, event))
+
+
+# Utility functions for sending WebSocket messages from views. The broadcast_*
+# helpers only queue their messages (see broadcast.py) and never block the caller;
+# alert lifecycle and location events are published with events.py.
 
 def broadcast_new_panic_alert(alert_data):
     """Broadcast new panic alert to admin dashboard"""
-    channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)('panic_alerts', {
+    broadcast_queue.put('panic_alerts', {
         'type': 'new_panic_alert',
-        'alert': alert_data
+        'text': encode_event('new_alert', alert=alert_data)
     })
 
 def broadcast_alert_update(alert_id, alert_data):
     """Broadcast alert update to specific alert group"""
-    channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)(f'alert_{alert_id}', {
+    broadcast_queue.put(f'alert_{alert_id}', {
         'type': 'alert_update',
-        'alert': alert_data
-    })
+        'text': encode_event('alert_updated', alert=alert_data)
+    }, key='alert_updated')
 
 def broadcast_dashboard_stats_update(stats):
     """Broadcast dashboard stats update"""
-    channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)('admin_dashboard', {
+    broadcast_queue.put(DASHBOARD_GROUP, {
         'type': 'stats_update',
-        'stats': stats
-    })
+        'text': encode_event('stats_updated', stats=stats)
+    }, key='stats_snapshot', droppable=True)
 
 def send_user_notification(user_id, message, title=None, notification_type='info'):
     """Send notification to a specific user"""
-    channel_layer = get_channel_layer()
     payload = {
-        'type': 'user_notification',
         'message': message,
-        'notification_type': notification_type,
-        'timestamp': timezone.now().isoformat()
+        'notification_type': notification_type
     }
     if title:
         payload['title'] = title
     
-    async_to_sync(channel_layer.group_send)(f'user_{user_id}', payload)
+    broadcast_queue.put(f'user_{user_id}', {
+        'type': 'user_notification',
+        'text': encode_event('user_notification', **payload)
+    })
 
 def broadcast_map_alert_update(alert_data):
     """Broadcast alert update to map channel for all admins"""
-    channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)('map_alerts', {
+    broadcast_queue.put('map_alerts', {
         'type': 'map_alert_update',
-        'alert': alert_data,
-        'timestamp': timezone.now().isoformat()
-    })
+        'text': encode_event('alert_update', alert=alert_data)
+    }, key=('alert_update', alert_data.get('id')))
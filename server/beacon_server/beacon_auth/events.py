@@ -0,0 +1,257 @@
+"""
+Real-time panic alert events shared by the REST views and the consumers.
+
+The ``*_messages`` builders return ``(group, event)`` pairs; views hand them
+to ``publish`` (queued, see broadcast.py) and consumers to ``send_messages``.
+
+A lifecycle event (created, acknowledged, resolved, cancelled, updated)
+reaches:
+
+    panic_alerts    operator consoles     new_alert / alert_acknowledged / alert_resolved /
+                                          alert_canceled / alert_updated
+    alert_<id>      alert watchers        alert_updated
+    user_<id>       the alert's owner     alert_status_update
+    map_alerts      map consoles          alert_update
+
+Every frame carries ``event`` and the serialized ``alert``. Whatever saves
+an alert, a status change also reaches ``location_<id>`` and the delta map
+streams once committed (see ``publish_status_change``), and new location
+fixes go to panic_alerts, alert_<id> and the delta map streams (see
+``map_move_messages``). Fixes for operator consoles are held by
+``location_ticker`` and reach panic_alerts as one ``location_batch`` event
+per ADMIN_LOCATION_TICK_SECONDS; a held fix is sent ahead of any lifecycle
+event of its alert.
+"""
+import json
+import threading
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import transaction
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .broadcast import broadcast_queue
+from .mapping import (
+    DELTA_GROUP, add_change, encode_map_frame, move_change, next_revision, position_groups, remove_change,
+    status_change
+)
+from .models import PanicAlert, alert_status_changed
+from .protocol import encode_location, encode_location_batch
+from .serializers import AlertLocationSerializer, PanicAlertListSerializer
+
+# Lifecycle event -> (panic_alerts group event type, client frame type, owner message)
+ALERT_EVENTS = {
+    'created': ('new_panic_alert', 'new_alert', 'Your alert has been received'),
+    'acknowledged': ('alert_acknowledged', 'alert_acknowledged', 'An operator has acknowledged your alert'),
+    'resolved': ('alert_resolved', 'alert_resolved', 'Your alert has been resolved'),
+    'cancelled': ('alert_canceled', 'alert_canceled', 'Your alert has been cancelled'),
+    'updated': ('alert_updated', 'alert_updated', 'Your alert has been updated'),
+}
+
+
+def encode_event(message_type: str, **fields) -> str:
+    """Encode a client frame once so group handlers can forward it verbatim"""
+    return json.dumps({
+        'type': message_type,
+        **fields,
+        'timestamp': timezone.now().isoformat()
+    })
+
+
+def encode_batch(message_type: str, field: str, texts) -> str:
+    """Encode a client frame listing already encoded frames under ``field``, without decoding them"""
+    return (
+        f'{{"type": {json.dumps(message_type)}, {json.dumps(field)}: [{", ".join(texts)}], '
+        f'"timestamp": {json.dumps(timezone.now().isoformat())}}}'
+    )
+
+
+def map_change_messages(changes, positions=()):
+    """
+    (group, event) pairs sending add/move/update/remove changes to worldwide
+    delta map streams and to viewports containing any of the given
+    (latitude, longitude) positions. Each change takes its alert's next map
+    revision.
+    """
+    for change in changes:
+        change['rev'] = next_revision(change['id'])
+    event = {
+        'type': 'map_delta',
+        'event_id': uuid.uuid4().hex,
+        'text': encode_map_frame('map_delta', changes=changes)
+    }
+    return [(group, event) for group in [DELTA_GROUP, *position_groups(*positions)]]
+
+
+def map_move_messages(alert_id, location, previous_position=None):
+    """
+    (group, event) pairs for an alert's move to a new fix. Worldwide streams
+    and viewports holding both positions get a move; the event also carries
+    an add (full record) for viewports holding only the new cell and a
+    removal for those holding only the old one, picked by each socket.
+    """
+    change = move_change(alert_id, location)
+    change['rev'] = next_revision(alert_id)
+    event = {
+        'type': 'map_delta',
+        'event_id': uuid.uuid4().hex,
+        'text': encode_map_frame('map_delta', changes=[change])
+    }
+    new_groups = position_groups(location.coords)
+    old_groups = position_groups(previous_position)
+    if new_groups != old_groups:
+        alert = PanicAlert.objects.select_related('user', 'assigned_operator').get(pk=alert_id)
+        added = add_change(alert, change['rev'])
+        added.update(latitude=change['latitude'], longitude=change['longitude'], accuracy=change['accuracy'])
+        event['enter_group'], = new_groups
+        event['enter_text'] = encode_map_frame('map_delta', changes=[added])
+        if old_groups:
+            event['leave_group'], = old_groups
+            event['leave_text'] = encode_map_frame('map_delta', changes=[remove_change(alert_id, change['rev'])])
+    return [(group, event) for group in [DELTA_GROUP, *new_groups, *old_groups]]
+
+
+def alert_status_messages(alert_id, alert_status, operator=None, position=None):
+    """(group, event) pairs announcing an alert status change to location and delta map streams"""
+    return [
+        (f'location_{alert_id}', {
+            'type': 'alert_status_changed',
+            'status': alert_status,
+            'text': encode_event('alert_status_changed', alert_id=str(alert_id), status=alert_status)
+        }),
+        *map_change_messages([status_change(alert_id, alert_status, operator)], [position])
+    ]
+
+
+def alert_event_messages(event, alert, operator=None):
+    """
+    (group, event) pairs for a lifecycle event of a saved alert. ``operator``
+    is the username shown to consoles.
+    """
+    group_type, frame_type, owner_message = ALERT_EVENTS[event]
+    alert_data = PanicAlertListSerializer(alert).data
+    fields = {'event': event, 'alert': alert_data}
+    if operator:
+        fields['operator'] = operator
+
+    messages = [
+        *location_ticker.take(alert.id),
+        ('panic_alerts', {'type': group_type, 'text': encode_event(frame_type, **fields)}),
+        (f'alert_{alert.id}', {'type': 'alert_update', 'text': encode_event('alert_updated', **fields)}),
+        (f'user_{alert.user_id}', {
+            'type': 'alert_status_update',
+            'text': encode_event('alert_status_update', message=owner_message, **fields)
+        }),
+        ('map_alerts', {'type': 'map_alert_update', 'text': encode_event('alert_update', **fields)}),
+    ]
+    if event == 'created' and alert.latitude is not None and alert.longitude is not None:
+        messages += map_change_messages([add_change(alert)], [alert.location_coords])
+    return messages
+
+
+@receiver(alert_status_changed, sender=PanicAlert)
+def publish_status_change(sender, alert, **kwargs):
+    """Tell location sockets and delta map streams about a status change once it is committed"""
+    operator = alert.assigned_operator.username if alert.assigned_operator_id else None
+    messages = alert_status_messages(alert.id, alert.status, operator, alert.location_coords)
+    transaction.on_commit(lambda: publish(messages))
+
+
+def location_messages(alert_id, location, previous_position=None):
+    """
+    (group, event) pairs for a new location fix of an alert. The operator
+    console event is handed to ``location_ticker`` instead while it ticks.
+    """
+    # Encode once for JSON and binary subscribers
+    location_record = AlertLocationSerializer(location).data
+    frame = encode_location(alert_id, location)
+    console_event = {
+        'type': 'location_update',
+        'alert_id': str(alert_id),
+        'text': encode_event('location_update', alert_id=str(alert_id), location=location_record),
+        'frame': frame
+    }
+    messages = [
+        (f'alert_{alert_id}', {
+            'type': 'location_updated',
+            'text': encode_event('location_updated', location=location_record),
+            'frame': frame
+        }),
+        *map_move_messages(alert_id, location, previous_position)
+    ]
+    if location_ticker.tick:
+        location_ticker.hold(console_event)
+    else:
+        messages.insert(0, ('panic_alerts', console_event))
+    return messages
+
+
+class LocationTicker:
+    """
+    Per-process holder of the newest panic_alerts location event per alert,
+    sent to the group as one ``location_batch`` event every ``tick`` seconds
+    """
+
+    def __init__(self, tick):
+        self.tick = tick
+        self._pending = OrderedDict()
+        self._scheduled = False
+        self._lock = threading.Lock()
+
+    def hold(self, event):
+        """Hold a location_update event until the next tick, replacing its alert's previous one"""
+        with self._lock:
+            self._pending.pop(event['alert_id'], None)
+            self._pending[event['alert_id']] = event
+            schedule = not self._scheduled
+            self._scheduled = True
+        if schedule:
+            broadcast_queue.call_later(self.tick, self.flush)
+
+    def take(self, alert_id=None):
+        """(group, event) pairs for the held event of one alert, or of all alerts, which are no longer held"""
+        with self._lock:
+            if alert_id is None:
+                events = list(self._pending.values())
+                self._pending.clear()
+                self._scheduled = False
+            else:
+                event = self._pending.pop(str(alert_id), None)
+                events = [event] if event else []
+        if not events:
+            return []
+        return [('panic_alerts', {
+            'type': 'location_batch',
+            'text': encode_batch('location_batch', 'updates', [event['text'] for event in events]),
+            'frame': encode_location_batch([event['frame'] for event in events])
+        })]
+
+    def flush(self):
+        publish(self.take())
+
+
+location_ticker = LocationTicker(settings.ADMIN_LOCATION_TICK_SECONDS)
+
+
+def publish(messages, metric=None, key=None):
+    """
+    Queue (group, event) pairs from synchronous code without waiting for
+    delivery. With ``metric``, the delivery time of the first is recorded.
+    Pairs published with a ``key``, such as location fixes, replace queued
+    ones with the same group and key and may be dropped when the queue is
+    full; lifecycle events are published without one. Map deltas are never
+    replaced, since each holds a revision (and maybe an add or removal) that
+    the next one does not repeat.
+    """
+    for group, event in messages:
+        coalesce = key is not None and event['type'] != 'map_delta'
+        broadcast_queue.put(group, event, key=key if coalesce else None, metric=metric, droppable=key is not None)
+        metric = None
+
+
+async def send_messages(channel_layer, messages):
+    """Send (group, event) pairs from a consumer"""
+    for group, event in messages:
+        await channel_layer.group_send(group, event)
@@ -0,0 +1,294 @@
+"""
+Geographic helpers: distances and track simplification.
+"""
+import heapq
+import math
+
+EARTH_RADIUS_M = 6371008.8
+
+
+def haversine_distance(lat1, lon1, lat2, lon2):
+    """Great-circle distance between two points in metres"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lon2 - lon1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+class _LocalProjection:
+    """Equirectangular projection to metres around a reference point"""
+
+    def __init__(self, lat0, lon0):
+        self.lat0 = lat0
+        self.lon0 = lon0
+        self.kx = math.radians(1) * EARTH_RADIUS_M * math.cos(math.radians(lat0))
+        self.ky = math.radians(1) * EARTH_RADIUS_M
+
+    def __call__(self, lat, lon):
+        return (lon - self.lon0) * self.kx, (lat - self.lat0) * self.ky
+
+
+def _segment_distance(p, a, b):
+    """Distance from point p to segment ab in projected metres"""
+    dx, dy = b[0] - a[0], b[1] - a[1]
+    if dx == 0 and dy == 0:
+        return math.hypot(p[0] - a[0], p[1] - a[1])
+    t = max(0.0, min(1.0, ((p[0] - a[0]) * dx + (p[1] - a[1]) * dy) / (dx * dx + dy * dy)))
+    return math.hypot(p[0] - (a[0] + t * dx), p[1] - (a[1] + t * dy))
+
+
+def _triangle_area(a, b, c):
+    return abs((b[0] - a[0]) * (c[1] - a[1]) - (c[0] - a[0]) * (b[1] - a[1])) / 2
+
+
+def _radial_filter(points, project, tolerance):
+    """
+    Streaming pre-filter: yield ``(xy, point)`` for points at least
+    ``tolerance`` metres from the last kept point. The last point of the track
+    is always yielded.
+    """
+    last_xy = None
+    pending = None
+
+    for point in points:
+        xy = project(float(point[0]), float(point[1]))
+        if last_xy is None or math.hypot(xy[0] - last_xy[0], xy[1] - last_xy[1]) >= tolerance:
+            yield xy, point
+            last_xy = xy
+            pending = None
+        else:
+            pending = (xy, point)
+
+    if pending is not None:
+        yield pending
+
+
+def _douglas_peucker(kept, tolerance):
+    """Ramer-Douglas-Peucker on projected points, iterative to avoid deep recursion"""
+    if len(kept) < 3:
+        return kept
+
+    keep = [False] * len(kept)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(kept) - 1)]
+
+    while stack:
+        start, end = stack.pop()
+        max_distance, index = 0.0, None
+        for i in range(start + 1, end):
+            distance = _segment_distance(kept[i][0], kept[start][0], kept[end][0])
+            if distance > max_distance:
+                max_distance, index = distance, i
+        if index is not None and max_distance > tolerance:
+            keep[index] = True
+            stack.append((start, index))
+            stack.append((index, end))
+
+    return [item for item, flag in zip(kept, keep) if flag]
+
+
+def _visvalingam(kept, max_points):
+    """Visvalingam-Whyatt: repeatedly drop the point with the smallest effective area"""
+    n = len(kept)
+    if n <= max_points or n < 3:
+        return kept
+
+    prev = list(range(-1, n - 1))
+    nxt = list(range(1, n + 1))
+    removed = [False] * n
+    areas = [math.inf] * n
+    heap = []
+
+    for i in range(1, n - 1):
+        areas[i] = _triangle_area(kept[i - 1][0], kept[i][0], kept[i + 1][0])
+        heap.append((areas[i], i))
+    heapq.heapify(heap)
+
+    remaining = n
+    while remaining > max_points and heap:
+        area, i = heapq.heappop(heap)
+        if removed[i] or area != areas[i]:
+            continue
+        removed[i] = True
+        remaining -= 1
+        p, q = prev[i], nxt[i]
+        nxt[p], prev[q] = q, p
+        for j in (p, q):
+            if 0 < j < n - 1:
+                # Never let a neighbour's area drop below the one just removed
+                areas[j] = max(area, _triangle_area(kept[prev[j]][0], kept[j][0], kept[nxt[j]][0]))
+                heapq.heappush(heap, (areas[j], j))
+
+    return [item for item, flag in zip(kept, removed) if not flag]
+
+
+def _bounded_visvalingam(items, max_points):
+    """
+    Visvalingam-Whyatt over a stream, holding at most ``2 * max_points``
+    points: the working buffer is reduced to ``max_points`` whenever it fills.
+    """
+    kept = []
+    for item in items:
+        kept.append(item)
+        if len(kept) >= 2 * max_points:
+            kept = _visvalingam(kept, max_points)
+    return _visvalingam(kept, max_points)
+
+
+def simplify_track(points, tolerance=None, max_points=None):
+    """
+    Simplify an ordered track of ``(latitude, longitude, ...)`` tuples.
+
+    ``points`` may be any iterable, such as a database cursor; it is consumed
+    once. With a ``tolerance`` in metres, points are filtered while streaming
+    and then reduced with Ramer-Douglas-Peucker; with ``max_points`` the result
+    is further reduced with Visvalingam-Whyatt to at most that many points.
+    With ``max_points`` alone, memory stays proportional to ``max_points``
+    however long the track is.
+
+    Returns ``(simplified_points, original_count)``.
+    """
+    iterator = iter(points)
+    first = next(iterator, None)
+    if first is None:
+        return [], 0
+
+    project = _LocalProjection(float(first[0]), float(first[1]))
+    count = 0
+
+    def track():
+        nonlocal count
+        count += 1
+        yield first
+        for point in iterator:
+            count += 1
+            yield point
+
+    kept = _radial_filter(track(), project, tolerance or 0.0)
+    if tolerance:
+        kept = _douglas_peucker(list(kept), tolerance)
+    if max_points:
+        kept = _bounded_visvalingam(kept, max(2, max_points))
+    else:
+        kept = list(kept)
+
+    return [point for _, point in kept], count
+
+
+# ======================== GEOHASH ========================
+
+_GEOHASH_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+# Stored precision: 9 characters is a cell of roughly 5 x 5 metres
+GEOHASH_PRECISION = 9
+
+# Upper bound on the number of prefixes used to cover a query area
+GEOHASH_MAX_CELLS = 32
+
+
+def geohash_encode(latitude, longitude, precision=GEOHASH_PRECISION):
+    """Encode a point as a geohash string"""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    latitude, longitude = float(latitude), float(longitude)
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+
+    while len(chars) < precision:
+        value, bounds = (longitude, lon_range) if even else (latitude, lat_range)
+        mid = (bounds[0] + bounds[1]) / 2
+        bits <<= 1
+        if value >= mid:
+            bits |= 1
+            bounds[0] = mid
+        else:
+            bounds[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_GEOHASH_BASE32[bits])
+            bits = bit_count = 0
+
+    return ''.join(chars)
+
+
+def geohash_cell_size(precision):
+    """Height and width in degrees of a geohash cell at the given precision"""
+    lon_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lon_bits
+
+
+def geohash_precision_for_zoom(zoom):
+    """
+    Geohash precision whose cells are at most half a 256px web map tile wide
+    at the given zoom level, i.e. clusters of roughly 32 to 128 pixels.
+    """
+    target = 360.0 / 2 ** (float(zoom) + 1)
+    for precision in range(1, GEOHASH_PRECISION + 1):
+        if geohash_cell_size(precision)[1] <= target:
+            return precision
+    return GEOHASH_PRECISION
+
+
+def _cover_ranges(south, west, north, east, precision):
+    height, width = geohash_cell_size(precision)
+    rows = range(int((south + 90) // height), int(min(north + 90, 180 - 1e-9) // height) + 1)
+    spans = [(west, east)] if west <= east else [(west, 180.0), (-180.0, east)]
+    columns = [
+        range(int((w + 180) // width), int(min(e + 180, 360 - 1e-9) // width) + 1)
+        for w, e in spans
+    ]
+    return height, width, rows, columns
+
+
+def geohash_cover(south, west, north, east, max_cells=GEOHASH_MAX_CELLS):
+    """
+    Geohash prefixes whose cells cover a bounding box, at the finest precision
+    that needs no more than ``max_cells`` of them. A box with ``west > east``
+    crosses the antimeridian.
+    """
+    best = None
+    for precision in range(1, GEOHASH_PRECISION + 1):
+        height, width, rows, columns = _cover_ranges(south, west, north, east, precision)
+        if len(rows) * sum(len(c) for c in columns) > max_cells:
+            break
+        best = precision
+
+    if best is None:
+        return ['']
+    return geohash_cells(south, west, north, east, best)
+
+
+def geohash_cells(south, west, north, east, precision, max_cells=None):
+    """
+    Geohash cells of one precision covering a bounding box, or None if there
+    would be more than ``max_cells`` of them.
+    """
+    height, width, rows, columns = _cover_ranges(south, west, north, east, precision)
+    if max_cells is not None and len(rows) * sum(len(c) for c in columns) > max_cells:
+        return None
+    return sorted({
+        geohash_encode(-90 + (row + 0.5) * height, -180 + (column + 0.5) * width, precision)
+        for row in rows
+        for span in columns
+        for column in span
+    })
+
+
+def radius_bbox(latitude, longitude, radius):
+    """Bounding box ``(south, west, north, east)`` enclosing a circle of ``radius`` metres"""
+    d_lat = math.degrees(radius / EARTH_RADIUS_M)
+    south, north = max(-90.0, latitude - d_lat), min(90.0, latitude + d_lat)
+    cos_lat = math.cos(math.radians(max(abs(south), abs(north))))
+    if north >= 90 or south <= -90 or cos_lat < 1e-9:
+        return south, -180.0, north, 180.0
+    d_lon = d_lat / cos_lat
+    if d_lon >= 180:
+        return south, -180.0, north, 180.0
+    west = (longitude - d_lon + 180) % 360 - 180
+    east = (longitude + d_lon + 180) % 360 - 180
+    return south, west, north, east
@@ -0,0 +1,148 @@
+"""
+Live admin dashboard counters.
+
+Model changes record counter deltas with ``record_stats_delta``; once their
+transaction commits the deltas are queued for the admin dashboard group as a
+``stats_update`` event, summed with any event still waiting to be sent.
+
+Every process serving dashboard sockets keeps a ``LiveStats`` snapshot that
+is loaded from the database at most once per DASHBOARD_STATS_RESYNC_SECONDS
+(and after midnight, for ``alerts_today``) and otherwise kept current by
+applying those deltas. Dashboards receive:
+
+    dashboard_stats  {stats}            on connect
+    stats_updated    {stats, deltas}    at most every DASHBOARD_STATS_DEBOUNCE_SECONDS
+
+where ``deltas`` is the change since the socket's previous frame.
+
+Changes made with queryset ``update()``/``delete()`` bypass the models and
+are only picked up by the next resync.
+"""
+import json
+import threading
+import time
+import uuid
+from collections import deque
+
+from django.db import transaction
+from django.utils import timezone
+
+from .broadcast import broadcast_queue
+
+DASHBOARD_GROUP = 'admin_dashboard'
+
+
+def merge_stats_deltas(queued, event):
+    """Fold a new stats_update event into one that has not been sent yet"""
+    deltas = dict(queued['deltas'])
+    for name, delta in event['deltas'].items():
+        deltas[name] = deltas.get(name, 0) + delta
+    return {**queued, 'deltas': deltas}
+
+
+def send_stats_delta(deltas):
+    """Queue counter deltas for every dashboard process"""
+    broadcast_queue.put(DASHBOARD_GROUP, {
+        'type': 'stats_update',
+        'event_id': uuid.uuid4().hex,
+        'deltas': deltas
+    }, key='stats_delta', merge=merge_stats_deltas, droppable=True)
+
+
+def record_stats_delta(**deltas):
+    """Publish dashboard counter deltas once the current transaction commits"""
+    deltas = {name: delta for name, delta in deltas.items() if delta}
+    if deltas:
+        transaction.on_commit(lambda: send_stats_delta(deltas))
+
+
+class LiveStats:
+    """
+    In-memory dashboard snapshot for one process, loaded with ``loader`` and
+    kept current with published deltas.
+
+    Each change replaces the snapshot dict and bumps ``version``, so sockets
+    can keep the snapshot they last sent and get a frame with the difference.
+    """
+
+    # Delta events remembered per process so each is applied once, whichever socket receives it
+    MAX_EVENTS = 256
+
+    def __init__(self, loader, resync_interval):
+        self.loader = loader
+        self.resync_interval = resync_interval
+        self.version = 0
+        self._stats = None
+        self._loaded_at = 0
+        self._loaded_day = None
+        self._events = deque(maxlen=self.MAX_EVENTS)
+        self._frames = {}
+        self._lock = threading.Lock()
+
+    @property
+    def stale(self):
+        """Whether the snapshot must be reloaded before it is used"""
+        return (
+            self._stats is None
+            or time.monotonic() - self._loaded_at >= self.resync_interval
+            or timezone.localdate() != self._loaded_day
+        )
+
+    def load(self, counted_event=None):
+        """
+        Reload the snapshot from the database (blocking). ``counted_event`` is
+        a received delta event whose changes the reloaded figures already include.
+        """
+        stats = self.loader()
+        with self._lock:
+            self._replace(stats)
+            self._loaded_at = time.monotonic()
+            self._loaded_day = timezone.localdate()
+            if counted_event:
+                self._events.append(counted_event)
+
+    def snapshot(self):
+        """Current ``(version, stats)``, reloading first if stale (blocking)"""
+        if self.stale:
+            self.load()
+        return self.version, self._stats
+
+    def apply(self, event_id, deltas):
+        """Apply a published delta unless this process already has"""
+        with self._lock:
+            if event_id in self._events:
+                return
+            self._events.append(event_id)
+            self._replace({name: value + deltas.get(name, 0) for name, value in self._stats.items()})
+
+    def frame(self, since_version, since_stats):
+        """
+        Encode a ``stats_updated`` frame for a socket that last sent
+        ``since_stats`` at ``since_version``. Returns ``(text, version, stats)``
+        with text None if nothing changed; sockets at the same version share
+        one encoding.
+        """
+        with self._lock:
+            version, stats = self.version, self._stats
+            if since_version == version:
+                return None, version, stats
+            text = self._frames.get(since_version)
+            if text is None:
+                deltas = {
+                    name: value - since_stats.get(name, 0)
+                    for name, value in stats.items()
+                    if value != since_stats.get(name, 0)
+                }
+                text = json.dumps({
+                    'type': 'stats_updated',
+                    'stats': stats,
+                    'deltas': deltas,
+                    'timestamp': timezone.now().isoformat()
+                })
+                self._frames[since_version] = text
+            return text, version, stats
+
+    def _replace(self, stats):
+        self._stats = stats
+        self.version += 1
+        self._frames = {}
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from beacon_auth.models import PanicAlert
+
+
+class Command(BaseCommand):
+    help = 'Recompute the denormalised location, media and notification counters on panic alerts'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'alert_ids', nargs='*',
+            help='Only rebuild these alerts (default: all alerts)'
+        )
+
+    def handle(self, *args, **options):
+        alerts = PanicAlert.objects.all()
+        if options['alert_ids']:
+            alerts = alerts.filter(id__in=options['alert_ids'])
+
+        updated = alerts.rebuild_counters()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt counters for {updated} alerts'))
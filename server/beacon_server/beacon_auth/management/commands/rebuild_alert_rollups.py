@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from beacon_auth.models import AlertHourlyRollup
+
+
+class Command(BaseCommand):
+    help = 'Recompute the hourly alert rollups used by the alert statistics from the alert table'
+
+    def handle(self, *args, **options):
+        buckets = AlertHourlyRollup.objects.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {buckets} hourly alert rollup buckets'))
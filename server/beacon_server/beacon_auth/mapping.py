@@ -0,0 +1,350 @@
+"""
+Map stream records and deltas for MapAlertsConsumer.
+
+Clients opt in to the delta stream by offering the ``beacon.map.v2``
+WebSocket subprotocol on ``ws/map/alerts/``; without it the consumer keeps
+sending full ``map_alerts`` lists and ``alert_update`` messages.
+
+Server -> client frames:
+    map_snapshot  {version, alerts: [record, ...]}
+    map_delta     {version, changes: [change, ...]}
+
+Changes:
+    add     full record (also used to upsert an alert during resync)
+    move    id, latitude, longitude, accuracy
+    update  id and the changed fields
+    remove  id
+
+Every record and change carries ``rev``, the alert's map revision. Senders
+take the next revision from a counter in the shared cache for each change,
+so a change lost on the way (dropped by a full broadcast queue or channel
+layer) leaves a gap. A client applies a change whose ``rev`` is at most one
+above the revision it holds for that alert (changes are absolute, so a
+repeat is harmless) and ignores older ones; on a larger jump, a revision it
+cannot place, or a reconnect it sends ``{"type": "resync", "since":
+<version>}`` (or connects with ``?since=<version>``), ``version`` being the
+server time of the last frame it applied. It then receives the alerts
+changed since then, or a fresh snapshot when ``since`` is older than
+MAP_RESYNC_WINDOW_SECONDS.
+
+Map queries (``GET alerts/map/``, the consumer's query string and its
+``get_map_alerts``/``resync`` messages) can be limited to an area with either
+``bbox=<south>,<west>,<north>,<east>`` or ``lat``, ``lng`` and ``radius`` in
+metres. Areas are matched on the indexed geohash prefix first.
+
+With a ``zoom`` below MAP_CLUSTER_MAX_ZOOM the same queries return grid
+clusters instead (``map_clusters``): one entry per geohash cell with its alert
+count, highest priority and mean position. Clustered sockets receive a fresh
+``map_clusters`` frame, at most every MAP_CLUSTER_REFRESH_SECONDS, instead of
+per-alert updates.
+
+Delta-stream clients can send ``{"type": "subscribe_viewport", "bbox": ...}``
+(optionally with ``zoom``) to receive only changes whose old or new position
+lies in cells of their viewport, and ``unsubscribe_viewport`` to go back to
+worldwide updates. Each subscription answers with a fresh view of the area.
+"""
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Avg, Count, Max, Q
+from django.db.models.functions import Substr
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .geo import (
+    geohash_cells, geohash_cover, geohash_encode, geohash_precision_for_zoom, haversine_distance,
+    radius_bbox
+)
+from .models import PanicAlert
+
+MAP_DELTA_SUBPROTOCOL = 'beacon.map.v2'
+
+# Group for delta-stream clients; legacy clients stay in 'map_alerts'
+DELTA_GROUP = 'map_alert_deltas'
+
+# Per-cell groups for delta-stream clients with a viewport
+CELL_GROUP_PREFIX = 'map_cell_'
+
+# Shared cache counter of an alert's map revision
+REVISION_KEY = 'map-revision:{}'
+
+
+def next_revision(alert_id):
+    """Take the next map revision of an alert, counted in the cache shared by every process"""
+    key = REVISION_KEY.format(alert_id)
+    cache.add(key, 0, timeout=None)
+    return cache.incr(key)
+
+
+def current_revisions(alert_ids):
+    """Current map revision of each alert id, 0 for alerts that never changed"""
+    keys = {REVISION_KEY.format(alert_id): str(alert_id) for alert_id in alert_ids}
+    revisions = dict.fromkeys(keys.values(), 0)
+    for key, revision in cache.get_many(keys).items():
+        revisions[keys[key]] = revision
+    return revisions
+
+
+def map_alert_data(alert, rev=0):
+    """Build the map record for an alert"""
+    return {
+        'id': str(alert.id),
+        'rev': rev,
+        'user': alert.user.username,
+        'status': alert.status,
+        'alert_type': alert.alert_type,
+        'priority': alert.priority,
+        'latitude': float(alert.latitude),
+        'longitude': float(alert.longitude),
+        'accuracy': alert.location_accuracy,
+        'address': alert.address,
+        'created_at': alert.created_at.isoformat(),
+        'updated_at': alert.updated_at.isoformat(),
+        'assigned_operator': alert.assigned_operator.username if alert.assigned_operator else None,
+        'duration_seconds': (timezone.now() - alert.created_at).total_seconds()
+    }
+
+
+class MapArea:
+    """A bounding box, optionally the enclosure of a radius around a centre point"""
+
+    def __init__(self, south, west, north, east, center=None, radius=None):
+        self.south, self.west, self.north, self.east = south, west, north, east
+        self.center = center
+        self.radius = radius
+
+    def filter(self, queryset):
+        """Limit an alert queryset to the box, using geohash prefixes before the exact bounds"""
+        prefixes = Q()
+        for prefix in geohash_cover(self.south, self.west, self.north, self.east):
+            prefixes |= Q(geohash__startswith=prefix)
+
+        if self.west <= self.east:
+            longitude = Q(longitude__gte=self.west, longitude__lte=self.east)
+        else:
+            longitude = Q(longitude__gte=self.west) | Q(longitude__lte=self.east)
+
+        return queryset.filter(prefixes).filter(
+            longitude, latitude__gte=self.south, latitude__lte=self.north
+        )
+
+    def contains(self, latitude, longitude):
+        """Whether a point lies in the area"""
+        latitude, longitude = float(latitude), float(longitude)
+        if self.radius is not None:
+            return haversine_distance(self.center[0], self.center[1], latitude, longitude) <= self.radius
+        if not self.south <= latitude <= self.north:
+            return False
+        if self.west <= self.east:
+            return self.west <= longitude <= self.east
+        return longitude >= self.west or longitude <= self.east
+
+
+def parse_map_area(params):
+    """
+    Build a MapArea from ``bbox`` or ``lat``/``lng``/``radius`` parameters.
+    Returns None when no area is given; raises ValueError for invalid values.
+    """
+    if params.get('bbox'):
+        try:
+            bbox = params['bbox']
+            if not isinstance(bbox, (list, tuple)):
+                bbox = str(bbox).split(',')
+            south, west, north, east = (float(value) for value in bbox)
+        except (TypeError, ValueError):
+            raise ValueError('bbox must be south,west,north,east')
+        if not (-90 <= south <= north <= 90 and -180 <= west <= 180 and -180 <= east <= 180):
+            raise ValueError('bbox is out of range')
+        return MapArea(south, west, north, east)
+
+    if params.get('radius'):
+        try:
+            latitude, longitude = float(params['lat']), float(params['lng'])
+            radius = float(params['radius'])
+        except (KeyError, TypeError, ValueError):
+            raise ValueError('radius requires numeric lat, lng and radius')
+        if not (-90 <= latitude <= 90 and -180 <= longitude <= 180 and radius > 0):
+            raise ValueError('lat, lng or radius is out of range')
+        return MapArea(*radius_bbox(latitude, longitude, radius), center=(latitude, longitude), radius=radius)
+
+    return None
+
+
+def parse_zoom(params):
+    """Get the map zoom level from parameters, or None; raises ValueError for invalid values"""
+    zoom = params.get('zoom')
+    if zoom is None or zoom == '':
+        return None
+    try:
+        zoom = float(zoom)
+    except (TypeError, ValueError):
+        raise ValueError('zoom must be a number')
+    if not 0 <= zoom <= 24:
+        raise ValueError('zoom is out of range')
+    return zoom
+
+
+def is_clustered(zoom):
+    """Whether a map at this zoom level gets clusters instead of individual alerts"""
+    return zoom is not None and zoom < settings.MAP_CLUSTER_MAX_ZOOM
+
+
+def get_map_clusters(zoom, area=None):
+    """
+    Group active alerts into geohash cells sized for the zoom level. Radius
+    areas are clustered over their enclosing box.
+    """
+    precision = geohash_precision_for_zoom(zoom)
+    alerts = PanicAlert.objects.filter(
+        status__in=PanicAlert.ACTIVE_STATUSES,
+        latitude__isnull=False,
+        longitude__isnull=False
+    )
+    if area is not None:
+        alerts = area.filter(alerts)
+
+    cells = alerts.annotate(cell=Substr('geohash', 1, precision)).values('cell').annotate(
+        count=Count('id'),
+        max_priority=Max('priority'),
+        center_latitude=Avg('latitude'),
+        center_longitude=Avg('longitude')
+    ).order_by('-count', 'cell')
+
+    clusters = [
+        {
+            'geohash': cell['cell'],
+            'count': cell['count'],
+            'max_priority': cell['max_priority'],
+            'latitude': float(cell['center_latitude']),
+            'longitude': float(cell['center_longitude'])
+        }
+        for cell in cells
+    ]
+    return {
+        'zoom': zoom,
+        'precision': precision,
+        'clusters': clusters,
+        'count': sum(cluster['count'] for cluster in clusters)
+    }
+
+
+def viewport_groups(area):
+    """Cell groups covering an area, or None when it spans too many cells"""
+    cells = geohash_cells(
+        area.south, area.west, area.north, area.east,
+        settings.MAP_VIEWPORT_CELL_PRECISION, settings.MAP_VIEWPORT_MAX_CELLS
+    )
+    if cells is None:
+        return None
+    return {CELL_GROUP_PREFIX + cell for cell in cells}
+
+
+def position_groups(*positions):
+    """Cell groups containing the given ``(latitude, longitude)`` positions, skipping None"""
+    return {
+        CELL_GROUP_PREFIX + geohash_encode(latitude, longitude, settings.MAP_VIEWPORT_CELL_PRECISION)
+        for latitude, longitude in filter(None, positions)
+    }
+
+
+def is_on_map(alert):
+    """Whether an alert belongs on the map"""
+    return alert.is_active and alert.latitude is not None and alert.longitude is not None
+
+
+def _in_area(queryset, area):
+    """Apply an optional area; radius areas are refined to the exact circle"""
+    if area is None:
+        return list(queryset)
+    alerts = area.filter(queryset)
+    if area.radius is None:
+        return list(alerts)
+    return [alert for alert in alerts if area.contains(alert.latitude, alert.longitude)]
+
+
+def get_map_alerts(area=None):
+    """Get map records for all active alerts with location data, optionally within an area"""
+    alerts = PanicAlert.objects.filter(
+        status__in=PanicAlert.ACTIVE_STATUSES,
+        latitude__isnull=False,
+        longitude__isnull=False
+    ).select_related('user', 'assigned_operator').order_by('-created_at')
+    alerts = _in_area(alerts, area)
+    # Read after the rows: a revision newer than its record is repaired by the repeated change
+    revisions = current_revisions(alert.id for alert in alerts)
+    return [map_alert_data(alert, revisions[str(alert.id)]) for alert in alerts]
+
+
+def get_map_changes(since, area=None):
+    """
+    Get changes for every alert modified after ``since``: an add for alerts on
+    the map (and in the area, if given), otherwise a remove.
+    """
+    alerts = list(PanicAlert.objects.filter(updated_at__gt=since).select_related(
+        'user', 'assigned_operator'
+    ).order_by('updated_at'))
+    revisions = current_revisions(alert.id for alert in alerts)
+    return [
+        add_change(alert, revisions[str(alert.id)])
+        if is_on_map(alert) and (area is None or area.contains(alert.latitude, alert.longitude))
+        else remove_change(alert.id, revisions[str(alert.id)])
+        for alert in alerts
+    ]
+
+
+def parse_version(value):
+    """
+    Parse a client-supplied version to resync from, returning None if it is
+    missing, invalid, in the future or older than MAP_RESYNC_WINDOW_SECONDS
+    """
+    if not value:
+        return None
+    try:
+        version = parse_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if version is None or timezone.is_naive(version):
+        return None
+    now = timezone.now()
+    if not now - timedelta(seconds=settings.MAP_RESYNC_WINDOW_SECONDS) <= version <= now:
+        return None
+    return version
+
+
+def add_change(alert, rev=0):
+    return {'op': 'add', **map_alert_data(alert, rev)}
+
+
+def move_change(alert_id, location):
+    return {
+        'op': 'move',
+        'id': str(alert_id),
+        'latitude': float(location.latitude),
+        'longitude': float(location.longitude),
+        'accuracy': location.accuracy
+    }
+
+
+def status_change(alert_id, alert_status, operator=None):
+    """Build the change for a status transition: an update, or a removal once inactive"""
+    if alert_status not in PanicAlert.ACTIVE_STATUSES:
+        return remove_change(alert_id)
+    change = {'op': 'update', 'id': str(alert_id), 'status': alert_status}
+    if operator:
+        change['assigned_operator'] = operator
+    return change
+
+
+def remove_change(alert_id, rev=0):
+    return {'op': 'remove', 'id': str(alert_id), 'rev': rev}
+
+
+def encode_map_frame(message_type, version=None, **fields):
+    """Encode a map frame"""
+    return json.dumps({
+        'type': message_type,
+        'version': (version or timezone.now()).isoformat(),
+        **fields
+    })
@@ -0,0 +1,57 @@
+"""
+In-process latency samples for the paths behind our response-time SLOs.
+
+Each metric keeps its most recent LATENCY_SAMPLE_SIZE samples; summaries
+(count, p50/p90/p99 and max in milliseconds) describe this process only.
+"""
+import math
+import threading
+from collections import deque
+
+from django.conf import settings
+
+
+class LatencyRecorder:
+    """Bounded per-metric sample windows with percentile summaries"""
+
+    def __init__(self, sample_size):
+        self.sample_size = sample_size
+        self._samples = {}
+        self._totals = {}
+        self._lock = threading.Lock()
+
+    def record(self, metric, seconds):
+        with self._lock:
+            samples = self._samples.get(metric)
+            if samples is None:
+                samples = self._samples[metric] = deque(maxlen=self.sample_size)
+            samples.append(seconds * 1000)
+            self._totals[metric] = self._totals.get(metric, 0) + 1
+
+    def summary(self, metric):
+        """Nearest-rank percentiles over the sample window, or None without samples"""
+        with self._lock:
+            samples = sorted(self._samples.get(metric, ()))
+            total = self._totals.get(metric, 0)
+        if not samples:
+            return None
+
+        def percentile(p):
+            return round(samples[max(1, math.ceil(p / 100 * len(samples))) - 1], 3)
+
+        return {
+            'count': total,
+            'window': len(samples),
+            'p50_ms': percentile(50),
+            'p90_ms': percentile(90),
+            'p99_ms': percentile(99),
+            'max_ms': round(samples[-1], 3)
+        }
+
+    def summaries(self):
+        with self._lock:
+            metrics = list(self._samples)
+        return {metric: self.summary(metric) for metric in sorted(metrics)}
+
+
+latency = LatencyRecorder(settings.LATENCY_SAMPLE_SIZE)
@@ -1,24 +1,17 @@
 from urllib.parse import parse_qs
 from django.contrib.auth.models import AnonymousUser
 from channels.db import database_sync_to_async
-from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from .authentication import CachedJWTAuthentication
 
 
 class QueryStringJWTAuthMiddleware:
   def __init__(self, inner):
     self.inner = inner
 
-  def __call__(self, scope):
-    return QueryStringJWTAuthMiddlewareInstance(scope, self.inner)
-
-
-class QueryStringJWTAuthMiddlewareInstance:
-  def __init__(self, scope, inner):
-    self.scope = dict(scope)
-    self.inner = inner
-
-  async def __call__(self, receive, send):
-    query_string = self.scope.get('query_string', b'').decode()
+  async def __call__(self, scope, receive, send):
+    scope = dict(scope)
+    query_string = scope.get('query_string', b'').decode()
     query_params = parse_qs(query_string)
     token_list = query_params.get('token', [])
     user = AnonymousUser()
@@ -27,18 +20,27 @@ class QueryStringJWTAuthMiddlewareInstance:
       token = token_list[0]
       user = await get_user_for_token(token)
 
-    self.scope['user'] = user
-    inner = self.inner(self.scope)
-    return await inner(receive, send)
+    scope['user'] = user
+    return await self.inner(scope, receive, send)
 
 
-@database_sync_to_async
-def get_user_for_token(token: str):
-  authenticator = JWTAuthentication()
+async def get_user_for_token(token: str):
+  authenticator = CachedJWTAuthentication()
   try:
+    # Signature and expiry checks need no database; only cache misses do
     validated = authenticator.get_validated_token(token)
-    return authenticator.get_user(validated)
   except Exception:
     return AnonymousUser()
 
+  user = await authenticator.aget_cached_user(validated)
+  if user is not None:
+    return user
+  return await load_user_for_token(authenticator, validated)
 
+
+@database_sync_to_async
+def load_user_for_token(authenticator, validated):
+  try:
+    return authenticator.get_user(validated)
+  except Exception:
+    return AnonymousUser()
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-17 01:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('beacon_auth', '0003_alertlocation_timestamp_default'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='panicalert',
+            name='last_seen_at',
+            field=models.DateTimeField(blank=True, help_text='Last time the device reported in', null=True),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.7 on 2026-10-17 01:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('beacon_auth', '0004_panicalert_last_seen_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['created_at', 'id'], name='beacon_auth_created_4ed820_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='panicalert',
+            index=models.Index(fields=['created_at', 'id'], name='beacon_auth_created_a8d6d0_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='useractivity',
+            index=models.Index(fields=['created_at', 'id'], name='beacon_auth_created_ebc4cc_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='useractivity',
+            index=models.Index(fields=['user', 'created_at'], name='beacon_auth_user_id_fb66a4_idx'),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 4.2.7 on 2026-10-17 01:32
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_counters(apps, schema_editor):
+    PanicAlert = apps.get_model('beacon_auth', 'PanicAlert')
+
+    def child_count(model_name):
+        model = apps.get_model('beacon_auth', model_name)
+        counts = model.objects.filter(alert=OuterRef('pk')).order_by().values('alert').annotate(
+            count=Count('*')
+        ).values('count')
+        return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+    AlertLocation = apps.get_model('beacon_auth', 'AlertLocation')
+    latest_fix = AlertLocation.objects.filter(alert=OuterRef('pk')).order_by('-timestamp').values('timestamp')[:1]
+    PanicAlert.objects.update(
+        location_count=child_count('AlertLocation'),
+        media_count=child_count('AlertMedia'),
+        notification_count=child_count('AlertNotification'),
+        last_location_at=Subquery(latest_fix)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('beacon_auth', '0005_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='panicalert',
+            name='last_location_at',
+            field=models.DateTimeField(blank=True, editable=False, help_text='Time of the newest stored fix', null=True),
+        ),
+        migrations.AddField(
+            model_name='panicalert',
+            name='location_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='panicalert',
+            name='media_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='panicalert',
+            name='notification_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
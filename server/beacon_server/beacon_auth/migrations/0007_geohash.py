@@ -0,0 +1,43 @@
+# Generated by Django 4.2.7 on 2026-10-17 01:36
+
+from django.db import migrations, models
+
+from beacon_auth.geo import geohash_encode
+
+
+def backfill_geohashes(apps, schema_editor):
+    for model_name in ('PanicAlert', 'AlertLocation'):
+        model = apps.get_model('beacon_auth', model_name)
+        rows = model.objects.filter(latitude__isnull=False, longitude__isnull=False).only(
+            'pk', 'latitude', 'longitude'
+        )
+        batch = []
+        for row in rows.iterator(chunk_size=2000):
+            row.geohash = geohash_encode(row.latitude, row.longitude)
+            batch.append(row)
+            if len(batch) >= 2000:
+                model.objects.bulk_update(batch, ['geohash'])
+                batch = []
+        if batch:
+            model.objects.bulk_update(batch, ['geohash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('beacon_auth', '0006_panicalert_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='alertlocation',
+            name='geohash',
+            field=models.CharField(blank=True, help_text='Geohash of the fix', max_length=12),
+        ),
+        migrations.AddField(
+            model_name='panicalert',
+            name='geohash',
+            field=models.CharField(blank=True, db_index=True, help_text='Geohash of the current position', max_length=12),
+        ),
+        migrations.RunPython(backfill_geohashes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 4.2.7 on 2026-10-17 01:46
+
+from datetime import timezone
+
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncHour
+
+
+def backfill_rollups(apps, schema_editor):
+    PanicAlert = apps.get_model('beacon_auth', 'PanicAlert')
+    AlertHourlyRollup = apps.get_model('beacon_auth', 'AlertHourlyRollup')
+
+    buckets = PanicAlert.objects.order_by().annotate(hour=TruncHour('created_at', tzinfo=timezone.utc)).values(
+        'hour', 'alert_type', 'priority', 'status'
+    ).annotate(total=Count('id'))
+    AlertHourlyRollup.objects.bulk_create(
+        [AlertHourlyRollup(count=bucket.pop('total'), **bucket) for bucket in buckets],
+        batch_size=2000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('beacon_auth', '0007_geohash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AlertHourlyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField()),
+                ('alert_type', models.CharField(choices=[('panic_button', 'Panic Button'), ('shake_to_alert', 'Shake to Alert'), ('decoy_screen', 'Decoy Screen'), ('manual', 'Manual Trigger'), ('scheduled', 'Scheduled Alert')], max_length=20)),
+                ('priority', models.IntegerField(choices=[(1, 'Low'), (2, 'Medium'), (3, 'High'), (4, 'Critical'), (5, 'Emergency')])),
+                ('status', models.CharField(choices=[('active', 'Active'), ('acknowledged', 'Acknowledged'), ('responding', 'Responding'), ('resolved', 'Resolved'), ('false_alarm', 'False Alarm'), ('canceled', 'Canceled')], max_length=20)),
+                ('count', models.IntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['hour'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='alerthourlyrollup',
+            constraint=models.UniqueConstraint(fields=('hour', 'alert_type', 'priority', 'status'), name='unique_alert_rollup_bucket'),
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
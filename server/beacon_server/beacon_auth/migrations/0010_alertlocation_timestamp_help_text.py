@@ -0,0 +1,19 @@
+# Generated by Django 4.2.7 on 2026-10-17 02:30
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('beacon_auth', '0009_useractivity_created_at_default'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='alertlocation',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now, help_text='When the device took the fix'),
+        ),
+    ]
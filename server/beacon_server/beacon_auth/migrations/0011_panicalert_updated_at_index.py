@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-17 02:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('beacon_auth', '0010_alertlocation_timestamp_help_text'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='panicalert',
+            index=models.Index(fields=['updated_at'], name='beacon_auth_updated_0577d2_idx'),
+        ),
+    ]
@@ -1,9 +1,21 @@
-from django.db import models
+from datetime import timezone as dt_timezone
+
+from django.db import IntegrityError, models, transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce, TruncHour
 from django.contrib.auth.models import User
 from django.utils import timezone
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.dispatch import Signal
 import uuid
 
+from .geo import geohash_encode
+from .livestats import record_stats_delta
+
+# Sent by PanicAlert.save() with ``alert`` and ``previous_status`` whenever a saved
+# alert's status changes, whichever code path saved it
+alert_status_changed = Signal()
+
 class UserProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile')
     bio = models.TextField(max_length=500, blank=True)
@@ -24,8 +36,11 @@ class UserProfile(models.Model):
         self.save(update_fields=['last_seen'])
     
     def set_online_status(self, status):
+        changed = self.is_online != status
         self.is_online = status
         self.save(update_fields=['is_online'])
+        if changed:
+            record_stats_delta(online_users=1 if status else -1)
 
 class Message(models.Model):
     MESSAGE_TYPES = [
@@ -58,13 +73,25 @@ class Message(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['created_at', 'id']),
+        ]
     
     def __str__(self):
         return f"{self.subject} - {self.user.username}"
     
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        super().save(*args, **kwargs)
+        if adding:
+            record_stats_delta(total_messages=1, unread_messages=0 if self.is_read else 1)
+    
     def mark_as_read(self):
+        was_unread = not self.is_read
         self.is_read = True
         self.save(update_fields=['is_read'])
+        if was_unread:
+            record_stats_delta(unread_messages=-1)
     
     def resolve_message(self):
         self.status = 'resolved'
@@ -85,11 +112,16 @@ class UserActivity(models.Model):
     description = models.TextField(blank=True)
     ip_address = models.GenericIPAddressField(null=True, blank=True)
     user_agent = models.TextField(blank=True)
-    created_at = models.DateTimeField(auto_now_add=True)
+    # Set when the activity happens, not when the audit writer stores it
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
     
     class Meta:
         ordering = ['-created_at']
         verbose_name_plural = 'User Activities'
+        indexes = [
+            models.Index(fields=['created_at', 'id']),
+            models.Index(fields=['user', 'created_at']),
+        ]
     
     def __str__(self):
         return f"{self.user.username} - {self.get_activity_type_display()}"
@@ -125,6 +157,35 @@ class SystemNotification(models.Model):
 
 # ======================== PANIC ALERT MODELS ========================
 
+def _child_count(model):
+    """Correlated COUNT of a child model's rows for the outer alert"""
+    counts = model.objects.filter(alert=OuterRef('pk')).order_by().values('alert').annotate(
+        count=Count('*')
+    ).values('count')
+    return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+
+def rollup_hour(moment):
+    """Start of the UTC hour containing moment"""
+    return moment.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+class PanicAlertQuerySet(models.QuerySet):
+    def rebuild_counters(self):
+        """Recompute the denormalised counter columns from the child tables"""
+        latest_fix = AlertLocation.objects.filter(alert=OuterRef('pk')).order_by('-timestamp').values('timestamp')[:1]
+        return self.update(
+            location_count=_child_count(AlertLocation),
+            media_count=_child_count(AlertMedia),
+            notification_count=_child_count(AlertNotification),
+            last_location_at=Subquery(latest_fix)
+        )
+    
+    def adjust_counter(self, alert_id, field, delta):
+        """Atomically add delta to one counter column of an alert"""
+        return self.filter(pk=alert_id).update(**{field: F(field) + delta})
+
+
 class PanicAlert(models.Model):
     """Main panic alert model"""
     ALERT_TYPES = [
@@ -144,6 +205,8 @@ class PanicAlert(models.Model):
         ('canceled', 'Canceled'),
     ]
     
+    ACTIVE_STATUSES = ['active', 'acknowledged', 'responding']
+    
     PRIORITY_LEVELS = [
         (1, 'Low'),
         (2, 'Medium'),
@@ -168,7 +231,9 @@ class PanicAlert(models.Model):
         validators=[MinValueValidator(-180), MaxValueValidator(180)]
     )
     location_accuracy = models.FloatField(null=True, blank=True, help_text='GPS accuracy in meters')
+    geohash = models.CharField(max_length=12, blank=True, db_index=True, help_text='Geohash of the current position')
     address = models.TextField(blank=True, help_text='Reverse geocoded address')
+    last_seen_at = models.DateTimeField(null=True, blank=True, help_text='Last time the device reported in')
     
     # Alert details
     description = models.TextField(blank=True, help_text='User description or automatic notes')
@@ -192,24 +257,132 @@ class PanicAlert(models.Model):
     device_info = models.JSONField(default=dict, blank=True, help_text='Device and app information')
     network_info = models.JSONField(default=dict, blank=True, help_text='Network connectivity info')
     
+    # Denormalised counters, maintained on write (see rebuild_alert_counters)
+    location_count = models.PositiveIntegerField(default=0, editable=False)
+    media_count = models.PositiveIntegerField(default=0, editable=False)
+    notification_count = models.PositiveIntegerField(default=0, editable=False)
+    last_location_at = models.DateTimeField(null=True, blank=True, editable=False, help_text='Time of the newest stored fix')
+    
+    COUNTER_FIELDS = ['location_count', 'media_count', 'notification_count', 'last_location_at']
+    
+    # Fields that, with the creation hour, key an alert's AlertHourlyRollup bucket
+    ROLLUP_FIELDS = ['alert_type', 'priority', 'status']
+    
+    objects = PanicAlertQuerySet.as_manager()
+    
     class Meta:
         ordering = ['-created_at']
         indexes = [
             models.Index(fields=['status', 'created_at']),
             models.Index(fields=['user', 'status']),
             models.Index(fields=['priority', 'created_at']),
+            models.Index(fields=['created_at', 'id']),
+            # Map resync reads the alerts changed since a recent version
+            models.Index(fields=['updated_at']),
         ]
     
     def __str__(self):
         return f"Alert {self.id} - {self.user.username} ({self.get_status_display()})"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored rollup key so saves can move the alert between
+        # rollup buckets and tell when it stops being active
+        if all(name in instance.__dict__ for name in ['created_at', *cls.ROLLUP_FIELDS]):
+            instance._stored = instance.rollup_key()
+        return instance
+    
+    def rollup_key(self, **overrides):
+        """The alert's AlertHourlyRollup bucket as field values"""
+        key = {name: self._meta.get_field(name).to_python(getattr(self, name)) for name in self.ROLLUP_FIELDS}
+        key['hour'] = rollup_hour(self.created_at)
+        key.update(overrides)
+        return key
+    
+    def locked_rollup_key(self):
+        """
+        The rollup key stored in the database, locking the row until the
+        transaction ends, or None if the row is gone. Concurrent saves of
+        stale instances thus each move the alert from its actual bucket.
+        """
+        stored = PanicAlert.objects.select_for_update().filter(pk=self.pk).values(
+            'created_at', *self.ROLLUP_FIELDS
+        ).first()
+        if stored is None:
+            return None
+        stored['hour'] = rollup_hour(stored.pop('created_at'))
+        return stored
+    
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        stored = getattr(self, '_stored', None)
+        has_position = self.latitude is not None and self.longitude is not None
+        self.geohash = geohash_encode(self.latitude, self.longitude) if has_position else ''
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'latitude', 'longitude'} & set(update_fields):
+            kwargs['update_fields'] = list(update_fields) + ['geohash']
+        
+        # Counters are only changed with F() updates; a full save of a possibly
+        # stale instance must not write them back
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.COUNTER_FIELDS
+            ]
+        saved_fields = kwargs.get('update_fields')
+        moves_bucket = saved_fields is None or bool({'created_at', *self.ROLLUP_FIELDS} & set(saved_fields))
+        with transaction.atomic():
+            if stored and moves_bucket:
+                stored = self.locked_rollup_key()
+            super().save(*args, **kwargs)
+            
+            if adding:
+                key = self.rollup_key()
+                AlertHourlyRollup.objects.adjust(key, 1)
+            elif stored:
+                # Only the saved fields changed in the database
+                key = self.rollup_key(**{
+                    name: value for name, value in stored.items()
+                    if saved_fields is not None and name not in saved_fields
+                })
+                if key != stored:
+                    AlertHourlyRollup.objects.adjust(stored, -1)
+                    AlertHourlyRollup.objects.adjust(key, 1)
+        
+        if adding:
+            record_stats_delta(total_alerts=1, alerts_today=1, active_alerts=1 if self.is_active else 0)
+        elif stored:
+            was_active = stored['status'] in self.ACTIVE_STATUSES
+            is_active = key['status'] in self.ACTIVE_STATUSES
+            if was_active != is_active:
+                record_stats_delta(active_alerts=1 if is_active else -1)
+            if key['status'] != stored['status']:
+                alert_status_changed.send(sender=PanicAlert, alert=self, previous_status=stored['status'])
+        if adding or stored:
+            self._stored = key
+    
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            stored = self.locked_rollup_key()
+            result = super().delete(*args, **kwargs)
+            if stored:
+                AlertHourlyRollup.objects.adjust(stored, -1)
+        if stored:
+            record_stats_delta(
+                total_alerts=-1,
+                active_alerts=-1 if stored['status'] in self.ACTIVE_STATUSES else 0,
+                alerts_today=-1 if timezone.localdate(self.created_at) == timezone.localdate() else 0
+            )
+        return result
+    
     def acknowledge(self, operator=None):
         """Mark alert as acknowledged by operator"""
         self.status = 'acknowledged'
         self.acknowledged_at = timezone.now()
         if operator:
             self.assigned_operator = operator
-        self.save(update_fields=['status', 'acknowledged_at', 'assigned_operator'])
+        self.save(update_fields=['status', 'acknowledged_at', 'assigned_operator', 'updated_at'])
     
     def resolve(self, resolution_notes=''):
         """Mark alert as resolved"""
@@ -217,17 +390,17 @@ class PanicAlert(models.Model):
         self.resolved_at = timezone.now()
         if resolution_notes:
             self.operator_notes = f"{self.operator_notes}\n\nResolution: {resolution_notes}"
-        self.save(update_fields=['status', 'resolved_at', 'operator_notes'])
+        self.save(update_fields=['status', 'resolved_at', 'operator_notes', 'updated_at'])
     
     def cancel(self):
         """Cancel alert (user initiated)"""
         self.status = 'canceled'
         self.resolved_at = timezone.now()
-        self.save(update_fields=['status', 'resolved_at'])
+        self.save(update_fields=['status', 'resolved_at', 'updated_at'])
     
     @property
     def is_active(self):
-        return self.status in ['active', 'acknowledged', 'responding']
+        return self.status in self.ACTIVE_STATUSES
     
     @property
     def duration(self):
@@ -244,6 +417,55 @@ class PanicAlert(models.Model):
         return None
 
 
+class AlertHourlyRollupQuerySet(models.QuerySet):
+    def adjust(self, key, delta):
+        """Atomically add delta to the count of one bucket, creating it if needed"""
+        if self.filter(**key).update(count=F('count') + delta):
+            return
+        try:
+            with transaction.atomic():
+                self.create(count=delta, **key)
+        except IntegrityError:
+            # Created concurrently
+            self.filter(**key).update(count=F('count') + delta)
+    
+    def rebuild(self):
+        """Recompute every bucket from the alert table, returning the number of buckets"""
+        buckets = PanicAlert.objects.order_by().annotate(hour=TruncHour('created_at', tzinfo=dt_timezone.utc)).values(
+            'hour', *PanicAlert.ROLLUP_FIELDS
+        ).annotate(total=Count('id'))
+        with transaction.atomic():
+            self.all().delete()
+            rollups = self.bulk_create(
+                [AlertHourlyRollup(count=bucket.pop('total'), **bucket) for bucket in buckets],
+                batch_size=2000
+            )
+        return len(rollups)
+
+
+class AlertHourlyRollup(models.Model):
+    """
+    Number of alerts created in one UTC hour per type, priority and current
+    status, maintained on write (see rebuild_alert_rollups)
+    """
+    hour = models.DateTimeField()
+    alert_type = models.CharField(max_length=20, choices=PanicAlert.ALERT_TYPES)
+    priority = models.IntegerField(choices=PanicAlert.PRIORITY_LEVELS)
+    status = models.CharField(max_length=20, choices=PanicAlert.ALERT_STATUS)
+    count = models.IntegerField(default=0)
+    
+    objects = AlertHourlyRollupQuerySet.as_manager()
+    
+    class Meta:
+        ordering = ['hour']
+        constraints = [
+            models.UniqueConstraint(fields=['hour', 'alert_type', 'priority', 'status'], name='unique_alert_rollup_bucket'),
+        ]
+    
+    def __str__(self):
+        return f"{self.hour:%Y-%m-%d %H:00} {self.alert_type}/{self.priority}/{self.status}: {self.count}"
+
+
 class AlertLocation(models.Model):
     """Location tracking history for panic alerts"""
     alert = models.ForeignKey(PanicAlert, on_delete=models.CASCADE, related_name='location_history')
@@ -259,7 +481,8 @@ class AlertLocation(models.Model):
     altitude = models.FloatField(null=True, blank=True, help_text='Altitude in meters')
     speed = models.FloatField(null=True, blank=True, help_text='Speed in m/s')
     heading = models.FloatField(null=True, blank=True, help_text='Direction in degrees')
-    timestamp = models.DateTimeField(auto_now_add=True)
+    timestamp = models.DateTimeField(default=timezone.now, help_text='When the device took the fix')
+    geohash = models.CharField(max_length=12, blank=True, help_text='Geohash of the fix')
     
     # Additional location metadata
     provider = models.CharField(max_length=20, default='gps', help_text='Location provider (gps, network, etc.)')
@@ -274,6 +497,10 @@ class AlertLocation(models.Model):
     def __str__(self):
         return f"Location for {self.alert.id} at {self.timestamp}"
     
+    def save(self, *args, **kwargs):
+        self.geohash = geohash_encode(self.latitude, self.longitude)
+        super().save(*args, **kwargs)
+    
     @property
     def coords(self):
         return (float(self.latitude), float(self.longitude))
@@ -323,6 +550,19 @@ class AlertMedia(models.Model):
     def __str__(self):
         return f"{self.get_media_type_display()} for Alert {self.alert.id}"
     
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if adding:
+                PanicAlert.objects.adjust_counter(self.alert_id, 'media_count', 1)
+    
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            PanicAlert.objects.adjust_counter(self.alert_id, 'media_count', -1)
+        return result
+    
     def mark_uploaded(self, file_url=''):
         """Mark media as successfully uploaded"""
         self.upload_status = 'uploaded'
@@ -426,6 +666,19 @@ class AlertNotification(models.Model):
     def __str__(self):
         return f"{self.get_notification_type_display()} to {self.recipient} for Alert {self.alert.id}"
     
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if adding:
+                PanicAlert.objects.adjust_counter(self.alert_id, 'notification_count', 1)
+    
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            PanicAlert.objects.adjust_counter(self.alert_id, 'notification_count', -1)
+        return result
+    
     def mark_sent(self):
         self.status = 'sent'
         self.sent_at = timezone.now()
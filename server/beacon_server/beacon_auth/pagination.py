@@ -0,0 +1,130 @@
+"""
+Keyset (cursor) pagination for the alert, activity, message and location lists.
+"""
+import base64
+import json
+from collections import OrderedDict
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Newest-first pagination keyed on ``(<keyset_field>, id)``.
+
+    Each page is a single index range scan, so page N costs the same as page
+    1. The total count is included unless the client passes ``count=false``.
+    """
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+
+    def __init__(self, keyset_field='created_at'):
+        self.keyset_field = keyset_field
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.count = None
+        if request.query_params.get(self.count_query_param) != 'false':
+            self.count = queryset.count()
+
+        queryset = queryset.order_by(f'-{self.keyset_field}', '-id')
+        cursor = self.decode_cursor(request)
+        if cursor:
+            value, pk = cursor
+            queryset = queryset.filter(
+                Q(**{f'{self.keyset_field}__lt': value}) |
+                Q(**{self.keyset_field: value, 'id__lt': pk})
+            )
+
+        page = list(queryset[:self.page_size + 1])
+        self.has_next = len(page) > self.page_size
+        page = page[:self.page_size]
+        self.last = page[-1] if page else None
+        self.has_previous = cursor is not None
+        return page
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+            if page_size > 0:
+                return min(page_size, self.max_page_size)
+        except (KeyError, ValueError):
+            pass
+        return self.page_size
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            data = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8'))
+            value = parse_datetime(data['v'])
+            if value is None:
+                raise ValueError
+            return value, data['id']
+        except (KeyError, TypeError, ValueError, UnicodeError):
+            raise NotFound('Invalid cursor')
+
+    def encode_cursor(self, instance):
+        data = {'v': getattr(instance, self.keyset_field).isoformat(), 'id': str(instance.pk)}
+        encoded = base64.urlsafe_b64encode(json.dumps(data).encode('utf-8')).decode('ascii')
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.encode_cursor(self.last)
+
+    def get_first_link(self):
+        if not self.has_previous:
+            return None
+        return remove_query_param(self.request.build_absolute_uri(), self.cursor_query_param)
+
+    def get_paginated_response(self, data):
+        payload = OrderedDict()
+        if self.count is not None:
+            payload['count'] = self.count
+        payload['next'] = self.get_next_link()
+        payload['first'] = self.get_first_link()
+        payload['results'] = data
+        return Response(payload)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'count': {'type': 'integer'},
+                'next': {'type': 'string', 'nullable': True},
+                'first': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
+
+
+class KeysetPaginationMixin:
+    """
+    Let list views switch to keyset pagination with ``?pagination=cursor``
+    (implied by a ``cursor`` parameter); page-number pagination stays the default.
+    """
+    keyset_field = 'created_at'
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            params = self.request.query_params
+            if params.get('pagination') == 'cursor' or KeysetPagination.cursor_query_param in params:
+                self._paginator = KeysetPagination(self.keyset_field)
+            else:
+                self._paginator = super().paginator
+        return self._paginator
@@ -0,0 +1,164 @@
+"""
+Compact binary frames for location streaming.
+
+Clients opt in by offering the ``beacon.location.v1`` WebSocket subprotocol on
+``ws/location/<alert_id>/`` (mobile side) or ``ws/alerts/`` and
+``ws/alerts/<alert_id>/`` (admin side). Once negotiated, location fixes travel
+as little-endian binary frames; every other message stays a JSON text frame.
+
+Fix layout (18 bytes):
+    int32    latitude  * 1e7
+    int32    longitude * 1e7
+    float16  accuracy in metres
+    float16  speed in m/s          (NaN = unknown)
+    uint16   heading * 100 degrees (0xFFFF = unknown)
+    float16  altitude in metres    (NaN = unknown)
+    uint8    battery percentage    (0xFF = unknown)
+    uint8    provider code         (see PROVIDERS)
+
+Mobile -> server, location update (19 bytes):
+    uint8    frame type (FRAME_LOCATION_UPDATE)
+    fix
+
+Server -> client, location broadcast (43 bytes):
+    uint8    frame type (FRAME_LOCATION)
+    16 bytes alert UUID
+    int64    fix timestamp in milliseconds since the Unix epoch
+    fix
+
+Server -> client, location batch (3 + 42 bytes per fix, ``ws/alerts/``):
+    uint8    frame type (FRAME_LOCATION_BATCH)
+    uint16   number of broadcasts
+    location broadcasts without their frame type byte
+
+Binary location updates are not acknowledged individually; errors are still
+reported as JSON text frames.
+"""
+import math
+import struct
+import uuid
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
+
+BINARY_SUBPROTOCOL = 'beacon.location.v1'
+
+FRAME_LOCATION_UPDATE = 0x01
+FRAME_LOCATION = 0x02
+FRAME_LOCATION_BATCH = 0x03
+
+PROVIDERS = ['gps', 'network', 'fused', 'passive']
+UNKNOWN_PROVIDER = 0xFF
+
+COORD_SCALE = 10_000_000
+HEADING_SCALE = 100
+NO_HEADING = 0xFFFF
+NO_BATTERY = 0xFF
+FLOAT16_MAX = 65504.0
+
+_FIX = '<iieeHeBB'
+_UPLINK = struct.Struct('<B' + _FIX[1:])
+_DOWNLINK = struct.Struct('<B16sq' + _FIX[1:])
+_BATCH_HEADER = struct.Struct('<BH')
+
+
+class FrameError(ValueError):
+    """Raised when a binary frame cannot be decoded"""
+
+
+def _half(value):
+    return max(-FLOAT16_MAX, min(FLOAT16_MAX, float(value)))
+
+
+def _optional_half(value):
+    return float('nan') if value is None else _half(value)
+
+
+def _pack_fix(location):
+    heading = location.get('heading')
+    battery_level = location.get('battery_level')
+    provider = location.get('provider') or 'gps'
+
+    return (
+        int(round(Decimal(location['latitude']) * COORD_SCALE)),
+        int(round(Decimal(location['longitude']) * COORD_SCALE)),
+        _half(location.get('accuracy') or 0),
+        _optional_half(location.get('speed')),
+        NO_HEADING if heading is None else int(round(float(heading) % 360 * HEADING_SCALE)) % 36000,
+        _optional_half(location.get('altitude')),
+        NO_BATTERY if battery_level is None else max(0, min(100, int(battery_level))),
+        PROVIDERS.index(provider) if provider in PROVIDERS else UNKNOWN_PROVIDER,
+    )
+
+
+def _unpack_fix(values):
+    latitude, longitude, accuracy, speed, heading, altitude, battery_level, provider = values
+
+    return {
+        'latitude': Decimal(latitude).scaleb(-7),
+        'longitude': Decimal(longitude).scaleb(-7),
+        'accuracy': accuracy,
+        'speed': None if math.isnan(speed) else speed,
+        'heading': None if heading == NO_HEADING else heading / HEADING_SCALE,
+        'altitude': None if math.isnan(altitude) else altitude,
+        'battery_level': None if battery_level == NO_BATTERY else battery_level,
+        'provider': PROVIDERS[provider] if provider < len(PROVIDERS) else 'unknown',
+    }
+
+
+def encode_location_update(location):
+    """Encode a mobile location update frame from a dict of fix fields"""
+    return _UPLINK.pack(FRAME_LOCATION_UPDATE, *_pack_fix(location))
+
+
+def decode_location_update(data):
+    """Decode a mobile location update frame into a dict of fix fields"""
+    if len(data) != _UPLINK.size or data[0] != FRAME_LOCATION_UPDATE:
+        raise FrameError("Invalid location update frame")
+    return _unpack_fix(_UPLINK.unpack(data)[1:])
+
+
+def encode_location(alert_id, location):
+    """Encode a server location broadcast frame from an AlertLocation"""
+    fix = {
+        'latitude': location.latitude,
+        'longitude': location.longitude,
+        'accuracy': location.accuracy,
+        'speed': location.speed,
+        'heading': location.heading,
+        'altitude': location.altitude,
+        'battery_level': location.battery_level,
+        'provider': location.provider,
+    }
+    timestamp_ms = int(location.timestamp.timestamp() * 1000)
+    return _DOWNLINK.pack(
+        FRAME_LOCATION, uuid.UUID(str(alert_id)).bytes, timestamp_ms, *_pack_fix(fix)
+    )
+
+
+def decode_location(data):
+    """Decode a server location broadcast frame into (alert_id, fix dict)"""
+    if len(data) != _DOWNLINK.size or data[0] != FRAME_LOCATION:
+        raise FrameError("Invalid location frame")
+    values = _DOWNLINK.unpack(data)
+    location = _unpack_fix(values[3:])
+    location['timestamp'] = datetime.fromtimestamp(values[2] / 1000, tz=dt_timezone.utc)
+    return str(uuid.UUID(bytes=values[1])), location
+
+
+def encode_location_batch(frames):
+    """Pack encoded location broadcast frames (see encode_location) into one batch frame"""
+    return _BATCH_HEADER.pack(FRAME_LOCATION_BATCH, len(frames)) + b''.join(frame[1:] for frame in frames)
+
+
+def decode_location_batch(data):
+    """Decode a location batch frame into a list of (alert_id, fix dict)"""
+    body_size = _DOWNLINK.size - 1
+    if len(data) < _BATCH_HEADER.size or data[0] != FRAME_LOCATION_BATCH:
+        raise FrameError("Invalid location batch frame")
+    count = _BATCH_HEADER.unpack_from(data)[1]
+    if len(data) != _BATCH_HEADER.size + count * body_size:
+        raise FrameError("Invalid location batch frame")
+    return [
+        decode_location(bytes([FRAME_LOCATION]) + data[offset:offset + body_size])
+        for offset in range(_BATCH_HEADER.size, len(data), body_size)
+    ]
@@ -8,6 +8,9 @@ websocket_urlpatterns = [
     # Individual Alert WebSocket - Real-time updates for specific alert
     re_path(r'ws/alerts/(?P<alert_id>[0-9a-f-]+)/$', consumers.AlertConsumer.as_asgi()),
     
+    # Multiplexed alert WebSocket - alert, location and chat streams on one connection
+    re_path(r'ws/alerts/(?P<alert_id>[0-9a-f-]+)/stream/$', consumers.AlertStreamConsumer.as_asgi()),
+    
     # User-specific WebSocket - Real-time updates for user
     re_path(r'ws/user/(?P<user_id>\w+)/$', consumers.UserConsumer.as_asgi()),
     
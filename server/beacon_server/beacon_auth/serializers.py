@@ -1,10 +1,14 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
 from django.contrib.auth.password_validation import validate_password
+from django.utils import timezone
+from datetime import timedelta
+import math
 from .models import (
     UserProfile, Message, UserActivity, SystemNotification,
     PanicAlert, AlertLocation, AlertMedia, EmergencyContact, AlertNotification
 )
+from .livestats import record_stats_delta
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -110,6 +114,7 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
         validated_data.pop('password2')
         user = User.objects.create_user(**validated_data)
         UserProfile.objects.create(user=user)
+        record_stats_delta(total_users=1)
         return user
 
 class UserLoginSerializer(serializers.Serializer):
@@ -219,13 +224,16 @@ class PanicAlertSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'user', 'alert_type', 'alert_type_display', 'status', 'status_display',
             'priority', 'priority_display', 'latitude', 'longitude', 'location_accuracy',
-            'address', 'location_coords', 'description', 'is_silent', 'auto_call_emergency',
-            'assigned_operator', 'operator_notes', 'created_at', 'updated_at',
-            'acknowledged_at', 'resolved_at', 'device_info', 'network_info',
-            'is_active', 'duration', 'location_history', 'media_files', 'notifications'
+            'address', 'location_coords', 'last_seen_at', 'description', 'is_silent',
+            'auto_call_emergency', 'assigned_operator', 'operator_notes', 'created_at',
+            'updated_at', 'acknowledged_at', 'resolved_at', 'device_info', 'network_info',
+            'is_active', 'duration', 'location_count', 'media_count', 'notification_count',
+            'last_location_at', 'location_history', 'media_files', 'notifications'
         ]
         read_only_fields = [
-            'id', 'user', 'created_at', 'updated_at', 'acknowledged_at', 'resolved_at'
+            'id', 'user', 'last_seen_at', 'created_at', 'updated_at', 'acknowledged_at',
+            'resolved_at', 'location_count', 'media_count', 'notification_count',
+            'last_location_at'
         ]
     
     def get_duration(self, obj):
@@ -277,14 +285,37 @@ class PanicAlertUpdateSerializer(serializers.ModelSerializer):
         return super().update(instance, validated_data)
 
 class AlertLocationCreateSerializer(serializers.ModelSerializer):
-    """Serializer for creating location updates"""
+    """
+    Serializer for creating location updates. ``timestamp`` is when the device
+    took the fix and defaults to now; with an ``alert`` in the context it may
+    not be earlier than the alert.
+    """
+    
+    # Allowed device clock drift ahead of the server
+    MAX_CLOCK_SKEW = timedelta(seconds=30)
     
     class Meta:
         model = AlertLocation
         fields = [
             'latitude', 'longitude', 'accuracy', 'altitude', 'speed',
-            'heading', 'provider', 'battery_level'
+            'heading', 'provider', 'battery_level', 'timestamp'
         ]
+    
+    def validate(self, attrs):
+        # FloatField accepts NaN and infinity, which the database rejects or stores uselessly
+        for field in ('accuracy', 'altitude', 'speed', 'heading'):
+            value = attrs.get(field)
+            if value is not None and not math.isfinite(value):
+                raise serializers.ValidationError({field: "A finite number is required."})
+        return attrs
+    
+    def validate_timestamp(self, value):
+        if value > timezone.now() + self.MAX_CLOCK_SKEW:
+            raise serializers.ValidationError("Location timestamp is in the future.")
+        alert = self.context.get('alert')
+        if alert is not None and value < alert.created_at:
+            raise serializers.ValidationError("Location timestamp is earlier than the alert.")
+        return value
 
 class AlertMediaCreateSerializer(serializers.ModelSerializer):
     """Serializer for uploading media files"""
@@ -306,17 +337,15 @@ class PanicAlertListSerializer(serializers.ModelSerializer):
     location_coords = serializers.ReadOnlyField()
     is_active = serializers.ReadOnlyField()
     duration = serializers.SerializerMethodField()
-    media_count = serializers.SerializerMethodField()
-    location_count = serializers.SerializerMethodField()
     
     class Meta:
         model = PanicAlert
         fields = [
             'id', 'user', 'alert_type', 'alert_type_display', 'status', 'status_display',
             'priority', 'priority_display', 'latitude', 'longitude', 'location_coords',
-            'address', 'description', 'is_silent', 'assigned_operator', 'created_at',
-            'acknowledged_at', 'resolved_at', 'is_active', 'duration', 'media_count',
-            'location_count'
+            'address', 'last_seen_at', 'description', 'is_silent', 'assigned_operator',
+            'created_at', 'acknowledged_at', 'resolved_at', 'is_active', 'duration',
+            'media_count', 'location_count', 'notification_count', 'last_location_at'
         ]
     
     def get_duration(self, obj):
@@ -324,12 +353,6 @@ class PanicAlertListSerializer(serializers.ModelSerializer):
         if duration:
             return int(duration.total_seconds())
         return None
-    
-    def get_media_count(self, obj):
-        return obj.media_files.count()
-    
-    def get_location_count(self, obj):
-        return obj.location_history.count()
 
 class PanicAlertStatsSerializer(serializers.Serializer):
     """Serializer for panic alert statistics"""
@@ -341,5 +364,8 @@ class PanicAlertStatsSerializer(serializers.Serializer):
     alerts_this_week = serializers.IntegerField()
     alerts_this_month = serializers.IntegerField()
     average_response_time = serializers.FloatField()
+    response_time_p50 = serializers.FloatField(allow_null=True)
+    response_time_p90 = serializers.FloatField(allow_null=True)
+    response_time_p99 = serializers.FloatField(allow_null=True)
     alert_types_breakdown = serializers.DictField()
     priority_breakdown = serializers.DictField()
@@ -0,0 +1,195 @@
+"""
+Dashboard and alert statistics.
+
+Each table is read once with conditional aggregation (``COUNT(...) FILTER``
+or its ``CASE`` equivalent) instead of one COUNT query per figure. Alert
+counts come from the AlertHourlyRollup buckets rather than the alert table, so
+their cost grows with the number of hours that saw alerts, not with alerts.
+Periods start on UTC hours; with TIME_ZONE set to a zone with a fractional
+offset, "today" is counted from the hour before local midnight.
+"""
+import math
+from datetime import datetime, time, timedelta
+
+from django.contrib.auth.models import User
+from django.db.models import Avg, Count, DurationField, ExpressionWrapper, F, Q, Sum
+from django.db.models.functions import TruncDay
+from django.utils import timezone
+
+from .models import AlertHourlyRollup, Message, SystemNotification, PanicAlert, rollup_hour
+
+
+def start_of_today():
+    """Midnight of the current day in the active time zone"""
+    return timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def user_counts(today=None):
+    """Total, online and new-today users in one query"""
+    today = today or start_of_today()
+    return User.objects.aggregate(
+        total_users=Count('id'),
+        online_users=Count('id', filter=Q(profile__is_online=True)),
+        new_users_today=Count('id', filter=Q(date_joined__gte=today))
+    )
+
+
+def message_counts(today=None):
+    """Total, unread and today's messages in one query"""
+    today = today or start_of_today()
+    return Message.objects.aggregate(
+        total_messages=Count('id'),
+        unread_messages=Count('id', filter=Q(is_read=False)),
+        messages_today=Count('id', filter=Q(created_at__gte=today))
+    )
+
+
+def alert_counts(today=None):
+    """Alert totals by status and creation period in one rollup query"""
+    today = rollup_hour(today or start_of_today())
+    return AlertHourlyRollup.objects.aggregate(
+        total_alerts=Sum('count', default=0),
+        active_alerts=Sum('count', filter=Q(status__in=PanicAlert.ACTIVE_STATUSES), default=0),
+        acknowledged_alerts=Sum('count', filter=Q(status='acknowledged'), default=0),
+        resolved_alerts=Sum('count', filter=Q(status='resolved'), default=0),
+        alerts_today=Sum('count', filter=Q(hour__gte=today), default=0),
+        alerts_this_week=Sum('count', filter=Q(hour__gte=today - timedelta(days=7)), default=0),
+        alerts_this_month=Sum('count', filter=Q(hour__gte=today - timedelta(days=30)), default=0)
+    )
+
+
+def alert_breakdowns():
+    """Alert counts per type and per priority"""
+    rollups = AlertHourlyRollup.objects.order_by()
+    alert_types = rollups.values('alert_type').annotate(total=Sum('count')).filter(total__gt=0)
+    priorities = rollups.values('priority').annotate(total=Sum('count')).filter(total__gt=0)
+    return {
+        'alert_types_breakdown': {item['alert_type']: item['total'] for item in alert_types},
+        'priority_breakdown': {str(item['priority']): item['total'] for item in priorities}
+    }
+
+
+TIMESERIES_INTERVALS = {'hour': timedelta(hours=1), 'day': timedelta(days=1)}
+TIMESERIES_MAX_BUCKETS = 1000
+
+
+def alert_timeseries(start, end, interval='day', alert_type=None, priority=None):
+    """
+    Alerts created per hour or per local day between start and end, with
+    empty buckets filled in. Raises ValueError for an invalid range.
+    """
+    if interval not in TIMESERIES_INTERVALS:
+        raise ValueError('interval must be hour or day')
+    if start >= end:
+        raise ValueError('start must be before end')
+
+    first = rollup_hour(start) if interval == 'hour' else _local_midnight(timezone.localdate(start))
+    if (end - first) / TIMESERIES_INTERVALS[interval] > TIMESERIES_MAX_BUCKETS:
+        raise ValueError(f'range spans more than {TIMESERIES_MAX_BUCKETS} {interval}s')
+
+    rollups = AlertHourlyRollup.objects.filter(hour__gte=first, hour__lt=end)
+    if alert_type:
+        rollups = rollups.filter(alert_type=alert_type)
+    if priority:
+        rollups = rollups.filter(priority=priority)
+    if interval == 'day':
+        rollups = rollups.annotate(bucket=TruncDay('hour'))
+    else:
+        rollups = rollups.annotate(bucket=F('hour'))
+    counts = {
+        item['bucket']: item['total']
+        for item in rollups.order_by().values('bucket').annotate(total=Sum('count'))
+    }
+
+    points = []
+    bucket = first
+    while bucket < end:
+        points.append({'time': bucket.isoformat(), 'count': counts.get(bucket, 0)})
+        if interval == 'hour':
+            bucket += TIMESERIES_INTERVALS['hour']
+        else:
+            bucket = _local_midnight(timezone.localdate(bucket) + timedelta(days=1))
+    return points
+
+
+def _local_midnight(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+RESPONSE_TIME_PERCENTILES = [50, 90, 99]
+
+
+def _seconds(duration):
+    return duration.total_seconds() if duration is not None else None
+
+
+def response_times():
+    """
+    Seconds from creation to acknowledgement: the average and nearest-rank
+    percentiles, each percentile read by the database as the single row at
+    its rank, so no alert history is sent to Python.
+    """
+    acknowledged = PanicAlert.objects.filter(
+        status__in=['acknowledged', 'resolved'],
+        acknowledged_at__isnull=False
+    ).annotate(
+        response_time=ExpressionWrapper(F('acknowledged_at') - F('created_at'), output_field=DurationField())
+    )
+
+    summary = acknowledged.aggregate(count=Count('id'), average=Avg('response_time'))
+    count = summary['count']
+    figures = {'average_response_time': _seconds(summary['average']) or 0}
+    figures.update({f'response_time_p{percentile}': None for percentile in RESPONSE_TIME_PERCENTILES})
+    if not count:
+        return figures
+
+    ordered = acknowledged.order_by('response_time', 'id').values_list('response_time', flat=True)
+    for percentile in RESPONSE_TIME_PERCENTILES:
+        rank = max(1, math.ceil(percentile / 100 * count))
+        # OFFSET rank - 1 LIMIT 1
+        response_time = ordered[rank - 1:rank].first()
+        figures[f'response_time_p{percentile}'] = _seconds(response_time)
+    return figures
+
+
+def dashboard_stats():
+    """Figures for the admin dashboard overview"""
+    today = start_of_today()
+    users = user_counts(today)
+    alerts = alert_counts(today)
+    return {
+        'total_users': users['total_users'],
+        'active_users': users['online_users'],
+        'new_users_today': users['new_users_today'],
+        **message_counts(today),
+        'system_notifications': SystemNotification.objects.filter(is_active=True).count(),
+        'total_alerts': alerts['total_alerts'],
+        'active_alerts': alerts['active_alerts'],
+        'alerts_today': alerts['alerts_today']
+    }
+
+
+def live_dashboard_stats():
+    """Figures pushed to the admin dashboard WebSocket"""
+    today = start_of_today()
+    users = user_counts(today)
+    alerts = alert_counts(today)
+    messages = message_counts(today)
+    return {
+        'total_alerts': alerts['total_alerts'],
+        'active_alerts': alerts['active_alerts'],
+        'alerts_today': alerts['alerts_today'],
+        'online_users': users['online_users'],
+        'total_users': users['total_users'],
+        'total_messages': messages['total_messages'],
+        'unread_messages': messages['unread_messages']
+    }
+
+
+def alert_stats():
+    """Figures for the panic alert statistics endpoint"""
+    return {
+        **alert_counts(),
+        **response_times(),
+        **alert_breakdowns()
+    }
@@ -1,3 +1,939 @@
-from django.test import TestCase
+import asyncio
+import json
+import struct
+import time
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from . import geo
+from .access import alert_access_cache, load_alert_access
+from .audit import AuditLogWriter, audit_log, log_activity
+from .authentication import TokenUserCache
+from .broadcast import BroadcastQueue
+from .events import alert_event_messages, location_ticker, publish
+from .livestats import LiveStats
+from .mapping import MAP_DELTA_SUBPROTOCOL, encode_map_frame
+from .middleware import get_user_for_token
+from .models import (
+    AlertHourlyRollup, AlertLocation, AlertMedia, Message, PanicAlert, UserActivity, UserProfile, rollup_hour
+)
+from .protocol import (
+    BINARY_SUBPROTOCOL, FRAME_LOCATION_UPDATE, NO_BATTERY, NO_HEADING, FrameError, decode_location,
+    decode_location_batch, decode_location_update, encode_location, encode_location_batch,
+    encode_location_update
+)
+from .routing import websocket_urlpatterns
+from .stats import alert_timeseries, dashboard_stats, response_times
+from .tracking import LocationWriteBuffer, build_location, record_locations, store_locations
+
+
+class AlertTestMixin:
+    """Users, authenticated API clients and an active alert owned by ``self.user``"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('mobile', password='pass')
+        UserProfile.objects.create(user=self.user)
+        self.staff = User.objects.create_user('operator', password='pass', is_staff=True)
+        UserProfile.objects.create(user=self.staff)
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.staff_client = APIClient()
+        self.staff_client.force_authenticate(self.staff)
+
+        self.alert = PanicAlert.objects.create(user=self.user, latitude=1, longitude=2)
+        # Fixes held for operator consoles by earlier tests
+        location_ticker.take()
+
+    async def connect(self, path, user, **kwargs):
+        """Open a WebSocket to ``path`` as ``user`` (authentication middleware is bypassed)"""
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), path, **kwargs)
+        communicator.scope['user'] = user
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def receive_all(self, communicator, timeout=0.3):
+        """JSON frames received until ``communicator`` stays quiet for ``timeout`` seconds"""
+        frames = []
+        while not await communicator.receive_nothing(timeout):
+            frames.append(await communicator.receive_json_from())
+        return frames
+
+
+class LocationBatchTests(AlertTestMixin, TestCase):
+
+    def batch_url(self):
+        return f'/api/auth/alerts/{self.alert.id}/location/batch/'
+
+    def test_batch_keeps_device_timestamps(self):
+        started = timezone.now() - timedelta(minutes=30)
+        PanicAlert.objects.filter(pk=self.alert.pk).update(created_at=started)
+        times = [started + timedelta(minutes=5 * i) for i in range(1, 6)]
+        fixes = [
+            {'latitude': 1 + i / 100, 'longitude': 2, 'accuracy': 5, 'timestamp': t.isoformat()}
+            for i, t in enumerate(times)
+        ]
+
+        response = self.client.post(self.batch_url(), fixes, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        stored = list(AlertLocation.objects.filter(alert=self.alert).order_by('timestamp'))
+        self.assertEqual([location.timestamp for location in stored], times)
+        self.alert.refresh_from_db()
+        self.assertEqual(self.alert.last_location_at, times[-1])
+        self.assertEqual(self.alert.location_count, 5)
+
+    def test_late_backlog_does_not_move_the_alert_head_back(self):
+        PanicAlert.objects.filter(pk=self.alert.pk).update(created_at=timezone.now() - timedelta(hours=1))
+        response = self.client.post(
+            f'/api/auth/alerts/{self.alert.id}/location/', {'latitude': 10, 'longitude': 20, 'accuracy': 5},
+            format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.alert.refresh_from_db()
+        live_seen = self.alert.last_seen_at
+
+        old = timezone.now() - timedelta(minutes=30)
+        response = self.client.post(self.batch_url(), [
+            {'latitude': 3, 'longitude': 4, 'accuracy': 5, 'timestamp': old.isoformat()}
+        ], format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.alert.refresh_from_db()
+        self.assertEqual((self.alert.latitude, self.alert.longitude), (Decimal(10), Decimal(20)))
+        self.assertEqual(self.alert.last_seen_at, live_seen)
+        self.assertEqual(self.alert.last_location_at, live_seen)
+        self.assertEqual(self.alert.location_count, 2)
+
+    def test_batch_rejects_timestamps_outside_the_alert(self):
+        future = timezone.now() + timedelta(hours=1)
+        before = self.alert.created_at - timedelta(hours=1)
+        for timestamp in (future, before):
+            response = self.client.post(self.batch_url(), [
+                {'latitude': 1, 'longitude': 2, 'accuracy': 5, 'timestamp': timestamp.isoformat()}
+            ], format='json')
+            self.assertEqual(response.status_code, 400)
+        self.assertFalse(AlertLocation.objects.filter(alert=self.alert).exists())
+
+
+class LocationSocketStatusTests(AlertTestMixin, TransactionTestCase):
+
+    async def test_fix_rejected_after_alert_resolved_through_the_model(self):
+        socket = await self.connect(f'/ws/location/{self.alert.id}/', self.user)
+        fix = {'type': 'location_update', 'location': {'latitude': 1.5, 'longitude': 2.5, 'accuracy': 5}}
+
+        await socket.send_json_to(fix)
+        self.assertEqual((await socket.receive_json_from())['type'], 'success')
+
+        alert = await PanicAlert.objects.aget(pk=self.alert.pk)
+        await sync_to_async(alert.resolve)()
+        frames = await self.receive_all(socket)
+        self.assertIn(('alert_status_changed', 'resolved'), [(f['type'], f.get('status')) for f in frames])
+
+        await socket.send_json_to(fix)
+        reply = await socket.receive_json_from()
+        self.assertEqual(reply['type'], 'error')
+        self.assertEqual(await AlertLocation.objects.filter(alert_id=self.alert.pk).acount(), 1)
+        await socket.disconnect()
+
+    def test_store_locations_rejects_inactive_alert(self):
+        self.alert.resolve()
+        location = build_location(self.alert, {'latitude': 1, 'longitude': 2, 'accuracy': 5})
+        self.assertEqual(store_locations(self.alert, [location], require_active=True), [])
+        self.assertFalse(AlertLocation.objects.filter(alert=self.alert).exists())
+
+
+class BinaryLocationValidationTests(AlertTestMixin, TransactionTestCase):
+
+    def frame(self, latitude, longitude, accuracy):
+        """Raw uplink frame, bypassing the clamping done by encode_location_update"""
+        nan = float('nan')
+        return struct.pack(
+            '<BiieeHeBB', FRAME_LOCATION_UPDATE, int(latitude * 1e7), int(longitude * 1e7),
+            accuracy, nan, NO_HEADING, nan, NO_BATTERY, 0
+        )
+
+    async def test_invalid_binary_fixes_are_rejected_not_stored(self):
+        socket = await self.connect(
+            f'/ws/location/{self.alert.id}/', self.user, subprotocols=[BINARY_SUBPROTOCOL]
+        )
+
+        for frame in (self.frame(1.5, 2.5, float('nan')), self.frame(120, 2.5, 5), self.frame(1.5, -200, 5)):
+            await socket.send_to(bytes_data=frame)
+            reply = await socket.receive_json_from()
+            self.assertEqual((reply['type'], reply['message']), ('error', 'Invalid location data'))
+
+        await socket.send_to(bytes_data=self.frame(1.5, 2.5, 5))
+        self.assertTrue(await socket.receive_nothing(0.3))
+        self.assertEqual(await AlertLocation.objects.filter(alert_id=self.alert.pk).acount(), 1)
+        await socket.disconnect()
+
+
+class LocationWriteBufferTests(AlertTestMixin, TransactionTestCase):
+
+    async def test_buffered_fixes_survive_alert_resolution(self):
+        buffer = LocationWriteBuffer(max_fixes=10, flush_interval=60)
+        for i in range(3):
+            location = build_location(None, {'latitude': 1 + i / 100, 'longitude': 2, 'accuracy': 5})
+            location.alert_id = self.alert.id
+            await buffer.add(self.alert.id, location)
+        self.assertEqual(await AlertLocation.objects.filter(alert_id=self.alert.pk).acount(), 0)
+
+        alert = await PanicAlert.objects.aget(pk=self.alert.pk)
+        await sync_to_async(alert.resolve)()
+
+        self.assertEqual(await buffer.flush(self.alert.id), 3)
+        alert = await PanicAlert.objects.aget(pk=self.alert.pk)
+        self.assertEqual(alert.location_count, 3)
+        self.assertEqual(alert.status, 'resolved')
+
+    async def test_buffer_flushes_at_max_fixes(self):
+        buffer = LocationWriteBuffer(max_fixes=2, flush_interval=60)
+        for i in range(2):
+            location = build_location(None, {'latitude': 1 + i / 100, 'longitude': 2, 'accuracy': 5})
+            location.alert_id = self.alert.id
+            await buffer.add(self.alert.id, location)
+        self.assertEqual(await AlertLocation.objects.filter(alert_id=self.alert.pk).acount(), 2)
+
+
+class TrackSimplificationTests(SimpleTestCase):
+
+    def track(self, n):
+        """A straight eastward track with one sharp detour north in the middle"""
+        for i in range(n):
+            yield (0.01 if i == n // 2 else 0.0), i * 1e-5, i
+
+    def test_max_points_keeps_endpoints_and_corners(self):
+        points, count = geo.simplify_track(self.track(10001), max_points=20)
+
+        self.assertEqual(count, 10001)
+        self.assertLessEqual(len(points), 20)
+        self.assertEqual(points[0][2], 0)
+        self.assertEqual(points[-1][2], 10000)
+        self.assertIn(5000, [point[2] for point in points])
+
+    def test_max_points_working_buffer_is_bounded(self):
+        sizes = []
+        visvalingam = geo._visvalingam
+
+        def spy(kept, max_points):
+            sizes.append(len(kept))
+            return visvalingam(kept, max_points)
+
+        with mock.patch.object(geo, '_visvalingam', spy):
+            geo.simplify_track(self.track(10001), max_points=20)
+        self.assertLessEqual(max(sizes), 40)
+
+    def test_tolerance_drops_collinear_points(self):
+        points, count = geo.simplify_track(self.track(101), tolerance=5)
+
+        self.assertEqual(count, 101)
+        indexes = [point[2] for point in points]
+        self.assertEqual((indexes[0], indexes[-1]), (0, 100))
+        self.assertIn(50, indexes)
+        self.assertLessEqual(len(indexes), 5)
+
+
+class TokenUserCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('mobile', password='pass')
+        self.tokens = TokenUserCache(ttl=300)
+
+    def cache_token(self, token_id, expires_in=600):
+        self.tokens.set(token_id, self.user, time.time() + expires_in, self.tokens.user_version(self.user.pk))
+
+    def test_cached_user_is_shared_across_processes(self):
+        self.cache_token('a')
+        # A restarted or other process starts with its own, empty, TokenUserCache
+        cached = TokenUserCache(ttl=300).get('a', self.user.pk)
+        self.assertEqual(cached.pk, self.user.pk)
+        self.assertIsNot(cached, self.tokens.get('a', self.user.pk))
+        self.assertEqual(async_to_sync(self.tokens.aget)('a', self.user.pk).pk, self.user.pk)
+
+    def test_invalidation_in_another_process_is_seen(self):
+        self.cache_token('a')
+        TokenUserCache(ttl=300).invalidate_user(self.user.pk)
+        self.assertIsNone(self.tokens.get('a', self.user.pk))
+
+    def test_expired_tokens_are_not_cached(self):
+        self.cache_token('a', expires_in=-1)
+        self.assertIsNone(self.tokens.get('a', self.user.pk))
+
+
+    def test_socket_handshake_hits_the_cache(self):
+        token = str(AccessToken.for_user(self.user))
+        self.assertEqual(async_to_sync(get_user_for_token)(token).pk, self.user.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(async_to_sync(get_user_for_token)(token).pk, self.user.pk)
+
+class OperatorLocationBatchTests(AlertTestMixin, TransactionTestCase):
+
+    async def open_sockets(self):
+        console = await self.connect('/ws/alerts/', self.staff)
+        self.assertEqual((await console.receive_json_from())['type'], 'active_alerts')
+        device = await self.connect(f'/ws/location/{self.alert.id}/', self.user)
+        return console, device
+
+    async def send_fix(self, device, latitude):
+        await device.send_json_to({
+            'type': 'location_update', 'location': {'latitude': latitude, 'longitude': 2, 'accuracy': 5}
+        })
+        self.assertEqual((await device.receive_json_from())['type'], 'success')
+
+    async def test_fixes_within_a_tick_reach_consoles_as_one_batch(self):
+        console, device = await self.open_sockets()
+        for latitude in (1.1, 1.2, 1.3):
+            await self.send_fix(device, latitude)
+
+        frames = await self.receive_all(console, timeout=1)
+        self.assertEqual([frame['type'] for frame in frames], ['location_batch'])
+        updates = frames[0]['updates']
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(float(updates[0]['location']['latitude']), 1.3)
+        await device.disconnect()
+        await console.disconnect()
+
+    async def test_held_fix_is_sent_before_the_alert_is_resolved(self):
+        console, device = await self.open_sockets()
+        await self.send_fix(device, 1.1)
+
+        await console.send_json_to({'type': 'resolve_alert', 'alert_id': str(self.alert.id)})
+        frames = await self.receive_all(console, timeout=1)
+        types = [frame['type'] for frame in frames if frame['type'] != 'success']
+        self.assertEqual(types[:2], ['location_batch', 'alert_resolved'])
+        self.assertNotIn('location_batch', types[2:])
+        await device.disconnect()
+        await console.disconnect()
+
+
+class AlertListQueryTests(AlertTestMixin, TestCase):
+
+    def list_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.staff_client.get('/api/auth/alerts/')
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response.data['results']
+
+    def test_counts_do_not_cost_a_query_per_row(self):
+        AlertMedia.objects.create(alert=self.alert, media_type='audio')
+        one_row, _ = self.list_queries()
+        for _ in range(4):
+            PanicAlert.objects.create(user=self.user, latitude=1, longitude=2)
+
+        five_rows, results = self.list_queries()
+        self.assertEqual(len(results), 5)
+        self.assertEqual(five_rows, one_row)
+        counts = {alert['id']: alert['media_count'] for alert in results}
+        self.assertEqual(counts[str(self.alert.id)], 1)
+
+class AlertCounterTests(AlertTestMixin, TestCase):
+
+    def test_media_counter_follows_saves_and_deletes(self):
+        media = AlertMedia.objects.create(alert=self.alert, media_type='audio')
+        AlertMedia.objects.create(alert=self.alert, media_type='photo')
+        media.delete()
+
+        self.alert.refresh_from_db()
+        self.assertEqual(self.alert.media_count, 1)
+
+    def test_rebuild_counters_repairs_drift(self):
+        store_locations(self.alert, [
+            build_location(self.alert, {'latitude': 1, 'longitude': 2, 'accuracy': 5}) for _ in range(2)
+        ])
+        AlertMedia.objects.create(alert=self.alert, media_type='audio')
+        PanicAlert.objects.filter(pk=self.alert.pk).update(location_count=9, media_count=0, last_location_at=None)
+
+        PanicAlert.objects.filter(pk=self.alert.pk).rebuild_counters()
+
+        self.alert.refresh_from_db()
+        self.assertEqual((self.alert.location_count, self.alert.media_count), (2, 1))
+        self.assertEqual(
+            self.alert.last_location_at,
+            AlertLocation.objects.filter(alert=self.alert).latest('timestamp').timestamp
+        )
+
+
+class ResponseTimeTests(AlertTestMixin, TestCase):
+
+    def test_each_percentile_is_one_row_query(self):
+        for seconds in range(10, 0, -1):
+            alert = PanicAlert.objects.create(user=self.user, latitude=1, longitude=2)
+            PanicAlert.objects.filter(pk=alert.pk).update(
+                status='acknowledged', acknowledged_at=alert.created_at + timedelta(seconds=seconds)
+            )
+
+        with CaptureQueriesContext(connection) as queries:
+            figures = response_times()
+        self.assertEqual(len(queries), 4)
+        for query in queries.captured_queries[1:]:
+            self.assertIn('LIMIT 1', query['sql'])
+
+        self.assertAlmostEqual(figures['average_response_time'], 5.5)
+        self.assertEqual(
+            [figures['response_time_p50'], figures['response_time_p90'], figures['response_time_p99']],
+            [5, 9, 10]
+        )
+
+    def test_no_acknowledged_alerts(self):
+        self.assertEqual(response_times(), {
+            'average_response_time': 0,
+            'response_time_p50': None, 'response_time_p90': None, 'response_time_p99': None
+        })
+
+
+class BroadcastQueueTests(SimpleTestCase):
+
+    def test_full_queue_drops_only_droppable_messages(self):
+        queue = BroadcastQueue(max_size=2, batch_size=10, send_timeout=1)
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+
+        # Delivery waits until the loop runs, so everything below stays queued
+        with mock.patch.object(queue, '_delivery_loop', return_value=loop):
+            queue.put('panic_alerts', {'type': 'new_panic_alert'})
+            queue.put('alert_1', {'type': 'location_updated', 'n': 1}, key='location', droppable=True)
+            queue.put('alert_1', {'type': 'location_updated', 'n': 2}, key='location', droppable=True)
+            queue.put('panic_alerts', {'type': 'alert_resolved'})
+            queue.put('panic_alerts', {'type': 'alert_canceled'})
+            queue.put('alert_2', {'type': 'location_updated', 'n': 3}, key='location', droppable=True)
+
+        stats = queue.stats()
+        self.assertEqual((stats['queued'], stats['coalesced'], stats['dropped']), (3, 1, 2))
+
+        loop.run_until_complete(asyncio.sleep(0.2))
+        self.assertEqual(queue.stats()['sent'], 3)
+
+
+    def test_map_deltas_are_never_coalesced(self):
+        queue = BroadcastQueue(max_size=10, batch_size=10, send_timeout=1)
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+
+        with mock.patch.object(queue, '_delivery_loop', return_value=loop), \
+                mock.patch('beacon_auth.events.broadcast_queue', queue):
+            for rev in (1, 2):
+                change = {'op': 'move', 'id': 'a', 'rev': rev}
+                publish([
+                    ('alert_a', {'type': 'location_updated', 'text': '{}'}),
+                    ('map_alert_deltas', {
+                        'type': 'map_delta', 'event_id': str(rev),
+                        'text': encode_map_frame('map_delta', changes=[change])
+                    })
+                ], key='location_a')
+
+        stats = queue.stats()
+        self.assertEqual((stats['queued'], stats['coalesced']), (3, 1))
+        loop.run_until_complete(asyncio.sleep(0.1))
+        self.assertEqual(queue.stats()['sent'], 3)
+
+class LocationCodecTests(SimpleTestCase):
+
+    def test_location_update_round_trip(self):
+        fix = {
+            'latitude': Decimal('-33.8688197'), 'longitude': Decimal('151.2092955'), 'accuracy': 4.5,
+            'speed': 1.5, 'heading': 271.25, 'altitude': None, 'battery_level': 42, 'provider': 'fused'
+        }
+        decoded = decode_location_update(encode_location_update(fix))
+
+        self.assertEqual(decoded, fix)
+
+    def test_location_broadcast_and_batch_round_trip(self):
+        alert_id = str(uuid.uuid4())
+        location = AlertLocation(
+            latitude=Decimal('51.5007292'), longitude=Decimal('-0.1246254'), accuracy=8,
+            timestamp=timezone.now().replace(microsecond=123000)
+        )
+        frame = encode_location(alert_id, location)
+
+        decoded_id, fix = decode_location(frame)
+        self.assertEqual(decoded_id, alert_id)
+        self.assertEqual((fix['latitude'], fix['longitude']), (location.latitude, location.longitude))
+        self.assertEqual(fix['timestamp'], location.timestamp)
+        self.assertEqual(fix['provider'], 'gps')
+        self.assertEqual(decode_location_batch(encode_location_batch([frame, frame])), [(alert_id, fix)] * 2)
+
+    def test_malformed_frames_are_rejected(self):
+        frame = encode_location_update({'latitude': 1, 'longitude': 2})
+        for data in (frame[:-1], b'\x02' + frame[1:]):
+            with self.assertRaises(FrameError):
+                decode_location_update(data)
+        with self.assertRaises(FrameError):
+            decode_location_batch(encode_location_batch([]) + b'\x00')
+
+
+@override_settings(
+    LOCATION_INGEST_FILTER=True, LOCATION_FILTER_MIN_DISTANCE=10,
+    LOCATION_FILTER_ACCURACY_FACTOR=1.0, LOCATION_FILTER_MAX_INTERVAL_SECONDS=60
+)
+class IngestFilterTests(AlertTestMixin, TestCase):
+
+    def fix(self, latitude, seconds, accuracy=5):
+        return {
+            'latitude': Decimal(latitude), 'longitude': Decimal('2'), 'accuracy': accuracy,
+            'timestamp': self.alert.created_at + timedelta(seconds=seconds)
+        }
+
+    def test_jitter_is_dropped_but_movement_and_heartbeats_are_kept(self):
+        stored = record_locations(self.alert, [
+            self.fix('1.0000000', 1),
+            self.fix('1.0000300', 2),  # ~3 m
+            self.fix('1.0001000', 3, accuracy=20),  # ~11 m, inside the accuracy radius
+            self.fix('1.0010000', 4),  # ~111 m
+            self.fix('1.0010100', 70),  # jitter, but the heartbeat interval has passed
+        ])
+
+        self.assertEqual(
+            [location.timestamp for location in stored],
+            [self.alert.created_at + timedelta(seconds=seconds) for seconds in (1, 4, 70)]
+        )
+        self.alert.refresh_from_db()
+        self.assertEqual(self.alert.location_count, 3)
+
+    def test_repeated_fix_only_refreshes_last_seen(self):
+        record_locations(self.alert, [self.fix('1.0000000', 1)])
+        PanicAlert.objects.filter(pk=self.alert.pk).update(last_seen_at=self.alert.created_at)
+
+        self.assertEqual(record_locations(self.alert, [self.fix('1.0000100', 2)]), [])
+
+        self.alert.refresh_from_db()
+        self.assertEqual(self.alert.location_count, 1)
+        self.assertGreater(self.alert.last_seen_at, self.alert.created_at)
+
+
+class KeysetPaginationTests(AlertTestMixin, TestCase):
+
+    def test_cursor_pages_walk_every_alert_once_in_order(self):
+        created_at = timezone.now() - timedelta(hours=1)
+        for _ in range(4):
+            PanicAlert.objects.create(user=self.user, latitude=1, longitude=2)
+        # Equal timestamps must be split by id, never skipped or repeated
+        PanicAlert.objects.exclude(pk=self.alert.pk).update(created_at=created_at)
+
+        response = self.staff_client.get('/api/auth/alerts/', {'pagination': 'cursor', 'page_size': 2})
+        self.assertEqual(response.data['count'], 5)
+        self.assertIsNone(response.data['first'])
+        seen = [alert['id'] for alert in response.data['results']]
+        while response.data['next']:
+            response = self.staff_client.get(response.data['next'])
+            self.assertIsNotNone(response.data['first'])
+            seen += [alert['id'] for alert in response.data['results']]
+
+        expected = [str(pk) for pk in PanicAlert.objects.order_by('-created_at', '-id').values_list('id', flat=True)]
+        self.assertEqual(seen, expected)
+
+    def test_count_can_be_skipped_and_bad_cursors_are_rejected(self):
+        response = self.staff_client.get('/api/auth/alerts/', {'pagination': 'cursor', 'count': 'false'})
+        self.assertNotIn('count', response.data)
+        self.assertEqual(len(response.data['results']), 1)
+
+        response = self.staff_client.get('/api/auth/alerts/', {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 404)
+
+
+class MapDeltaStreamTests(AlertTestMixin, TransactionTestCase):
+
+    async def test_snapshot_then_revisioned_deltas_and_resync(self):
+        socket = await self.connect('/ws/map/alerts/', self.staff, subprotocols=[MAP_DELTA_SUBPROTOCOL])
+        snapshot = await socket.receive_json_from()
+        self.assertEqual(snapshot['type'], 'map_snapshot')
+        self.assertEqual([(alert['id'], alert['rev']) for alert in snapshot['alerts']], [(str(self.alert.id), 0)])
+
+        device = await self.connect(f'/ws/location/{self.alert.id}/', self.user)
+        await device.send_json_to({
+            'type': 'location_update', 'location': {'latitude': 1.5, 'longitude': 2.5, 'accuracy': 5}
+        })
+        move = await socket.receive_json_from()
+        self.assertEqual(move['type'], 'map_delta')
+        self.assertEqual(move['changes'], [{
+            'op': 'move', 'id': str(self.alert.id), 'latitude': 1.5, 'longitude': 2.5, 'accuracy': 5.0, 'rev': 1
+        }])
+
+        alert = await PanicAlert.objects.aget(pk=self.alert.pk)
+        await sync_to_async(alert.resolve)()
+        remove = await socket.receive_json_from()
+        self.assertEqual(remove['changes'], [{'op': 'remove', 'id': str(self.alert.id), 'rev': 2}])
+
+        # A client that missed a revision asks for what changed since its last version
+        await socket.send_json_to({'type': 'resync', 'since': snapshot['version']})
+        resync = await socket.receive_json_from()
+        self.assertEqual(resync['type'], 'map_delta')
+        self.assertEqual(resync['changes'], [{'op': 'remove', 'id': str(self.alert.id), 'rev': 2}])
+
+        # Versions outside the resync window get a snapshot instead
+        stale = (timezone.now() - timedelta(days=30)).isoformat()
+        for since in (stale, 'not-a-version'):
+            await socket.send_json_to({'type': 'resync', 'since': since})
+            self.assertEqual((await socket.receive_json_from())['type'], 'map_snapshot')
+        await device.disconnect()
+        await socket.disconnect()
+
+    async def test_viewport_subscription_only_receives_changes_in_its_cells(self):
+        london = await PanicAlert.objects.acreate(
+            user=self.user, latitude=Decimal('51.5007'), longitude=Decimal('-0.1246')
+        )
+        socket = await self.connect('/ws/map/alerts/', self.staff, subprotocols=[MAP_DELTA_SUBPROTOCOL])
+        self.assertEqual((await socket.receive_json_from())['type'], 'map_snapshot')
+
+        await socket.send_json_to({'type': 'subscribe_viewport', 'bbox': '51.4,-0.3,51.6,0.1'})
+        view = await socket.receive_json_from()
+        self.assertEqual([alert['id'] for alert in view['alerts']], [str(london.id)])
+
+        for alert_id, latitude, longitude in ((self.alert.id, 1.5, 2.5), (london.id, 51.501, -0.125)):
+            device = await self.connect(f'/ws/location/{alert_id}/', self.user)
+            await device.send_json_to({
+                'type': 'location_update',
+                'location': {'latitude': latitude, 'longitude': longitude, 'accuracy': 5}
+            })
+            self.assertEqual((await device.receive_json_from())['type'], 'success')
+            await device.disconnect()
+
+        frames = await self.receive_all(socket)
+        self.assertEqual([change['id'] for frame in frames for change in frame['changes']], [str(london.id)])
+        await socket.disconnect()
+
+
+    async def test_move_across_cells_adds_and_removes_for_viewports(self):
+        sockets = {}
+        for name, bbox in (
+            ('london', '51.4,-0.3,51.6,0.1'), ('oxford', '51.7,-1.35,51.8,-1.15'), ('both', '51.4,-1.35,51.8,0.1')
+        ):
+            socket = await self.connect('/ws/map/alerts/', self.staff, subprotocols=[MAP_DELTA_SUBPROTOCOL])
+            await socket.send_json_to({'type': 'subscribe_viewport', 'bbox': bbox})
+            await self.receive_all(socket)
+            sockets[name] = socket
+
+        device = await self.connect(f'/ws/location/{self.alert.id}/', self.user)
+        await self.receive_all(device)
+        for latitude, longitude in ((51.5007, -0.1246), (51.752, -1.2577)):
+            await device.send_json_to({
+                'type': 'location_update',
+                'location': {'latitude': latitude, 'longitude': longitude, 'accuracy': 5}
+            })
+            self.assertEqual((await device.receive_json_from())['type'], 'success')
+        await device.disconnect()
+
+        changes = {}
+        for name, socket in sockets.items():
+            frames = await self.receive_all(socket)
+            changes[name] = [(change['op'], change['rev']) for frame in frames for change in frame['changes']]
+            if name == 'oxford':
+                record = frames[-1]['changes'][0]
+            await socket.disconnect()
+
+        self.assertEqual(changes['london'], [('add', 1), ('remove', 2)])
+        self.assertEqual(changes['oxford'], [('add', 2)])
+        self.assertEqual(changes['both'], [('add', 1), ('move', 2)])
+        self.assertEqual((record['user'], record['latitude'], record['status']), ('mobile', 51.752, 'active'))
+
+class MapAreaQueryTests(AlertTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.alerts = {
+            name: PanicAlert.objects.create(user=self.user, latitude=latitude, longitude=longitude)
+            for name, latitude, longitude in [
+                ('westminster', Decimal('51.5007292'), Decimal('-0.1246254')),
+                ('tower', Decimal('51.5081124'), Decimal('-0.0759493')),
+                ('paris', Decimal('48.8583701'), Decimal('2.2944813')),
+                ('fiji', Decimal('-17.7134000'), Decimal('179.9000000')),
+            ]
+        }
+
+    def map_ids(self, **params):
+        response = self.staff_client.get('/api/auth/alerts/map/', params)
+        self.assertEqual(response.status_code, 200)
+        return {alert['id'] for alert in response.data['alerts']}
+
+    def ids(self, *names):
+        return {str(self.alerts[name].id) for name in names}
+
+    def test_geohash_is_stored_with_the_position(self):
+        self.assertEqual(geo.geohash_encode(57.64911, 10.40744), 'u4pruydqq')
+        self.assertTrue(self.alerts['westminster'].geohash.startswith('gcpuv'))
+
+    def test_bbox_and_radius_queries(self):
+        self.assertEqual(self.map_ids(bbox='51.4,-0.3,51.6,0.1'), self.ids('westminster', 'tower'))
+        # Boxes with west > east cross the antimeridian
+        self.assertEqual(self.map_ids(bbox='-20,170,-10,-170'), self.ids('fiji'))
+        # Westminster and the Tower are ~3.5 km apart
+        self.assertEqual(self.map_ids(lat=51.5007, lng=-0.1246, radius=2000), self.ids('westminster'))
+        self.assertEqual(self.map_ids(lat=51.5007, lng=-0.1246, radius=5000), self.ids('westminster', 'tower'))
+
+    def test_invalid_area_is_rejected(self):
+        response = self.staff_client.get('/api/auth/alerts/map/', {'bbox': '95,0,96,1'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_zoomed_out_map_returns_clusters(self):
+        response = self.staff_client.get('/api/auth/alerts/map/', {'zoom': 4})
+
+        self.assertTrue(response.data['clustered'])
+        self.assertEqual(response.data['count'], 5)
+        london = response.data['clusters'][0]
+        self.assertEqual((london['geohash'], london['count']), ('gc', 2))
+        self.assertAlmostEqual(london['latitude'], (51.5007292 + 51.5081124) / 2)
+        self.assertEqual(len(response.data['clusters']), 4)
+
+        # Zoomed in far enough, the same query lists alerts again
+        response = self.staff_client.get('/api/auth/alerts/map/', {'zoom': 15, 'bbox': '51.4,-0.3,51.6,0.1'})
+        self.assertFalse(response.data['clustered'])
+        self.assertEqual(response.data['count'], 2)
+
+
+class DashboardStatsTests(AlertTestMixin, TestCase):
+
+    def test_each_table_is_read_once(self):
+        UserProfile.objects.filter(user=self.staff).update(is_online=True)
+        Message.objects.create(user=self.user, subject='Help', content='...')
+        Message.objects.create(user=self.user, subject='Thanks', content='...', is_read=True)
+        PanicAlert.objects.create(user=self.user, latitude=1, longitude=2).resolve()
+
+        with self.assertNumQueries(4):
+            stats = dashboard_stats()
+
+        self.assertEqual(stats, {
+            'total_users': 2, 'active_users': 1, 'new_users_today': 2,
+            'total_messages': 2, 'unread_messages': 1, 'messages_today': 2,
+            'system_notifications': 0,
+            'total_alerts': 2, 'active_alerts': 1, 'alerts_today': 2
+        })
+
+
+class AlertRollupTests(AlertTestMixin, TestCase):
+
+    def buckets(self):
+        return {
+            (rollup.status, rollup.priority): rollup.count
+            for rollup in AlertHourlyRollup.objects.filter(count__gt=0)
+        }
+
+    def test_buckets_follow_creates_changes_and_deletes(self):
+        other = PanicAlert.objects.create(user=self.user, latitude=1, longitude=2, priority=1)
+        self.assertEqual(self.buckets(), {('active', 4): 1, ('active', 1): 1})
+
+        self.alert.resolve()
+        other.delete()
+        self.assertEqual(self.buckets(), {('resolved', 4): 1})
+
+        AlertHourlyRollup.objects.all().delete()
+        AlertHourlyRollup.objects.rebuild()
+        self.assertEqual(self.buckets(), {('resolved', 4): 1})
+
+    def test_stale_instances_move_the_alert_from_its_stored_bucket(self):
+        by_operator = PanicAlert.objects.get(pk=self.alert.pk)
+        by_owner = PanicAlert.objects.get(pk=self.alert.pk)
+
+        with mock.patch('beacon_auth.models.record_stats_delta') as record_stats_delta:
+            by_operator.acknowledge(self.staff)
+            by_owner.cancel()
+
+        self.assertEqual(self.buckets(), {('canceled', 4): 1})
+        self.assertEqual(
+            [call.kwargs for call in record_stats_delta.call_args_list if 'active_alerts' in call.kwargs],
+            [{'active_alerts': -1}]
+        )
+
+    def test_timeseries_fills_empty_hours(self):
+        hour = rollup_hour(self.alert.created_at)
+        start = hour - timedelta(hours=2)
+        points = alert_timeseries(start, hour + timedelta(hours=1), interval='hour')
+
+        self.assertEqual([point['count'] for point in points], [0, 0, 1])
+        with self.assertRaises(ValueError):
+            alert_timeseries(start, start, interval='hour')
+
+
+class LiveStatsTests(SimpleTestCase):
+
+    def test_deltas_are_applied_once_and_framed_as_differences(self):
+        stats = LiveStats(lambda: {'total_alerts': 3, 'active_alerts': 1}, resync_interval=300)
+        version, sent = stats.snapshot()
+
+        stats.apply('a', {'total_alerts': 1, 'active_alerts': 1})
+        stats.apply('a', {'total_alerts': 1, 'active_alerts': 1})
+        stats.apply('b', {'active_alerts': -1})
+
+        text, version, sent = stats.frame(version, sent)
+        frame = json.loads(text)
+        self.assertEqual(frame['stats'], {'total_alerts': 4, 'active_alerts': 1})
+        self.assertEqual(frame['deltas'], {'total_alerts': 1})
+        self.assertEqual(stats.frame(version, sent)[0], None)
+
+
+@override_settings(DASHBOARD_STATS_DEBOUNCE_SECONDS=0.1)
+class DashboardSocketTests(AlertTestMixin, TransactionTestCase):
+
+    async def test_committed_changes_reach_dashboards_as_deltas(self):
+        socket = await self.connect('/ws/admin/dashboard/', self.staff)
+        self.assertEqual((await socket.receive_json_from())['type'], 'dashboard_stats')
+        # Deltas of the alert created in setUp may still be on their way
+        await self.receive_all(socket)
+
+        await PanicAlert.objects.acreate(user=self.user, latitude=1, longitude=2)
+
+        frames = await self.receive_all(socket)
+        self.assertEqual([frame['type'] for frame in frames], ['stats_updated'])
+        self.assertEqual(frames[0]['deltas'], {'total_alerts': 1, 'active_alerts': 1, 'alerts_today': 1})
+        await socket.disconnect()
+
+
+class AlertStreamSocketTests(AlertTestMixin, TransactionTestCase):
+
+    async def test_streams_share_one_socket_and_tag_their_frames(self):
+        socket = await self.connect(f'/ws/alerts/{self.alert.id}/stream/', self.user)
+        frames = await self.receive_all(socket)
+        self.assertIn('alert', {frame.get('stream') for frame in frames})
+
+        await socket.send_json_to({
+            'stream': 'location', 'type': 'location_update',
+            'location': {'latitude': 1.5, 'longitude': 2.5, 'accuracy': 5}
+        })
+        frames = await self.receive_all(socket)
+        self.assertEqual(
+            [(frame['stream'], frame['type']) for frame in frames],
+            [('location', 'success'), ('location', 'location_updated')]
+        )
+
+        await socket.send_json_to({'stream': 'nope'})
+        self.assertEqual((await socket.receive_json_from())['message'], 'Unknown stream: nope')
+        await socket.disconnect()
+
+    async def test_other_users_are_refused(self):
+        stranger = await sync_to_async(User.objects.create_user)('stranger', password='pass')
+        communicator = WebsocketCommunicator(
+            URLRouter(websocket_urlpatterns), f'/ws/alerts/{self.alert.id}/stream/'
+        )
+        communicator.scope['user'] = stranger
+        connected, code = await communicator.connect()
+        self.assertFalse(connected)
+        self.assertEqual(code, 4003)
+
+
+class AlertAccessCacheTests(AlertTestMixin, TestCase):
+
+    def test_access_is_cached_until_the_alert_is_saved(self):
+        alert_access_cache.clear()
+        with self.assertNumQueries(1):
+            load_alert_access(self.alert.id)
+            access = load_alert_access(self.alert.id)
+        self.assertEqual((access.owner_id, access.status), (self.user.id, 'active'))
+
+        self.alert.resolve()
+        self.assertEqual(load_alert_access(self.alert.id).status, 'resolved')
+
+
+class AuditLogTests(AlertTestMixin, TransactionTestCase):
+
+    def test_records_are_queued_on_commit(self):
+        with mock.patch.object(audit_log, 'write') as write:
+            with transaction.atomic():
+                log_activity(self.user, 'login', 'inside')
+                write.assert_not_called()
+            write.assert_called_once()
+        self.assertFalse(UserActivity.objects.exists())
+
+    def test_writer_stores_records_in_batches_and_on_close(self):
+        writer = AuditLogWriter(max_queue=10, batch_size=2, flush_interval=5)
+        with mock.patch.object(UserActivity.objects, 'bulk_create', wraps=UserActivity.objects.bulk_create) as store:
+            for i in range(3):
+                writer.write(UserActivity(user=self.user, activity_type='login', description=str(i)))
+            writer.close()
+        self.assertEqual([len(call.args[0]) for call in store.call_args_list], [2, 1])
+        self.assertEqual(
+            sorted(UserActivity.objects.values_list('description', flat=True)), ['0', '1', '2']
+        )
+
+
+@override_settings(AUDIT_LOG_ASYNC=False)
+class PanicCreateTests(AlertTestMixin, TestCase):
+
+    def test_alert_is_published_once_committed(self):
+        with mock.patch('beacon_auth.views.publish') as publish:
+            with self.captureOnCommitCallbacks() as callbacks:
+                response = self.client.post('/api/auth/panic/create/', {'latitude': 3, 'longitude': 4}, format='json')
+                publish.assert_not_called()
+            for callback in callbacks:
+                callback()
+
+        self.assertEqual(response.status_code, 201)
+        alert = PanicAlert.objects.get(pk=response.data['alert_id'])
+        self.assertEqual((alert.location_count, alert.location_history.count()), (1, 1))
+        messages = publish.call_args.args[0]
+        self.assertIn('new_panic_alert', [event['type'] for _, event in messages])
+        self.assertEqual(publish.call_args.kwargs['metric'], 'panic_create_broadcast')
+
+    def test_failed_create_leaves_nothing_behind(self):
+        with mock.patch('beacon_auth.views.publish') as publish, \
+                mock.patch.object(AlertLocation, 'save', side_effect=RuntimeError('disk full')):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post('/api/auth/panic/create/', {'latitude': 3, 'longitude': 4}, format='json')
+
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(PanicAlert.objects.filter(user=self.user).count(), 1)
+        self.assertFalse(UserActivity.objects.exists())
+        publish.assert_not_called()
+
+
+@override_settings(AUDIT_LOG_ASYNC=False)
+class AlertActionEventTests(AlertTestMixin, TransactionTestCase):
+
+    async def test_rest_actions_reach_the_owner_and_alert_watchers(self):
+        owner = await self.connect(f'/ws/user/{self.user.id}/', self.user)
+        watcher = await self.connect(f'/ws/alerts/{self.alert.id}/', self.staff)
+        await self.receive_all(owner)
+        await self.receive_all(watcher)
+
+        url = f'/api/auth/alerts/{self.alert.id}/'
+        response = await sync_to_async(self.staff_client.post)(url + 'acknowledge/')
+        self.assertEqual(response.status_code, 200)
+        response = await sync_to_async(self.staff_client.post)(url + 'resolve/', {'notes': 'done'})
+        self.assertEqual(response.status_code, 200)
+
+        frames = await self.receive_all(owner)
+        self.assertEqual(
+            [(frame['type'], frame['event']) for frame in frames],
+            [('alert_status_update', 'acknowledged'), ('alert_status_update', 'resolved')]
+        )
+        self.assertEqual(frames[1]['alert']['status'], 'resolved')
+        frames = await self.receive_all(watcher)
+        self.assertEqual(
+            [(frame['type'], frame['event'], frame['operator']) for frame in frames],
+            [('alert_updated', 'acknowledged', 'operator'), ('alert_updated', 'resolved', 'operator')]
+        )
+        await owner.disconnect()
+        await watcher.disconnect()
+
+
+class PreEncodedBroadcastTests(AlertTestMixin, TransactionTestCase):
+
+    async def test_group_frames_are_forwarded_verbatim(self):
+        sockets = [await self.connect(f'/ws/alerts/{self.alert.id}/', user) for user in (self.user, self.staff)]
+        for socket in sockets:
+            await self.receive_all(socket)
+
+        messages = await sync_to_async(alert_event_messages)('updated', self.alert, 'operator')
+        group, event = next((group, event) for group, event in messages if group == f'alert_{self.alert.id}')
+        with mock.patch('json.dumps', side_effect=AssertionError('re-encoded')):
+            await get_channel_layer().group_send(group, event)
+            received = [await socket.receive_from() for socket in sockets]
+
+        self.assertEqual(received, [event['text'], event['text']])
+        for socket in sockets:
+            await socket.disconnect()
@@ -0,0 +1,220 @@
+"""
+Location ingest helpers shared by the REST views and the WebSocket consumers.
+"""
+import asyncio
+import logging
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import transaction
+from django.db.models import Case, F, Q, Value, When
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from .geo import geohash_encode, haversine_distance
+from .models import PanicAlert, AlertLocation
+
+logger = logging.getLogger(__name__)
+
+
+LOCATION_FIELDS = [
+    'latitude', 'longitude', 'accuracy', 'altitude', 'speed',
+    'heading', 'provider', 'battery_level', 'timestamp'
+]
+
+
+def build_location(alert, location_data):
+    """Build an unsaved AlertLocation from validated location data"""
+    fields = {
+        field: location_data[field]
+        for field in LOCATION_FIELDS
+        if location_data.get(field) is not None
+    }
+    return AlertLocation(alert=alert, **fields)
+
+
+def is_redundant_fix(previous, location):
+    """
+    Check whether a fix adds nothing over the previously stored one: it lies
+    within the accuracy-aware jitter radius and the heartbeat interval has not
+    elapsed yet.
+    """
+    if previous is None:
+        return False
+
+    elapsed = (location.timestamp - previous.timestamp).total_seconds()
+    if elapsed >= settings.LOCATION_FILTER_MAX_INTERVAL_SECONDS:
+        return False
+
+    radius = max(
+        settings.LOCATION_FILTER_MIN_DISTANCE,
+        settings.LOCATION_FILTER_ACCURACY_FACTOR * max(previous.accuracy or 0, location.accuracy or 0)
+    )
+    distance = haversine_distance(
+        float(previous.latitude), float(previous.longitude),
+        float(location.latitude), float(location.longitude)
+    )
+    return distance < radius
+
+
+def filter_locations(previous, locations):
+    """Drop redundant fixes from an ordered list, comparing each to the last kept fix"""
+    kept = []
+    for location in locations:
+        if not is_redundant_fix(previous, location):
+            kept.append(location)
+            previous = location
+    return kept
+
+
+def get_last_stored_location(alert_id):
+    """Get the most recent stored fix for an alert, or None"""
+    return AlertLocation.objects.filter(alert_id=alert_id).only(
+        'latitude', 'longitude', 'accuracy', 'timestamp'
+    ).order_by('-timestamp', '-id').first()
+
+
+def touch_alert(alert_id, seen_at=None):
+    """Refresh an alert's last seen time without storing a fix"""
+    PanicAlert.objects.filter(pk=alert_id).update(last_seen_at=seen_at or timezone.now())
+
+
+def record_locations(alert, locations_data):
+    """
+    Store an ordered list of validated fixes with a single bulk insert and
+    move the alert's head position once, to the newest (last) fix.
+    
+    With LOCATION_INGEST_FILTER enabled, fixes that only repeat the previous
+    stored fix are dropped; if nothing is left, only the alert's last seen
+    time is refreshed. Returns the stored fixes.
+    """
+    locations = [build_location(alert, data) for data in locations_data]
+    # Fixes carry the device's timestamps; the newest one becomes the alert head
+    locations.sort(key=lambda location: location.timestamp)
+
+    if settings.LOCATION_INGEST_FILTER:
+        locations = filter_locations(get_last_stored_location(alert.pk), locations)
+        if not locations:
+            touch_alert(alert.pk)
+            return []
+
+    return store_locations(alert, locations)
+
+
+def store_locations(alert, locations, require_active=False):
+    """
+    Persist already-built AlertLocation objects and move the alert head. With
+    ``require_active``, nothing is stored (and [] returned) unless the alert
+    is still active in the database.
+    """
+    if not locations:
+        return []
+
+    for location in locations:
+        location.geohash = geohash_encode(location.latitude, location.longitude)
+
+    with transaction.atomic():
+        if len(locations) == 1:
+            locations[0].save()
+        else:
+            AlertLocation.objects.bulk_create(locations)
+
+        newest = max(locations, key=lambda location: location.timestamp)
+        # Fixes older than the stored head (a backlog uploaded after the live
+        # socket resumed) are kept as history but leave the head alone
+        is_head = Q(last_location_at__isnull=True) | Q(last_location_at__lte=newest.timestamp)
+
+        def head(field, value):
+            value = Value(value, output_field=PanicAlert._meta.get_field(field))
+            return Case(When(is_head, then=value), default=F(field))
+
+        head_fields = {
+            'latitude': newest.latitude,
+            'longitude': newest.longitude,
+            'location_accuracy': newest.accuracy,
+            'geohash': newest.geohash,
+            'last_seen_at': newest.timestamp,
+        }
+        alert.updated_at = timezone.now()
+        alerts = PanicAlert.objects.filter(pk=alert.pk)
+        if require_active:
+            alerts = alerts.filter(status__in=PanicAlert.ACTIVE_STATUSES)
+        updated = alerts.update(
+            **{field: head(field, value) for field, value in head_fields.items()},
+            updated_at=alert.updated_at,
+            location_count=F('location_count') + len(locations),
+            last_location_at=Coalesce(Greatest('last_location_at', newest.timestamp), newest.timestamp)
+        )
+        if require_active and not updated:
+            # The alert stopped being active since the caller last checked
+            transaction.set_rollback(True)
+            return []
+
+    if alert.last_location_at is None or newest.timestamp >= alert.last_location_at:
+        for field, value in head_fields.items():
+            setattr(alert, field, value)
+        alert.last_location_at = newest.timestamp
+
+    return locations
+
+
+class LocationWriteBuffer:
+    """
+    Per-process write-behind buffer for WebSocket location fixes.
+
+    Fixes are kept in memory per alert and written with one bulk insert
+    once ``max_fixes`` are pending or ``flush_interval`` seconds have passed
+    since the first pending fix, whichever comes first. Callers check that
+    the alert is active before adding a fix; once added, it is written even
+    if the alert is resolved or cancelled before the flush.
+    """
+
+    def __init__(self, max_fixes, flush_interval):
+        self.max_fixes = max_fixes
+        self.flush_interval = flush_interval
+        self._pending = {}
+        self._timers = {}
+
+    async def add(self, alert_id, location):
+        """Queue an unsaved AlertLocation for the given alert"""
+        alert_id = str(alert_id)
+        pending = self._pending.setdefault(alert_id, [])
+        pending.append(location)
+
+        if len(pending) >= self.max_fixes:
+            await self.flush(alert_id)
+        elif alert_id not in self._timers:
+            loop = asyncio.get_running_loop()
+            self._timers[alert_id] = loop.call_later(
+                self.flush_interval,
+                lambda: asyncio.ensure_future(self.flush(alert_id))
+            )
+
+    async def flush(self, alert_id):
+        """Write all pending fixes for an alert, returning how many were stored"""
+        alert_id = str(alert_id)
+        timer = self._timers.pop(alert_id, None)
+        if timer:
+            timer.cancel()
+
+        locations = self._pending.pop(alert_id, None)
+        if not locations:
+            return 0
+
+        try:
+            return await self._store(alert_id, locations)
+        except Exception as e:
+            logger.error(f"Error flushing buffered locations for alert {alert_id}: {e}")
+            return 0
+
+    @database_sync_to_async
+    def _store(self, alert_id, locations):
+        try:
+            alert = PanicAlert.objects.get(id=alert_id)
+        except ObjectDoesNotExist:
+            return 0
+
+        for location in locations:
+            location.alert = alert
+        return len(store_locations(alert, locations))
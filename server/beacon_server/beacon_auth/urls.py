@@ -25,6 +25,8 @@ urlpatterns = [
     
     # Dashboard
     path('dashboard/stats/', views.DashboardStatsView.as_view(), name='dashboard-stats'),
+    path('metrics/latency/', views.LatencyMetricsView.as_view(), name='latency-metrics'),
+    path('metrics/broadcasts/', views.BroadcastMetricsView.as_view(), name='broadcast-metrics'),
     
     # ======================== PANIC ALERT ENDPOINTS ========================
     
@@ -32,12 +34,14 @@ urlpatterns = [
     path('alerts/', views.PanicAlertListView.as_view(), name='alert-list'),
     path('alerts/<uuid:pk>/', views.PanicAlertDetailView.as_view(), name='alert-detail'),
     path('alerts/stats/', views.PanicAlertStatsView.as_view(), name='alert-stats'),
+    path('alerts/stats/timeseries/', views.PanicAlertTimeSeriesView.as_view(), name='alert-stats-timeseries'),
     
     # Alert actions
     path('alerts/<uuid:alert_id>/acknowledge/', views.acknowledge_alert, name='acknowledge-alert'),
     path('alerts/<uuid:alert_id>/resolve/', views.resolve_alert, name='resolve-alert'),
     path('alerts/<uuid:alert_id>/cancel/', views.cancel_alert, name='cancel-alert'),
     path('alerts/<uuid:alert_id>/location/', views.update_alert_location, name='update-alert-location'),
+    path('alerts/<uuid:alert_id>/location/batch/', views.update_alert_location_batch, name='update-alert-location-batch'),
     
     # Map and mobile endpoints
     path('alerts/map/', views.get_alerts_for_map, name='alerts-for-map'),
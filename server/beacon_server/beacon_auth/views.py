@@ -4,12 +4,16 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth import authenticate
+from django.conf import settings
 from django.contrib.auth.models import User
 from django.utils import timezone
-from django.db.models import Count, Q
+from django.utils.dateparse import parse_datetime
+from django.db import transaction
+from django.db.models import Q
 from django.shortcuts import get_object_or_404
 from datetime import datetime, timedelta
 import ipaddress
+import time
 
 from .models import (
     UserProfile, Message, UserActivity, SystemNotification,
@@ -26,6 +30,15 @@ from .serializers import (
     AlertMediaSerializer, AlertMediaCreateSerializer, EmergencyContactSerializer,
     AlertNotificationSerializer, PanicAlertStatsSerializer
 )
+from .broadcast import broadcast_queue
+from .events import alert_event_messages, location_messages, publish
+from .geo import simplify_track
+from .mapping import get_map_alerts, get_map_clusters, is_clustered, parse_map_area, parse_zoom
+from .audit import log_activity
+from .metrics import latency
+from .pagination import KeysetPaginationMixin
+from .stats import alert_stats, alert_timeseries, dashboard_stats
+from .tracking import build_location, record_locations, store_locations
 
 class UserRegistrationView(generics.CreateAPIView):
     queryset = User.objects.all()
@@ -49,7 +62,7 @@ class UserLoginView(APIView):
                 profile.update_last_seen()
                 
                 # Log activity
-                UserActivity.objects.create(
+                log_activity(
                     user=user,
                     activity_type='login',
                     description=f'User {username} logged in',
@@ -95,7 +108,7 @@ class UserLogoutView(APIView):
             profile.update_last_seen()
             
             # Log activity
-            UserActivity.objects.create(
+            log_activity(
                 user=request.user,
                 activity_type='logout',
                 description=f'User {request.user.username} logged out',
@@ -146,7 +159,7 @@ class UserListView(generics.ListAPIView):
         
         return queryset
 
-class MessageListView(generics.ListCreateAPIView):
+class MessageListView(KeysetPaginationMixin, generics.ListCreateAPIView):
     serializer_class = MessageSerializer
     permission_classes = [permissions.IsAuthenticated]
     
@@ -167,7 +180,7 @@ class MessageListView(generics.ListCreateAPIView):
         message = serializer.save(user=self.request.user)
         
         # Log activity
-        UserActivity.objects.create(
+        log_activity(
             user=self.request.user,
             activity_type='message_sent',
             description=f'Message sent: {message.subject}',
@@ -207,7 +220,7 @@ class MessageDetailView(generics.RetrieveUpdateDestroyAPIView):
         
         # Log activity for admins
         if self.request.user.is_staff:
-            UserActivity.objects.create(
+            log_activity(
                 user=self.request.user,
                 activity_type='message_sent',
                 description=f'Message updated: {message.subject}',
@@ -230,42 +243,32 @@ class DashboardStatsView(APIView):
         if not request.user.is_staff:
             return Response({'error': 'Access denied'}, status=status.HTTP_403_FORBIDDEN)
         
-        today = timezone.now().date()
-        yesterday = today - timedelta(days=1)
-        
-        # Calculate statistics
-        total_users = User.objects.count()
-        active_users = UserProfile.objects.filter(is_online=True).count()
-        total_messages = Message.objects.count()
-        unread_messages = Message.objects.filter(is_read=False).count()
-        messages_today = Message.objects.filter(created_at__date=today).count()
-        new_users_today = User.objects.filter(date_joined__date=today).count()
-        system_notifications = SystemNotification.objects.filter(is_active=True).count()
-        
-        # Panic alert statistics
-        total_alerts = PanicAlert.objects.count()
-        active_alerts = PanicAlert.objects.filter(
-            status__in=['active', 'acknowledged', 'responding']
-        ).count()
-        alerts_today = PanicAlert.objects.filter(created_at__date=today).count()
-        
-        stats = {
-            'total_users': total_users,
-            'active_users': active_users,
-            'total_messages': total_messages,
-            'unread_messages': unread_messages,
-            'messages_today': messages_today,
-            'new_users_today': new_users_today,
-            'system_notifications': system_notifications,
-            'total_alerts': total_alerts,
-            'active_alerts': active_alerts,
-            'alerts_today': alerts_today
-        }
+        stats = dashboard_stats()
         
         serializer = DashboardStatsSerializer(stats)
         return Response(serializer.data)
 
-class UserActivityListView(generics.ListAPIView):
+class LatencyMetricsView(APIView):
+    """Latency summaries recorded by this server process"""
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def get(self, request):
+        if not request.user.is_staff:
+            return Response({'error': 'Access denied'}, status=status.HTTP_403_FORBIDDEN)
+        
+        return Response(latency.summaries())
+
+class BroadcastMetricsView(APIView):
+    """Outbound broadcast queue counters for this server process"""
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def get(self, request):
+        if not request.user.is_staff:
+            return Response({'error': 'Access denied'}, status=status.HTTP_403_FORBIDDEN)
+        
+        return Response(broadcast_queue.stats())
+
+class UserActivityListView(KeysetPaginationMixin, generics.ListAPIView):
     serializer_class = UserActivitySerializer
     permission_classes = [permissions.IsAuthenticated]
     
@@ -317,7 +320,7 @@ def resolve_message(request, message_id):
 
 # ======================== PANIC ALERT VIEWS ========================
 
-class PanicAlertListView(generics.ListCreateAPIView):
+class PanicAlertListView(KeysetPaginationMixin, generics.ListCreateAPIView):
     """List all panic alerts or create a new one"""
     permission_classes = [permissions.IsAuthenticated]
     
@@ -327,7 +330,9 @@ class PanicAlertListView(generics.ListCreateAPIView):
             queryset = PanicAlert.objects.select_related('user', 'assigned_operator').all()
         else:
             # Regular users can only see their own alerts
-            queryset = PanicAlert.objects.filter(user=self.request.user)
+            queryset = PanicAlert.objects.select_related('user', 'assigned_operator').filter(
+                user=self.request.user
+            )
         
         # Filter by status
         status_filter = self.request.query_params.get('status', None)
@@ -358,7 +363,7 @@ class PanicAlertListView(generics.ListCreateAPIView):
         alert = serializer.save()
         
         # Log activity
-        UserActivity.objects.create(
+        log_activity(
             user=self.request.user,
             activity_type='panic_alert',
             description=f'Panic alert created: {alert.get_alert_type_display()}',
@@ -366,10 +371,8 @@ class PanicAlertListView(generics.ListCreateAPIView):
             user_agent=self.request.META.get('HTTP_USER_AGENT', '')
         )
         
-        # Broadcast new alert to admin dashboard via WebSocket
-        from .consumers import broadcast_new_panic_alert
-        alert_data = PanicAlertListSerializer(alert).data
-        broadcast_new_panic_alert(alert_data)
+        # Broadcast new alert to admin consoles, the user and maps
+        publish(alert_event_messages('created', alert), metric='panic_create_broadcast')
         
         return Response({
             'success': True,
@@ -409,7 +412,7 @@ class PanicAlertDetailView(generics.RetrieveUpdateAPIView):
         alert = serializer.save()
         
         # Log activity
-        UserActivity.objects.create(
+        log_activity(
             user=self.request.user,
             activity_type='panic_alert',
             description=f'Panic alert updated: {alert.id} - Status: {alert.get_status_display()}',
@@ -417,7 +420,9 @@ class PanicAlertDetailView(generics.RetrieveUpdateAPIView):
             user_agent=self.request.META.get('HTTP_USER_AGENT', '')
         )
         
-        # TODO: Trigger real-time notifications to admin panel
+        # Broadcast the update to admin consoles, alert watchers, the user and maps
+        operator = alert.assigned_operator.username if alert.assigned_operator else None
+        publish(alert_event_messages('updated', alert, operator))
     
     def get_client_ip(self, request):
         x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
@@ -427,10 +432,11 @@ class PanicAlertDetailView(generics.RetrieveUpdateAPIView):
             ip = request.META.get('REMOTE_ADDR')
         return ip
 
-class AlertLocationListView(generics.ListCreateAPIView):
+class AlertLocationListView(KeysetPaginationMixin, generics.ListCreateAPIView):
     """List or create location updates for a panic alert"""
     serializer_class = AlertLocationSerializer
     permission_classes = [permissions.IsAuthenticated]
+    keyset_field = 'timestamp'
     
     def get_queryset(self):
         alert_id = self.kwargs['alert_id']
@@ -447,21 +453,66 @@ class AlertLocationListView(generics.ListCreateAPIView):
             return AlertLocationCreateSerializer
         return AlertLocationSerializer
     
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.request.method == 'POST':
+            context['alert'] = self.get_alert()
+        return context
+    
+    def get_alert(self):
+        if not hasattr(self, 'alert'):
+            self.alert = get_object_or_404(PanicAlert, id=self.kwargs['alert_id'])
+        return self.alert
+    
+    def list(self, request, *args, **kwargs):
+        if request.query_params.get('simplify') != 'true':
+            return super().list(request, *args, **kwargs)
+        
+        # Simplified polyline: ?simplify=true&tolerance=<metres>&max_points=<n>
+        try:
+            tolerance = float(request.query_params.get('tolerance', 0)) or None
+            max_points = int(request.query_params.get('max_points', 0)) or None
+        except ValueError:
+            return Response(
+                {'error': 'tolerance and max_points must be numbers'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if tolerance is None and max_points is None:
+            max_points = settings.TRACK_SIMPLIFY_MAX_POINTS
+        
+        # Stream plain tuples from the cursor instead of building model instances
+        rows = self.get_queryset().order_by('timestamp', 'id').values_list(
+            'latitude', 'longitude', 'timestamp'
+        ).iterator(chunk_size=2000)
+        points, original_count = simplify_track(rows, tolerance=tolerance, max_points=max_points)
+        
+        return Response({
+            'simplified': True,
+            'tolerance': tolerance,
+            'max_points': max_points,
+            'original_count': original_count,
+            'count': len(points),
+            # Fraction of fixes removed by simplification
+            'reduction_ratio': round(1 - len(points) / original_count, 4) if original_count else 0.0,
+            'points': [
+                {
+                    'latitude': float(latitude),
+                    'longitude': float(longitude),
+                    'timestamp': timestamp.isoformat()
+                }
+                for latitude, longitude, timestamp in points
+            ]
+        })
+    
     def perform_create(self, serializer):
-        alert_id = self.kwargs['alert_id']
-        alert = get_object_or_404(PanicAlert, id=alert_id)
+        alert = self.get_alert()
         
         # Check permissions
         if alert.user != self.request.user:
             raise permissions.PermissionDenied("You can only update your own alerts")
         
-        location = serializer.save(alert=alert)
-        
-        # Update the main alert's location if this is the most recent
-        alert.latitude = location.latitude
-        alert.longitude = location.longitude
-        alert.location_accuracy = location.accuracy
-        alert.save(update_fields=['latitude', 'longitude', 'location_accuracy', 'updated_at'])
+        # Store the fix and move the alert head through the shared ingest path
+        serializer.instance = store_locations(alert, [build_location(alert, serializer.validated_data)])[0]
 
 class AlertMediaListView(generics.ListCreateAPIView):
     """List or upload media files for a panic alert"""
@@ -522,64 +573,51 @@ class PanicAlertStatsView(APIView):
         if not request.user.is_staff:
             return Response({'error': 'Access denied'}, status=status.HTTP_403_FORBIDDEN)
         
-        today = timezone.now().date()
-        week_ago = today - timedelta(days=7)
-        month_ago = today - timedelta(days=30)
-        
-        # Calculate statistics
-        total_alerts = PanicAlert.objects.count()
-        active_alerts = PanicAlert.objects.filter(
-            status__in=['active', 'acknowledged', 'responding']
-        ).count()
-        acknowledged_alerts = PanicAlert.objects.filter(status='acknowledged').count()
-        resolved_alerts = PanicAlert.objects.filter(status='resolved').count()
-        alerts_today = PanicAlert.objects.filter(created_at__date=today).count()
-        alerts_this_week = PanicAlert.objects.filter(created_at__date__gte=week_ago).count()
-        alerts_this_month = PanicAlert.objects.filter(created_at__date__gte=month_ago).count()
-        
-        # Calculate average response time
-        acknowledged_alerts_with_time = PanicAlert.objects.filter(
-            status__in=['acknowledged', 'resolved'],
-            acknowledged_at__isnull=False
-        )
-        
-        if acknowledged_alerts_with_time.exists():
-            total_response_time = sum([
-                (alert.acknowledged_at - alert.created_at).total_seconds()
-                for alert in acknowledged_alerts_with_time
-            ])
-            average_response_time = total_response_time / acknowledged_alerts_with_time.count()
-        else:
-            average_response_time = 0
-        
-        # Alert types breakdown
-        alert_types = PanicAlert.objects.values('alert_type').annotate(
-            count=Count('alert_type')
-        )
-        alert_types_breakdown = {item['alert_type']: item['count'] for item in alert_types}
-        
-        # Priority breakdown
-        priorities = PanicAlert.objects.values('priority').annotate(
-            count=Count('priority')
-        )
-        priority_breakdown = {str(item['priority']): item['count'] for item in priorities}
-        
-        stats = {
-            'total_alerts': total_alerts,
-            'active_alerts': active_alerts,
-            'acknowledged_alerts': acknowledged_alerts,
-            'resolved_alerts': resolved_alerts,
-            'alerts_today': alerts_today,
-            'alerts_this_week': alerts_this_week,
-            'alerts_this_month': alerts_this_month,
-            'average_response_time': average_response_time,
-            'alert_types_breakdown': alert_types_breakdown,
-            'priority_breakdown': priority_breakdown
-        }
+        stats = alert_stats()
         
         serializer = PanicAlertStatsSerializer(stats)
         return Response(serializer.data)
 
+class PanicAlertTimeSeriesView(APIView):
+    """Get alert counts per hour or day for charting"""
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def get(self, request):
+        if not request.user.is_staff:
+            return Response({'error': 'Access denied'}, status=status.HTTP_403_FORBIDDEN)
+        
+        # ?interval=hour|day&start=<iso>&end=<iso>&alert_type=&priority=
+        interval = request.query_params.get('interval', 'day')
+        try:
+            end = self.parse_time('end') or timezone.now()
+            start = self.parse_time('start') or end - timedelta(days=1 if interval == 'hour' else 30)
+            points = alert_timeseries(
+                start, end, interval,
+                alert_type=request.query_params.get('alert_type'),
+                priority=request.query_params.get('priority')
+            )
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        return Response({
+            'success': True,
+            'interval': interval,
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'points': points
+        })
+    
+    def parse_time(self, name):
+        value = self.request.query_params.get(name)
+        if not value:
+            return None
+        moment = parse_datetime(value)
+        if moment is None:
+            raise ValueError(f'{name} must be an ISO 8601 date and time')
+        if timezone.is_naive(moment):
+            moment = timezone.make_aware(moment)
+        return moment
+
 # ======================== PANIC ALERT ENDPOINTS FOR API ========================
 
 @api_view(['GET'])
@@ -589,34 +627,27 @@ def get_alerts_for_map(request):
     if not request.user.is_staff:
         return Response({'error': 'Access denied'}, status=status.HTTP_403_FORBIDDEN)
     
+    # Optional area (?bbox=south,west,north,east or ?lat=&lng=&radius=<metres>) and zoom level
+    try:
+        area = parse_map_area(request.query_params)
+        zoom = parse_zoom(request.query_params)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
     try:
-        alerts = PanicAlert.objects.filter(
-            status__in=['active', 'acknowledged', 'responding'],
-            latitude__isnull=False,
-            longitude__isnull=False
-        ).select_related('user', 'assigned_operator')
-        
-        alerts_data = []
-        for alert in alerts:
-            alert_data = {
-                'id': str(alert.id),
-                'user': alert.user.username,
-                'status': alert.status,
-                'alert_type': alert.alert_type,
-                'priority': alert.priority,
-                'latitude': float(alert.latitude),
-                'longitude': float(alert.longitude),
-                'accuracy': alert.location_accuracy,
-                'address': alert.address,
-                'created_at': alert.created_at.isoformat(),
-                'updated_at': alert.updated_at.isoformat(),
-                'assigned_operator': alert.assigned_operator.username if alert.assigned_operator else None,
-                'duration_seconds': (timezone.now() - alert.created_at).total_seconds()
-            }
-            alerts_data.append(alert_data)
+        # Zoomed out: grid clusters instead of individual alerts
+        if is_clustered(zoom):
+            return Response({
+                'success': True,
+                'clustered': True,
+                **get_map_clusters(zoom, area)
+            })
+        
+        alerts_data = get_map_alerts(area)
         
         return Response({
             'success': True,
+            'clustered': False,
             'alerts': alerts_data,
             'count': len(alerts_data)
         })
@@ -627,6 +658,7 @@ def get_alerts_for_map(request):
 @permission_classes([permissions.IsAuthenticated])
 def create_panic_alert(request):
     """Create a new panic alert from mobile app"""
+    started = time.monotonic()
     try:
         # Get location data
         latitude = request.data.get('latitude')
@@ -637,24 +669,8 @@ def create_panic_alert(request):
                 'error': 'Location data (latitude and longitude) is required'
             }, status=status.HTTP_400_BAD_REQUEST)
         
-        # Create panic alert
-        alert = PanicAlert.objects.create(
-            user=request.user,
-            alert_type=request.data.get('alert_type', 'panic_button'),
-            priority=request.data.get('priority', 4),
-            latitude=latitude,
-            longitude=longitude,
-            location_accuracy=request.data.get('accuracy', 0),
-            address=request.data.get('address', ''),
-            description=request.data.get('description', ''),
-            is_silent=request.data.get('is_silent', False),
-            device_info=request.data.get('device_info', {}),
-            network_info=request.data.get('network_info', {})
-        )
-        
-        # Create initial location record
-        AlertLocation.objects.create(
-            alert=alert,
+        # Initial location record
+        initial_location = AlertLocation(
             latitude=latitude,
             longitude=longitude,
             accuracy=request.data.get('accuracy', 0),
@@ -665,26 +681,54 @@ def create_panic_alert(request):
             battery_level=request.data.get('battery_level')
         )
         
-        # Log activity
-        UserActivity.objects.create(
-            user=request.user,
-            activity_type='panic_alert',
-            description=f'Panic alert created: {alert.get_alert_type_display()}',
-            ip_address=get_client_ip(request),
-            user_agent=request.META.get('HTTP_USER_AGENT', '')
-        )
+        # Alert and first fix in one transaction; the counters already account
+        # for the fix so the alert needs no follow-up UPDATE
+        with transaction.atomic():
+            alert = PanicAlert.objects.create(
+                user=request.user,
+                alert_type=request.data.get('alert_type', 'panic_button'),
+                priority=request.data.get('priority', 4),
+                latitude=latitude,
+                longitude=longitude,
+                location_accuracy=request.data.get('accuracy', 0),
+                address=request.data.get('address', ''),
+                description=request.data.get('description', ''),
+                is_silent=request.data.get('is_silent', False),
+                device_info=request.data.get('device_info', {}),
+                network_info=request.data.get('network_info', {}),
+                location_count=1,
+                last_location_at=initial_location.timestamp,
+                last_seen_at=initial_location.timestamp
+            )
+            initial_location.alert = alert
+            initial_location.save()
+            
+            # Log activity
+            log_activity(
+                user=request.user,
+                activity_type='panic_alert',
+                description=f'Panic alert created: {alert.get_alert_type_display()}',
+                ip_address=get_client_ip(request),
+                user_agent=request.META.get('HTTP_USER_AGENT', '')
+            )
+            
+            # Broadcast new alert to admin consoles, the user and maps once it is committed
+            alert_data = PanicAlertListSerializer(alert).data
+            transaction.on_commit(lambda: publish(
+                alert_event_messages('created', alert), metric='panic_create_broadcast'
+            ))
         
-        # Broadcast new alert to admin dashboard via WebSocket
-        alert_data = PanicAlertListSerializer(alert).data
-        broadcast_new_panic_alert(alert_data)
-        broadcast_map_alert_update(alert_data)
+        elapsed = time.monotonic() - started
+        latency.record('panic_create', elapsed)
         
-        return Response({
+        response = Response({
             'success': True,
             'alert_id': str(alert.id),
             'message': 'Panic alert created successfully',
             'alert': alert_data
         }, status=status.HTTP_201_CREATED)
+        response['Server-Timing'] = f'create;dur={elapsed * 1000:.1f}'
+        return response
         
     except Exception as e:
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -710,7 +754,7 @@ def acknowledge_alert(request, alert_id):
         alert.acknowledge(request.user)
         
         # Log activity
-        UserActivity.objects.create(
+        log_activity(
             user=request.user,
             activity_type='panic_alert',
             description=f'Panic alert acknowledged: {alert.id}',
@@ -718,7 +762,8 @@ def acknowledge_alert(request, alert_id):
             user_agent=request.META.get('HTTP_USER_AGENT', '')
         )
         
-        # TODO: Send real-time update to admin panel and mobile app
+        # Broadcast to admin consoles, alert watchers, the user and maps
+        publish(alert_event_messages('acknowledged', alert, request.user.username))
         
         return Response({
             'success': True,
@@ -748,7 +793,7 @@ def resolve_alert(request, alert_id):
         alert.resolve(resolution_notes)
         
         # Log activity
-        UserActivity.objects.create(
+        log_activity(
             user=request.user,
             activity_type='panic_alert',
             description=f'Panic alert resolved: {alert.id}',
@@ -756,7 +801,8 @@ def resolve_alert(request, alert_id):
             user_agent=request.META.get('HTTP_USER_AGENT', '')
         )
         
-        # TODO: Send real-time update to admin panel and mobile app
+        # Broadcast to admin consoles, alert watchers, the user and maps
+        publish(alert_event_messages('resolved', alert, request.user.username))
         
         return Response({
             'success': True,
@@ -789,7 +835,7 @@ def cancel_alert(request, alert_id):
         alert.cancel()
         
         # Log activity
-        UserActivity.objects.create(
+        log_activity(
             user=request.user,
             activity_type='panic_alert',
             description=f'Panic alert cancelled: {alert.id}',
@@ -797,7 +843,8 @@ def cancel_alert(request, alert_id):
             user_agent=request.META.get('HTTP_USER_AGENT', '')
         )
         
-        # TODO: Send real-time update to admin panel
+        # Broadcast to admin consoles, alert watchers, the user and maps
+        publish(alert_event_messages('cancelled', alert))
         
         return Response({
             'success': True,
@@ -827,17 +874,20 @@ def update_alert_location(request, alert_id):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        serializer = AlertLocationCreateSerializer(data=request.data)
+        serializer = AlertLocationCreateSerializer(data=request.data, context={'alert': alert})
         if serializer.is_valid():
-            location = serializer.save(alert=alert)
-            
-            # Update the main alert's location
-            alert.latitude = location.latitude
-            alert.longitude = location.longitude
-            alert.location_accuracy = location.accuracy
-            alert.save(update_fields=['latitude', 'longitude', 'location_accuracy', 'updated_at'])
-            
-            # TODO: Send real-time location update to admin panel
+            # Store the fix and update the main alert's location
+            previous_position = alert.location_coords
+            locations = record_locations(alert, [serializer.validated_data])
+            if not locations:
+                # Filtered as a repeat of the previous fix; only last seen was refreshed
+                return Response({
+                    'success': True,
+                    'suppressed': True,
+                    'message': 'Location unchanged'
+                })
+            location = locations[0]
+            publish(location_messages(alert.id, location, previous_position), key=f'location_{alert.id}')
             
             return Response({
                 'success': True,
@@ -849,6 +899,63 @@ def update_alert_location(request, alert_id):
     except Exception as e:
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def update_alert_location_batch(request, alert_id):
+    """Store a batch of buffered location fixes for an active panic alert"""
+    try:
+        alert = get_object_or_404(PanicAlert, id=alert_id)
+
+        # Check permissions
+        if alert.user != request.user:
+            return Response(
+                {'error': 'You can only update your own alerts'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        if not alert.is_active:
+            return Response(
+                {'error': 'Cannot update location for inactive alerts'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        # Accept either a bare array or {"locations": [...]}, oldest fix first
+        locations_data = request.data
+        if isinstance(locations_data, dict):
+            locations_data = locations_data.get('locations')
+
+        if not isinstance(locations_data, list) or not locations_data:
+            return Response(
+                {'error': 'A non-empty list of locations is required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        max_batch_size = settings.LOCATION_BATCH_MAX_SIZE
+        if len(locations_data) > max_batch_size:
+            return Response(
+                {'error': f'A batch can contain at most {max_batch_size} locations'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        serializer = AlertLocationCreateSerializer(data=locations_data, many=True, context={'alert': alert})
+        if serializer.is_valid():
+            previous_position = alert.location_coords
+            locations = record_locations(alert, serializer.validated_data)
+            if locations:
+                publish(location_messages(alert.id, locations[-1], previous_position), key=f'location_{alert.id}')
+
+            return Response({
+                'success': True,
+                'message': 'Locations updated successfully',
+                'count': len(locations),
+                'suppressed': len(locations_data) - len(locations),
+                'location': AlertLocationSerializer(locations[-1]).data if locations else None
+            })
+        else:
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
 def get_client_ip(request):
     """Helper function to get client IP address"""
     x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
@@ -158,7 +158,7 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # REST Framework Configuration
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'beacon_auth.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
@@ -185,6 +185,74 @@ SIMPLE_JWT = {
     'TOKEN_TYPE_CLAIM': 'token_type',
 }
 
+# Token -> user cache (in CACHES) shared by REST and WebSocket authentication;
+# entries also end when their token expires or their user is saved or deleted
+JWT_USER_CACHE_SECONDS = float(os.getenv('JWT_USER_CACHE_SECONDS', '300'))
+
+# ======================== LOCATION TRACKING CONFIGURATION ========================
+
+# Maximum number of buffered fixes accepted by the batch location endpoint
+LOCATION_BATCH_MAX_SIZE = int(os.getenv('LOCATION_BATCH_MAX_SIZE', '500'))
+
+# Write-behind mode for the location WebSocket: fixes are broadcast immediately
+# and written to the database in bulk once enough are buffered or time runs out
+LOCATION_WRITE_BEHIND = os.getenv('LOCATION_WRITE_BEHIND', 'False').lower() == 'true'
+LOCATION_WRITE_BEHIND_MAX_FIXES = int(os.getenv('LOCATION_WRITE_BEHIND_MAX_FIXES', '50'))
+LOCATION_WRITE_BEHIND_FLUSH_SECONDS = float(os.getenv('LOCATION_WRITE_BEHIND_FLUSH_SECONDS', '5'))
+
+# Ingest filter: drop fixes that stay within max(MIN_DISTANCE, ACCURACY_FACTOR x
+# GPS accuracy) metres of the previous stored fix, but always store at least one
+# fix per MAX_INTERVAL_SECONDS. Dropped fixes still refresh the alert's last seen time.
+LOCATION_INGEST_FILTER = os.getenv('LOCATION_INGEST_FILTER', 'False').lower() == 'true'
+LOCATION_FILTER_MIN_DISTANCE = float(os.getenv('LOCATION_FILTER_MIN_DISTANCE', '10'))
+LOCATION_FILTER_ACCURACY_FACTOR = float(os.getenv('LOCATION_FILTER_ACCURACY_FACTOR', '1.0'))
+LOCATION_FILTER_MAX_INTERVAL_SECONDS = float(os.getenv('LOCATION_FILTER_MAX_INTERVAL_SECONDS', '60'))
+LOCATION_FILTER_LAST_SEEN_SECONDS = float(os.getenv('LOCATION_FILTER_LAST_SEEN_SECONDS', '15'))
+
+# Default point budget for ?simplify=true on the alert location list
+TRACK_SIMPLIFY_MAX_POINTS = int(os.getenv('TRACK_SIMPLIFY_MAX_POINTS', '300'))
+
+# Map clustering: map queries with a ?zoom= below MAP_CLUSTER_MAX_ZOOM return
+# geohash grid clusters instead of individual alerts. Clustered map sockets
+# recompute their clusters at most once per MAP_CLUSTER_REFRESH_SECONDS.
+MAP_CLUSTER_MAX_ZOOM = float(os.getenv('MAP_CLUSTER_MAX_ZOOM', '12'))
+MAP_CLUSTER_REFRESH_SECONDS = float(os.getenv('MAP_CLUSTER_REFRESH_SECONDS', '2'))
+
+# Map viewports: sockets that subscribe a viewport join one group per geohash
+# cell of this precision (4 is roughly 40 x 20 km) instead of the global map
+# group; viewports needing more than MAP_VIEWPORT_MAX_CELLS cells stay global
+MAP_VIEWPORT_CELL_PRECISION = int(os.getenv('MAP_VIEWPORT_CELL_PRECISION', '4'))
+MAP_VIEWPORT_MAX_CELLS = int(os.getenv('MAP_VIEWPORT_MAX_CELLS', '64'))
+
+# Map resync: a delta-stream client resyncing from a version older than
+# MAP_RESYNC_WINDOW_SECONDS gets a fresh snapshot instead of the changes since
+MAP_RESYNC_WINDOW_SECONDS = float(os.getenv('MAP_RESYNC_WINDOW_SECONDS', '600'))
+
+# Live dashboard counters: dashboard sockets get at most one stats_updated frame
+# per DEBOUNCE_SECONDS; each process reloads its in-memory snapshot from the
+# database every RESYNC_SECONDS to bound drift from bulk updates
+DASHBOARD_STATS_DEBOUNCE_SECONDS = float(os.getenv('DASHBOARD_STATS_DEBOUNCE_SECONDS', '1'))
+DASHBOARD_STATS_RESYNC_SECONDS = float(os.getenv('DASHBOARD_STATS_RESYNC_SECONDS', '300'))
+
+# Each server process sends operator consoles (ws/alerts/) at most one location_batch
+# per TICK_SECONDS holding the newest fix of each alert that moved; alert lifecycle
+# events are never held back. 0 forwards every fix as it arrives.
+ADMIN_LOCATION_TICK_SECONDS = float(os.getenv('ADMIN_LOCATION_TICK_SECONDS', '0.5'))
+
+# ======================== AUDIT LOG CONFIGURATION ========================
+
+# UserActivity records are queued and written in batches by a background thread;
+# AUDIT_LOG_ASYNC=False writes each one inside the request instead
+AUDIT_LOG_ASYNC = os.getenv('AUDIT_LOG_ASYNC', 'True').lower() == 'true'
+AUDIT_LOG_QUEUE_SIZE = int(os.getenv('AUDIT_LOG_QUEUE_SIZE', '10000'))
+AUDIT_LOG_BATCH_SIZE = int(os.getenv('AUDIT_LOG_BATCH_SIZE', '200'))
+AUDIT_LOG_FLUSH_SECONDS = float(os.getenv('AUDIT_LOG_FLUSH_SECONDS', '1'))
+
+# ======================== METRICS CONFIGURATION ========================
+
+# Latency samples kept per metric for the p50/p90/p99 in GET api/auth/metrics/latency/
+LATENCY_SAMPLE_SIZE = int(os.getenv('LATENCY_SAMPLE_SIZE', '1024'))
+
 # CORS Settings
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",
@@ -296,6 +364,18 @@ if logs_dir.exists() and os.access(logs_dir, os.W_OK):
     LOGGING['root']['handlers'].append('file')
     LOGGING['loggers']['django']['handlers'].append('file')
 
+# ======================== CACHE CONFIGURATION ========================
+
+# Shared by all server processes when Redis is available (e.g. for the token
+# user cache and map revisions); per-process memory otherwise
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+
 # ======================== CHANNELS CONFIGURATION ========================
 
 # Channel Layer Configuration for WebSockets
@@ -320,6 +400,17 @@ if DEBUG and not os.getenv('REDIS_URL'):
 WEBSOCKET_URL = '/ws/'
 WEBSOCKET_ACCEPT_ALL = DEBUG  # Allow all connections in debug mode
 
+# Alert owner/status cache for alert-scoped socket access checks
+ALERT_ACCESS_CACHE_SECONDS = float(os.getenv('ALERT_ACCESS_CACHE_SECONDS', '30'))
+ALERT_ACCESS_CACHE_MAX_ENTRIES = int(os.getenv('ALERT_ACCESS_CACHE_MAX_ENTRIES', '10000'))
+
+# Broadcasts from request handlers are queued and sent by a background event loop:
+# at most QUEUE_SIZE pending (oldest dropped beyond that), BATCH_SIZE taken at a
+# time and sent to their groups concurrently, each send abandoned after SEND_TIMEOUT seconds
+BROADCAST_QUEUE_SIZE = int(os.getenv('BROADCAST_QUEUE_SIZE', '10000'))
+BROADCAST_BATCH_SIZE = int(os.getenv('BROADCAST_BATCH_SIZE', '100'))
+BROADCAST_SEND_TIMEOUT = float(os.getenv('BROADCAST_SEND_TIMEOUT', '2'))
+
 # WebSocket Origins (for CORS)
 WEBSOCKET_ALLOWED_ORIGINS = [
     'http://localhost:3000',
@@ -37,6 +37,7 @@ def companion_status(request):
             'panic_create': '/api/auth/panic/create/',
             'alerts': '/api/auth/alerts/',
             'alert_location': '/api/auth/alerts/{alert_id}/location/',
+            'alert_location_batch': '/api/auth/alerts/{alert_id}/location/batch/',
             'websockets': {
                 'alerts': '/ws/alerts/',
                 'user': '/ws/user/{user_id}/',